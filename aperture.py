@@ -1,90 +1,535 @@
-from math import sqrt
+# Aperture can be run from the command line or imported, in which case design() is the entry point
+# importing is kept cheap: nothing here imports numpy, and the command line modules are imported when used
+
+from math import isfinite, sqrt
+import itertools
+import os
 import sys
 import json
 
 import em_calcs
+import profiling
+from profiling import stage
 
 from plot import *
 
+__version__ = "1.1.0"
+
 spec = {}
 
+# raised for specifications that are missing parameters or cannot be read
+class SpecificationError(ValueError):
+    pass
+
+# reports an error on the command line and exits, only used when run as a script
 def critical_error(desc):
     print("\n***** Critical Error *****")
     print("Error description: ", desc)
     print("Exiting program...")
-    quit()
+    sys.exit(1)
 
-# reads file specified in command line argument
-def read_specification_file():
-    if len(sys.argv) < 2:
-        critical_error("No specification file provided")
-        return 0
-    
-    filename = sys.argv[1]
+# checks each required parameter is present in a specification
+def check_specification(data):
+    required_parameters = ["frequency", "body_radius", "dielectric_thickness", "dielectric_constant", "copper_thickness", "polarisation", "patch_count"]
+    for param in required_parameters:
+        if param not in data:
+            raise SpecificationError("Required parameter \"" + param + "\" missing in specification file")
 
+# reads and checks a specification file
+def read_specification_file(filename):
     try:
         specification_file = open(filename)
     except IOError:
-        critical_error("Specification file not found")
-        return 0
+        raise SpecificationError("Specification file not found")
 
     try:
-        data = json.load(specification_file)
+        with specification_file:
+            data = json.load(specification_file)
     except json.decoder.JSONDecodeError:
-        critical_error("Specification file is not valid JSON")
-        return 0
-
-    # check each parameter is present
-    required_parameters = ["frequency", "body_radius", "dielectric_thickness", "dielectric_constant", "copper_thickness", "polarisation", "patch_count"]
-    for param in required_parameters:
-        if param not in data:
-            critical_error("Required parameter \"" + param + "\" missing in specification file")
-            return 0
+        raise SpecificationError("Specification file is not valid JSON")
 
+    check_specification(data)
     return data
 
 
-if __name__ == "__main__":
+# names of the values returned by calculate_parameters
+parameter_names = ["width_50", "width_100", "wavelength", "patch_width", "patch_length", "patch_impedance", "patch_match_length", "patch_match_width", "inset_distance", "splitter_match_width", "splitter_match_length"]
+
+# calculates the parameters of the design that are reported to the user
+# returns a dictionary of named values, in the order they are printed
+def calculate_parameters(spec):
+    if spec["polarisation"] != "axial":
+        patch_dimensions = em_calcs.square_patch(spec)
+    else:
+        patch_dimensions = em_calcs.microstrip_patch(spec)
+    patch_impedance = em_calcs.microstrip_patch_impedance(spec, patch_dimensions[0])
+
+    patch_match_width = em_calcs.microstrip_width(sqrt(patch_impedance*50), spec)
+    splitter_match_width = em_calcs.microstrip_width(sqrt(100*50), spec)
+
+    return {
+        "width_50": em_calcs.microstrip_width(50, spec),
+        "width_100": em_calcs.microstrip_width(100, spec),
+        "wavelength": em_calcs.wavelength(spec),
+        "patch_width": patch_dimensions[0],
+        "patch_length": patch_dimensions[1],
+        "patch_impedance": patch_impedance,
+        "patch_match_length": em_calcs.effective_wavelength(patch_match_width, spec)/4,
+        "patch_match_width": patch_match_width,
+        "inset_distance": em_calcs.inset_distance(spec, 50),
+        "splitter_match_width": splitter_match_width,
+        "splitter_match_length": em_calcs.effective_wavelength(splitter_match_width, spec)/4,
+    }
+
+# the result of designing an array from a specification
+# holds the calculated parameters, the component tree and the points of the copper outline
+# tuned holds the result of tuning the patch, if it was tuned (see tuning.py)
+class Design:
+    def __init__(self, spec, parameters, tree, points, tuned=None):
+        self.spec = spec
+        self.parameters = parameters
+        self.tree = tree
+        self.points = points
+        self.tuned = tuned
+
+    # instanced writes repeated patches and groups once and places them, see generate_instanced_file
+    def write_kicad(self, destination, instanced=False):
+        with stage("write_kicad"):
+            if instanced:
+                generate_instanced_file(self.spec, self.tree, destination)
+            else:
+                generate_file(self.spec, self.points, destination)
 
+    # instanced writes repeated patches and groups as blocks, see generate_instanced_dxf
+    # entity is "line" or "lwpolyline" and binary writes binary DXF, see generate_dxf
+    def write_dxf(self, destination, instanced=False, entity="line", binary=False):
+        with stage("write_dxf"):
+            if instanced:
+                generate_instanced_dxf(self.spec, self.tree, destination, entity, binary)
+            else:
+                generate_dxf(self.spec, self.points, destination, entity, binary)
 
-    spec = read_specification_file()
+    # writes the design wrapped around the body as STL meshes, see conform.py
+    def write_mesh(self, base, npz=False):
+        import conform
+        with stage("write_mesh"):
+            return conform.generate_mesh(self.spec, self.points, base, npz)
 
+    # writes the Gerber and drill files a board house makes the board from next to base, returns their paths
+    # antipad is the diameter of ground plane cleared around the feed pin, see gerber.py
+    def write_gerbers(self, base, antipad=None):
+        import gerber
+        with stage("write_gerber"):
+            return gerber.generate_gerbers(self.spec, self.tree, self.points, base, antipad)
 
+    # estimates the gain pattern of the array around the body, see far_field.py
+    def far_field(self, theta_step=1, phi_step=1):
+        import far_field
+        with stage("far_field"):
+            return far_field.far_field(self.spec, self.tree, theta_step, phi_step)
+
+    # checks the copper against design rules, returns the list of violations, see drc.py
+    def check(self, min_width=None, min_clearance=None):
+        import drc
+        with stage("drc"):
+            return drc.check(self.spec, self.tree,
+                drc.default_min_width if min_width is None else min_width,
+                drc.default_min_clearance if min_clearance is None else min_clearance)
+
+    # solves the feed network over frequency, by default 10% either side of the spec frequency, see circuit.py
+    def circuit(self, frequencies=None):
+        import circuit
+        with stage("circuit"):
+            return circuit.circuit(self.spec, self.tree, frequencies)
+
+    # samples the design built on boards varying within tolerances, see tolerance.py
+    def tolerance(self, draws=100000, tolerances=None, distribution="normal", workers=None):
+        import tolerance
+        tolerance.check_draws(draws)
+        with stage("tolerance"):
+            return tolerance.tolerance_analysis(self.spec, self.parameters, draws, tolerances, distribution, workers=workers)
+
+# designs the antenna array for a specification, without printing anything or writing any files
+# if tune is set, the patch length and inset are first tuned to resonate at the frequency with a 50 ohm match,
+# replacing any overrides in the specification
+# raises SpecificationError or ValueError if the specification cannot be designed
+def design(spec, tune=False):
+    with stage("check_specification"):
+        check_specification(spec)
+
+    tuned = None
+    if tune:
+        import tuning
+        with stage("tune"):
+            tuned = tuning.tune_patch(spec)
+        spec = dict(spec)
+        spec.update(tuned.overrides(spec))
+
+    with stage("calculate_parameters"):
+        parameters = calculate_parameters(spec)
+
+    # the actual synthesis of the antenna (see plot.py)
+    with stage("construct_array"):
+        tree = construct_array(spec)
+    with stage("plot"):
+        points = tree.plot([0, 0])
+
+    return Design(spec, parameters, tree, points, tuned)
+
+def print_tuning(tuned):
+    print("\nTuned patch:")
+    print("patch_length: ", tuned.length)
+    print("inset_distance: ", tuned.inset)
+    print("Predicted resonant frequency: ", tuned.resonant_frequency)
+    print("Predicted input impedance: ", tuned.impedance)
+
+def print_parameters(spec, parameters):
     print("\nOverridden parameters:")
     if "patch_length" in spec:
         print("patch_length: ", spec["patch_length"])
     if "inset_distance" in spec:
         print("inset_distance: ", spec["inset_distance"])
 
-
     print("\nCalculated Parameters:")
-    if spec["polarisation"] != "axial":
-        patch_dimensions = em_calcs.square_patch(spec)
-    else:
-        patch_dimensions = em_calcs.microstrip_patch(spec)
-    patch_impedance = em_calcs.microstrip_patch_impedance(spec, patch_dimensions[0])
-    print("50 ohm width: ",em_calcs.microstrip_width(50, spec))
-    print("100 ohm width: ",em_calcs.microstrip_width(100, spec))
-    print("wavelength: ", em_calcs.wavelength(spec))
-    print("Patch dimensions [width, length]: ",patch_dimensions)
-    print("Patch input impedance: ", patch_impedance)
-    
+    print("50 ohm width: ", parameters["width_50"])
+    print("100 ohm width: ", parameters["width_100"])
+    print("wavelength: ", parameters["wavelength"])
+    print("Patch dimensions [width, length]: ", [parameters["patch_width"], parameters["patch_length"]])
+    print("Patch input impedance: ", parameters["patch_impedance"])
+
     print("\nFor patch impedance matching:")
-    match_width = em_calcs.microstrip_width(sqrt(patch_impedance*50), spec)
-    print("Quarter wave match length: ",em_calcs.effective_wavelength(match_width, spec)/4)
-    print("Quarter wave 50 Ohm match width: ", match_width)
-    print("50 Ohm patch inset distance: ", em_calcs.inset_distance(spec, 50))
+    print("Quarter wave match length: ", parameters["patch_match_length"])
+    print("Quarter wave 50 Ohm match width: ", parameters["patch_match_width"])
+    print("50 Ohm patch inset distance: ", parameters["inset_distance"])
 
     print("\nFor power splitter:")
-    match_width = em_calcs.microstrip_width(sqrt(100*50), spec)
-    print("100 to 50 Ohm match width: ", match_width)
-    print("Quarter wave match length: ", em_calcs.effective_wavelength(match_width, spec)/4)
-    
-    # the actual synthesis of the antenna (see plot.py)
-    tree = construct_array(spec)
-    points = tree.plot([0, 0])
+    print("100 to 50 Ohm match width: ", parameters["splitter_match_width"])
+    print("Quarter wave match length: ", parameters["splitter_match_length"])
+
+# prints design rule violations, the first few of each rule in full
+def print_violations(violations, shown=5):
+    if not violations:
+        print("No violations")
+        return
+    printed = {}
+    for item in violations:
+        printed[item["rule"]] = printed.get(item["rule"], 0) + 1
+        if printed[item["rule"]] <= shown:
+            location = "[" + str(round(item["location"][0], 3)) + ", " + str(round(item["location"][1], 3)) + "]"
+            value = "" if item["rule"] == "self_intersection" else ", " + str(round(item["value"], 4)) + " mm (limit " + str(item["limit"]) + " mm)"
+            print(item["rule"] + " at " + location + value + ": " + ", ".join(item["components"]))
+    for rule in printed:
+        if printed[rule] > shown:
+            print("... and " + str(printed[rule] - shown) + " more " + rule)
+    print(str(len(violations)) + " violations")
+
+# prints the response of the feed network at the spec frequency, frequencies in MHz
+def print_circuit(summary):
+    resistance, reactance = summary["input_impedance"]
+    print("Input S11: " + str(round(summary["s11_db"], 2)) + " dB, impedance " + str(round(resistance, 2)) + (" - " if reactance < 0 else " + ") + str(round(abs(reactance), 2)) + "j ohm")
+    print("Best match: " + str(round(summary["best_match_s11_db"], 2)) + " dB at " + str(round(summary["best_match_frequency"]*1e-6, 3)) + " MHz")
+    if summary["bandwidth"] == summary["bandwidth"]:
+        print("-10 dB bandwidth: " + str(round(summary["bandwidth_lower"]*1e-6, 3)) + " to " + str(round(summary["bandwidth_upper"]*1e-6, 3)) + " MHz (" + str(round(summary["bandwidth"]*1e-6, 3)) + " MHz)")
+    else:
+        print("-10 dB bandwidth: none, the match never reaches -10 dB")
+    print("Power delivered to the patches: " + str(round(100*summary["delivered"], 1)) + "%")
+    print("Patch power (dB): " + str([round(value, 2) for value in summary["port_power_db"]]))
+    print("Patch phase (deg): " + str([round(value, 1) for value in summary["port_phase"]]))
+
+# prints the spread of each metric of a tolerance analysis, frequencies in MHz
+def print_tolerance(statistics):
+    import tolerance
+    for name in statistics:
+        unit = tolerance.metrics[name]
+        scale = 1e-6 if unit == "Hz" else 1
+        values = [round(statistics[name][key]*scale, 4) for key in ["mean", "std", "p1", "p99"]]
+        unit = "MHz" if unit == "Hz" else unit
+        print(name.replace("_", " ").capitalize() + ": " + str(values[0]) + " +/- " + str(values[1]) + " " + unit + ", " + str(values[2]) + " to " + str(values[3]))
+
+# looks line widths up in the substrate tables kept in directory, see substrate_tables.py
+# also run in each worker process of a pool, so the workers use the same tables as the process that started them
+def use_tables(directory):
+    if directory is not None or em_calcs.tables is not None:
+        import substrate_tables
+        substrate_tables.use(directory)
+
+# the directory of the substrate tables in use, None if widths are solved for
+def tables_directory():
+    return None if em_calcs.tables is None else em_calcs.tables.directory
+
+############################## parameter sweeps ##############################
+
+# expands a list or range given for a specification field into its values
+# ranges are {"start": a, "stop": b, "step": s} or {"start": a, "stop": b, "count": n}, both including stop
+# raises SpecificationError naming the field if the range is not one of these
+def sweep_values(name, value):
+    if isinstance(value, list):
+        return value
+    forms = "{\"start\": a, \"stop\": b, \"step\": s} or {\"start\": a, \"stop\": b, \"count\": n}"
+    keys = sorted(value)
+    if keys not in [["start", "step", "stop"], ["count", "start", "stop"]]:
+        raise SpecificationError("Sweep of \"" + name + "\" has keys " + ", ".join(keys) + ", it must be a list or " + forms)
+    for key in keys:
+        if isinstance(value[key], bool) or not isinstance(value[key], (int, float)) or not isfinite(value[key]):
+            raise SpecificationError("Sweep of \"" + name + "\" has a " + key + " that is not a number")
+    start, stop = value["start"], value["stop"]
+
+    if "count" in value:
+        count = value["count"]
+        if count != int(count) or count < 1:
+            raise SpecificationError("Sweep of \"" + name + "\" needs a whole number count of at least 1, not " + str(count))
+        if count == 1:
+            return [start]
+        step = (stop - start) / (count - 1)
+        return [start + i*step for i in range(int(count))]
+
+    step = value["step"]
+    if step == 0:
+        raise SpecificationError("Sweep of \"" + name + "\" has a step of zero")
+    count = int(round((stop - start) / step, 9)) + 1
+    if count < 1:
+        raise SpecificationError("Sweep of \"" + name + "\" steps away from its stop, the step must be " + ("negative" if stop < start else "positive"))
+    return [start + i*step for i in range(count)]
+
+# returns the names of the fields that are swept, those given as lists or ranges
+def sweep_fields(spec):
+    return [name for name in spec if isinstance(spec[name], (list, dict))]
+
+# expands a specification with swept fields into the cartesian grid of plain specifications
+def expand_sweep(spec):
+    fields = sweep_fields(spec)
+    axes = [sweep_values(name, spec[name]) for name in fields]
+    designs = []
+    for values in itertools.product(*axes):
+        point = dict(spec)
+        point.update(zip(fields, values))
+        designs.append(point)
+    return designs
+
+# names of the circuit model results added to a sweep summary with --circuit
+circuit_names = ["s11_db", "best_match_frequency", "bandwidth", "delivered", "power_imbalance_db", "phase_spread"]
+
+# designs one point of a sweep into its own directory, run in the worker processes
+# returns the row for the summary file, with the circuit model's results if circuit is set
+# and the number of design rule violations if drc is set, to [min_width, min_clearance]
+def sweep_point(index, spec, directory, name, tune=False, circuit=False, drc=None):
+    row = {"index": index}
+    row.update({field: spec[field] for field in spec})
+    try:
+        result = design(spec, tune)
+        row.update(result.parameters)
+        if circuit:
+            summary = result.circuit().summary()
+            row.update({key: summary[key] for key in circuit_names})
+        if drc is not None:
+            row["drc_violations"] = len(result.check(*drc))
+
+        design_directory = os.path.join(directory, "%04d" % index)
+        os.makedirs(design_directory, exist_ok=True)
+        with open(os.path.join(design_directory, name + ".json"), "w") as spec_file:
+            json.dump(spec, spec_file, indent=4)
+        result.write_kicad(os.path.join(design_directory, name + ".kicad_pcb"))
+        result.write_dxf(os.path.join(design_directory, name + ".dxf"))
+        row["error"] = ""
+    except (SpecificationError, ValueError, ArithmeticError) as e:
+        # SpecificationError and math domain errors are ValueErrors, division by zero and overflow ArithmeticErrors
+        row["error"] = str(e)
+    except (TypeError, KeyError) as e:
+        # a swept value of the wrong type, which the checks of the spec do not catch, is that point's error alone
+        row["error"] = type(e).__name__ + ": " + str(e)
+    return row
+
+# runs every point of a swept specification across a pool of worker processes
+# designs are written to numbered directories alongside a summary.csv of the calculated parameters
+def run_sweep(spec, directory, name, workers=None, tune=False, circuit=False, drc=None):
+    from concurrent.futures import ProcessPoolExecutor
+    import csv
+
+    designs = expand_sweep(spec)
+    os.makedirs(directory, exist_ok=True)
+
+    # the stages inside each design run in the worker processes and are not profiled
+    with stage("sweep"), ProcessPoolExecutor(max_workers=workers, initializer=use_tables, initargs=(tables_directory(),)) as pool:
+        futures = [pool.submit(sweep_point, i, design, directory, name, tune, circuit, drc) for i, design in enumerate(designs)]
+        rows = [future.result() for future in futures]
+
+    columns = ["index"] + list(spec) + parameter_names + (circuit_names if circuit else []) + (["drc_violations"] if drc is not None else []) + ["error"]
+    with open(os.path.join(directory, "summary.csv"), "w", newline="") as summary:
+        writer = csv.DictWriter(summary, fieldnames=columns, restval="")
+        writer.writeheader()
+        writer.writerows(rows)
+
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+    from contextlib import nullcontext
+
+    parser = argparse.ArgumentParser(description="Designs conformal patch antenna arrays from a JSON specification")
+    parser.add_argument("specification", nargs="*", help="path to the specification JSON file, or with --watch any number of them")
+    parser.add_argument("--watch", action="store_true", help="keep running and regenerate the outputs of the specifications whenever they or the template change")
+    parser.add_argument("--tune", action="store_true", help="tune the patch length and inset for resonance and a 50 ohm match before designing")
+    parser.add_argument("--instanced", action="store_true", help="write repeated patches and feed groups once, as DXF blocks and KiCAD footprints")
+    parser.add_argument("--dxf-entity", choices=dxf_entity_types, default="line", help="write the DXF outline as a LINE per edge or as one closed LWPOLYLINE (an R2000 DXF)")
+    parser.add_argument("--binary-dxf", action="store_true", help="write binary rather than text DXF")
+    parser.add_argument("--mesh", action="store_true", help="also write the design wrapped around the body as binary STL")
+    parser.add_argument("--npz", action="store_true", help="with --mesh, also write the meshes as a compressed .npz")
+    parser.add_argument("--gerber", action="store_true", help="also write Gerber files of the copper, a ground plane and the board edge, and an Excellon drill file of the feed pin")
+    parser.add_argument("--antipad", type=float, help="with --gerber, the diameter of ground plane cleared around the feed pin in mm (default: the hole and 0.5 mm around it)")
+    parser.add_argument("--far-field", action="store_true", help="also estimate the far-field gain pattern and report its coverage")
+    parser.add_argument("--drc", action="store_true", help="check the copper for self intersections, narrow copper and gaps and copper past the seam, exiting with an error if any are found (counted in the summary of sweeps)")
+    parser.add_argument("--min-width", type=float, default=0.15, help="with --drc, the narrowest copper allowed in mm")
+    parser.add_argument("--min-clearance", type=float, default=0.15, help="with --drc, the narrowest gap between copper allowed in mm")
+    parser.add_argument("--circuit", action="store_true", help="also solve a circuit model of the feed network over frequency and report its match, bandwidth and power split (added to the summary of sweeps)")
+    parser.add_argument("--tolerance", type=int, metavar="DRAWS", help="also run a Monte Carlo tolerance analysis of this many boards and report the spread of the design")
+    parser.add_argument("--dk-tolerance", type=float, default=0.02, help="with --tolerance, the limit of the dielectric constant variation")
+    parser.add_argument("--thickness-tolerance", type=float, default=0.0254, help="with --tolerance, the limit of the dielectric thickness variation in mm")
+    parser.add_argument("--etch-tolerance", type=float, default=0.025, help="with --tolerance, the limit of the change in copper width from etching in mm")
+    parser.add_argument("--uniform", action="store_true", help="with --tolerance, draw variations uniformly within the limits rather than taking the limits as 3 sigma of a normal distribution")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes for parameter sweeps (default: one per CPU) and tolerance analysis (default: none)")
+    parser.add_argument("--profile", metavar="FILE", help="record the time, memory and microstrip_width work of each stage to a JSON file")
+    parser.add_argument("--profile-format", choices=["json", "chrome"], default="json", help="write the --profile file as a plain JSON trace or in Chrome trace format")
+    parser.add_argument("--cprofile", metavar="FILE", help="also run the python profiler and dump its statistics to a file")
+    parser.add_argument("--tables", default=os.environ.get("APERTURE_TABLES_DIR"), help="directory of substrate tables to look line widths up in rather than solving for them, built there as needed (default: $APERTURE_TABLES_DIR, none if unset)")
+    parser.add_argument("--no-cache", action="store_true", help="regenerate the outputs even if nothing has changed since they were written")
+    parser.add_argument("--cache-dir", default=os.environ.get("APERTURE_CACHE_DIR"), help="shared directory of cached outputs (default: $APERTURE_CACHE_DIR, none if unset)")
+    parser.add_argument("--cache-size", type=float, default=256, help="size limit of the shared cache directory in MB, least recently used outputs are removed beyond it")
+    args = parser.parse_args()
+
+    if not args.specification:
+        critical_error("No specification file provided")
+
+    if args.tables:
+        use_tables(args.tables)
+
+    if args.watch:
+        import watch
+        watch.watch(args.specification, args.tune, args.instanced, args.dxf_entity, args.binary_dxf)
+        sys.exit(0)
+
+    if len(args.specification) > 1:
+        critical_error("Only one specification file can be designed at a time, except with --watch")
+
+    if args.tolerance is not None and args.tolerance < 1:
+        critical_error("--tolerance needs at least 1 board, not " + str(args.tolerance))
+
+    profiling_on = args.profile is not None or args.cprofile is not None
+    violations = []
+    session = profiling.profile(cprofile=args.cprofile is not None) if profiling_on else nullcontext()
+    with session as profiler:
+        filename = args.specification[0]
+        try:
+            with stage("read_specification"):
+                spec = read_specification_file(filename)
+        except SpecificationError as e:
+            critical_error(str(e))
+
+        if sweep_fields(spec):
+            directory = filename.replace(".json", "") + "_sweep"
+            name = os.path.basename(filename).replace(".json", "")
+            try:
+                drc = [args.min_width, args.min_clearance] if args.drc else None
+                rows = run_sweep(spec, directory, name, args.workers, args.tune, args.circuit, drc)
+            except SpecificationError as e:
+                critical_error(str(e))
+            failed = [row for row in rows if row["error"]]
+            print("\nSwept " + str(len(rows)) + " designs, " + str(len(failed)) + " failed")
+            print("Output files generated in " + directory + ", summary at " + os.path.join(directory, "summary.csv"))
+
+        else:
+            outputs = {"kicad_pcb": filename.replace("json", "kicad_pcb"), "dxf": filename.replace("json", "dxf")}
+
+            # the cache only covers the KiCAD and DXF files, so runs asking for anything more design from scratch
+            use_cache = not (args.no_cache or args.mesh or args.gerber or args.far_field or args.drc or args.circuit or args.tolerance or profiling_on)
+            if use_cache:
+                import cache
+                options = {"tune": args.tune, "instanced": args.instanced, "dxf_entity": args.dxf_entity, "binary_dxf": args.binary_dxf}
+                # looked up widths differ from solved ones in the last digits
+                if args.tables:
+                    options["tables"] = True
+                digest = cache.output_hash(spec, __version__, options)
+                stamp = cache.stamp_path(filename)
+                shared = cache.OutputCache(args.cache_dir, int(args.cache_size*1024*1024)) if args.cache_dir else None
+
+            if use_cache and cache.up_to_date(stamp, digest, outputs):
+                print("Output files at " + outputs["kicad_pcb"] + ", " + outputs["dxf"] + " are up to date")
+
+            elif use_cache and shared is not None and shared.fetch(digest, outputs):
+                cache.write_stamp(stamp, digest, outputs)
+                print("Output files restored from cache to " + outputs["kicad_pcb"] + ", " + outputs["dxf"])
+
+            else:
+                # a stamp left from before would describe half written files if this run fails
+                if use_cache and os.path.exists(stamp):
+                    os.remove(stamp)
+                try:
+                    result = design(spec, args.tune)
+                except ValueError as e:
+                    critical_error(str(e))
+                if result.tuned is not None:
+                    print_tuning(result.tuned)
+                print_parameters(result.spec, result.parameters)
+
+                print("\nFinished")
+                print("Sheet size [width, height]: ", sheet_size(spec, result.points))
+                result.write_kicad(outputs["kicad_pcb"], args.instanced)
+                result.write_dxf(outputs["dxf"], args.instanced, args.dxf_entity, args.binary_dxf)
+                print("Output files generated at " + outputs["kicad_pcb"] + ", " + outputs["dxf"])
+                if use_cache:
+                    cache.write_stamp(stamp, digest, outputs)
+                    if shared is not None:
+                        shared.store(digest, outputs)
+
+                if args.mesh:
+                    paths = result.write_mesh(filename.replace(".json", ""), args.npz)
+                    print("Conformed mesh generated at " + ", ".join(paths))
+
+                if args.gerber:
+                    paths = result.write_gerbers(filename.replace(".json", ""), args.antipad)
+                    print("Gerber and drill files generated at " + ", ".join(paths))
+
+                if args.far_field:
+                    summary = result.far_field().summary()
+                    print("\nFar-field estimate:")
+                    print("Peak gain: " + str(round(summary["peak_gain"], 2)) + " dBi")
+                    print("Roll plane gain: " + str(round(summary["roll_plane_min"], 2)) + " to " + str(round(summary["roll_plane_max"], 2)) + " dBi, ripple " + str(round(summary["roll_plane_ripple"], 2)) + " dB")
+                    print("Roll plane nulls (deg): " + str([round(angle, 1) for angle in summary["nulls"]]))
+                    if spec["polarisation"] != "axial":
+                        print("Roll plane axial ratio: " + str(round(summary["roll_plane_axial_ratio_min"], 2)) + " to " + str(round(summary["roll_plane_axial_ratio_max"], 2)) + " dB")
+                    print("Coverage above -10 dBi: " + str(round(100*summary["coverage"], 1)) + "%")
+
+                if args.drc:
+                    violations = result.check(args.min_width, args.min_clearance)
+                    print("\nDesign rule check:")
+                    print_violations(violations)
+
+                if args.circuit:
+                    summary = result.circuit().summary()
+                    print("\nCircuit model of the feed network:")
+                    print_circuit(summary)
+
+                if args.tolerance:
+                    tolerances = {"dielectric_constant": args.dk_tolerance, "dielectric_thickness": args.thickness_tolerance, "etch": args.etch_tolerance}
+                    distribution = "uniform" if args.uniform else "normal"
+                    statistics = result.tolerance(args.tolerance, tolerances, distribution, args.workers).statistics()
+                    print("\nTolerance analysis of " + str(args.tolerance) + " boards (mean, std, 1% to 99%):")
+                    print_tolerance(statistics)
+
+    if profiling_on:
+        print("\nProfile:")
+        summary = profiler.summary()
+        for name in summary:
+            print(name + ": " + str(summary[name]["calls"]) + " calls, " + str(round(summary[name]["time"]*1000, 3)) + " ms")
+        counters = profiler.counters()
+        print("microstrip_width: " + ", ".join(str(counters[key]) + " " + key.replace("microstrip_width_", "") for key in counters))
+        if args.profile is not None:
+            profiler.write(args.profile, args.profile_format)
+            print("Profile written to " + args.profile)
+        if args.cprofile is not None:
+            profiler.write_cprofile(args.cprofile)
+            print("Python profiler statistics written to " + args.cprofile)
 
-    print("\nFinished")
-    generate_file(spec, points, sys.argv[1].replace("json", "kicad_pcb"))
-    generate_dxf(spec, points, sys.argv[1].replace("json", "dxf"))
-    print("Output files generated at " + sys.argv[1].replace("json", "kicad_pcb") + ", " + sys.argv[1].replace("json", "dxf"))
\ No newline at end of file
+    # the outputs are still written, so the violations can be looked at, but scripts see the check fail
+    if violations:
+        sys.exit(1)
@@ -0,0 +1,201 @@
+# Designs a stream of specifications, one JSON object per line, into a single tar or zip archive
+# for regression and fleet runs of thousands of designs: records are read as they are needed, designed in a pool
+# of worker processes and written to the archive in input order as they finish, so memory stays bounded by the
+# few designs in flight however long the input is
+# run with:
+#     python batch.py specs.jsonl --archive designs.tar.gz [--results results.jsonl] [--workers N]
+# the input is read from stdin if it is -, and the archive written to stdout if it is - (see --format)
+# a record that cannot be designed is reported in its results line and the batch carries on
+# each results line holds the record's index and line number and either its parameters and the files written,
+# or the error that stopped it
+
+import argparse
+from collections import deque
+import io
+import json
+import os
+import sys
+import tarfile
+import time
+import zipfile
+
+import aperture
+from plot import dxf_entity_types
+
+# archive formats, by the suffix of the archive name
+archive_formats = {".zip": "zip", ".tar": "tar", ".tar.gz": "tar.gz", ".tgz": "tar.gz", ".tar.bz2": "tar.bz2", ".tar.xz": "tar.xz"}
+
+# designs queued for each worker process, enough to keep the workers busy while finished ones are written
+queued_per_worker = 2
+
+# the format of an archive from its name, None if the suffix is not known
+def archive_format(path):
+    for suffix in sorted(archive_formats, key=len, reverse=True):
+        if path.endswith(suffix):
+            return archive_formats[suffix]
+    return None
+
+# writes members to a tar or zip archive in one pass, so the archive can be a pipe
+class ArchiveWriter:
+    def __init__(self, stream, kind):
+        self.kind = kind
+        self.time = time.time()
+        if kind == "zip":
+            self.archive = zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED)
+        else:
+            self.archive = tarfile.open(fileobj=stream, mode="w|" + kind[4:])
+
+    def add(self, name, data):
+        if self.kind == "zip":
+            info = zipfile.ZipInfo(name, time.localtime(self.time)[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            self.archive.writestr(info, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = self.time
+            info.mode = 0o644
+            self.archive.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self.archive.close()
+
+# the records of a stream as [index, line number, text], leaving out blank lines
+def read_records(stream):
+    index = 0
+    for number, line in enumerate(stream, 1):
+        if line.strip():
+            yield index, number, line
+            index += 1
+
+# checks a record as read_specification_file checks a file, raises SpecificationError if it cannot be designed
+def parse_record(text):
+    try:
+        spec = json.loads(text)
+    except json.decoder.JSONDecodeError as e:
+        raise aperture.SpecificationError("Record is not valid JSON: " + str(e))
+    if not isinstance(spec, dict):
+        raise aperture.SpecificationError("Record is not a JSON object")
+    aperture.check_specification(spec)
+    if aperture.sweep_fields(spec):
+        raise aperture.SpecificationError("Sweeps are not batched, give each design of the sweep its own line")
+    return spec
+
+# designs one record, run in the worker processes
+# returns its results line, without the index, and the files to archive as {suffix of the file name: bytes}
+def design_record(text, options):
+    files = {}
+    try:
+        spec = parse_record(text)
+        result = aperture.design(spec, options["tune"])
+        kicad = io.StringIO()
+        result.write_kicad(kicad, options["instanced"])
+        dxf = io.BytesIO() if options["binary_dxf"] else io.StringIO()
+        result.write_dxf(dxf, options["instanced"], options["dxf_entity"], options["binary_dxf"])
+        gerbers = {}
+        if options["gerber"]:
+            import gerber
+            for suffix, write in gerber.gerber_outputs(result.spec, result.tree, result.points):
+                output = io.StringIO()
+                write(output)
+                gerbers[suffix] = output.getvalue().encode()
+    except (ValueError, ZeroDivisionError) as e:
+        return {"status": "error", "error": str(e)}, files
+    except Exception as e:
+        # a value of the wrong type, for example, which the checks of the spec do not catch
+        return {"status": "error", "error": type(e).__name__ + ": " + str(e)}, files
+
+    files[".json"] = json.dumps(spec, indent=4).encode()
+    files[".kicad_pcb"] = kicad.getvalue().encode()
+    files[".dxf"] = dxf.getvalue() if options["binary_dxf"] else dxf.getvalue().encode()
+    files.update(gerbers)
+    line = {"status": "ok", "parameters": result.parameters, "sheet_size": aperture.sheet_size(result.spec, result.points)}
+    if result.tuned is not None:
+        line["tuned"] = result.tuned.summary()
+    return line, files
+
+# designs every record of source into archive, writing a results line for each to results
+# workers=0 designs in this process, otherwise in a pool of that many processes (one per CPU if None)
+# returns the counts of records designed and failed
+def run_batch(source, archive, results, options, workers=None):
+    counts = {"designed": 0, "failed": 0}
+
+    def finish(index, number, line, files):
+        names = []
+        for suffix in files:
+            name = "%06d" % index + suffix
+            archive.add(name, files[suffix])
+            names.append(name)
+        document = {"index": index, "line": number}
+        document.update(line)
+        if names:
+            document["files"] = names
+        results.write(json.dumps(document) + "\n")
+        results.flush()
+        counts["designed" if line["status"] == "ok" else "failed"] += 1
+
+    records = read_records(source)
+    if workers == 0:
+        for index, number, text in records:
+            finish(index, number, *design_record(text, options))
+        return counts
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers, initializer=aperture.use_tables, initargs=(aperture.tables_directory(),)) as pool:
+        limit = queued_per_worker*(workers or os.cpu_count() or 1)
+        pending = deque()
+        for index, number, text in records:
+            pending.append([index, number, pool.submit(design_record, text, options)])
+            # waiting on the oldest design keeps the order of the input and the number in flight bounded
+            if len(pending) >= limit:
+                index, number, future = pending.popleft()
+                finish(index, number, *future.result())
+        while pending:
+            index, number, future = pending.popleft()
+            finish(index, number, *future.result())
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Designs a stream of specifications, one JSON object per line, into an archive")
+    parser.add_argument("input", help="file of specifications, one per line, or - to read them from stdin")
+    parser.add_argument("--archive", required=True, help="tar or zip archive to write the designs to (by its suffix), or - to write it to stdout")
+    parser.add_argument("--format", choices=sorted(set(archive_formats.values())), help="format of the archive, by default from its suffix, or tar when it is written to stdout")
+    parser.add_argument("--results", default="-", help="file to write a JSON line of results for each specification to (default: stdout)")
+    parser.add_argument("--workers", type=int, help="worker processes designing specifications (default: one per CPU), 0 designs them in this process")
+    parser.add_argument("--tune", action="store_true", help="tune the patch length and inset of every design, as aperture.py --tune")
+    parser.add_argument("--instanced", action="store_true", help="write repeated patches and feed groups once, as aperture.py --instanced")
+    parser.add_argument("--dxf-entity", choices=dxf_entity_types, default="line", help="write the DXF outlines as a LINE per edge or as one closed LWPOLYLINE")
+    parser.add_argument("--binary-dxf", action="store_true", help="write binary rather than text DXF")
+    parser.add_argument("--gerber", action="store_true", help="also archive the Gerber and drill files of every design, as aperture.py --gerber")
+    parser.add_argument("--tables", default=os.environ.get("APERTURE_TABLES_DIR"), help="directory of substrate tables to look line widths up in, as aperture.py --tables")
+    args = parser.parse_args()
+
+    kind = args.format or (archive_format(args.archive) if args.archive != "-" else "tar")
+    if kind is None:
+        parser.error("Cannot tell the archive format from " + args.archive + ", give --format")
+    if args.archive == "-" and args.results == "-":
+        parser.error("The archive and the results cannot both be written to stdout")
+
+    try:
+        source = sys.stdin if args.input == "-" else open(args.input)
+        archive_stream = sys.stdout.buffer if args.archive == "-" else open(args.archive, "wb")
+        results = sys.stdout if args.results == "-" else open(args.results, "w")
+    except OSError as e:
+        sys.exit("Cannot open " + str(e.filename) + ": " + e.strerror)
+
+    aperture.use_tables(args.tables)
+    options = {"tune": args.tune, "instanced": args.instanced, "dxf_entity": args.dxf_entity, "binary_dxf": args.binary_dxf, "gerber": args.gerber}
+    start = time.perf_counter()
+    archive = ArchiveWriter(archive_stream, kind)
+    try:
+        counts = run_batch(source, archive, results, options, args.workers)
+    finally:
+        archive.close()
+        for stream in [source, archive_stream, results]:
+            if stream not in [sys.stdin, sys.stdout, sys.stdout.buffer]:
+                stream.close()
+
+    print("Designed " + str(counts["designed"]) + " specifications, " + str(counts["failed"]) + " failed, in " + str(round(time.perf_counter() - start, 2)) + " s", file=sys.stderr)
+    if counts["failed"]:
+        sys.exit(1)
@@ -0,0 +1,388 @@
+# Benchmarks the calculations, array construction, plotting and file generation
+# each case is timed several times and its peak memory measured, and the results are written as JSON
+# results are compared against a stored baseline, and any case slower than the threshold is reported as a regression
+# run with: python benchmark.py [--output results.json] [--save-baseline]
+
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import struct
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from aperture import design
+import circuit
+import drc
+import em_calcs as em
+import em_arrays as ea
+import panel
+from plot import construct_array, generate_file, generate_dxf, generate_instanced_dxf, dxf_entity_types, dxf_binary_sentinel, dxf_value_format
+
+directory = os.path.dirname(os.path.abspath(__file__))
+baseline_path = os.path.join(directory, "benchmark_baseline.json")
+
+# a case more than this fraction slower than its baseline is a regression
+# timings of the small cases vary by a third from run to run on a busy machine, so it is not tight
+default_threshold = 0.5
+
+# the README promises importing aperture takes less than this, in seconds
+import_budget = 0.05
+
+# large arrays built from the GPS example, patch count and body radius chosen so the patches keep their spacing
+synthetic_arrays = {"synthetic_32": (32, 700), "synthetic_128": (128, 2800)}
+
+# boards packed by the panel cases, and the panel they are packed onto in mm
+panel_boards = 50
+panel_size = [2400, 2000]
+
+def read_example(name):
+    with open(os.path.join(directory, "examples", name + ".json")) as spec_file:
+        return json.load(spec_file)
+
+# the specs the construction and output cases are run for
+def benchmark_specs():
+    specs = {"aquila_gps": read_example("aquila_gps"), "aquila_telem": read_example("aquila_telem")}
+    for name in synthetic_arrays:
+        spec = dict(specs["aquila_gps"])
+        spec["patch_count"], spec["body_radius"] = synthetic_arrays[name]
+        specs[name] = spec
+    return specs
+
+# empties the caches, so every run does the work it would the first time
+def clear_caches():
+    em._microstrip_width.cache_clear()
+
+# each timing runs the function enough times to take at least this long, in seconds, so quick cases are not noise
+min_time = 0.02
+
+# one benchmark: function is timed, after setup is run untimed before every call
+# size is an optional function returning the bytes produced by a call, for throughput
+class Case:
+    def __init__(self, name, function, setup=None, size=None):
+        self.name = name
+        self.function = function
+        self.setup = setup
+        self.size = size
+
+    # total time taken by number calls
+    def time(self, number):
+        if self.setup is None:
+            start = time.perf_counter()
+            for i in range(number):
+                self.function()
+            return time.perf_counter() - start
+
+        total = 0
+        for i in range(number):
+            self.setup()
+            start = time.perf_counter()
+            self.function()
+            total += time.perf_counter() - start
+        return total
+
+    def run(self, repeat):
+        number = 1
+        while self.time(number) < min_time and number < 1000000:
+            number *= 2
+        times = [self.time(number) / number for i in range(repeat)]
+
+        # memory is measured in a separate call, tracing slows everything down
+        if self.setup is not None:
+            self.setup()
+        tracemalloc.start()
+        self.function()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        result = {
+            "best": min(times),
+            "median": statistics.median(times),
+            "repeat": repeat,
+            "number": number,
+            "peak_memory": peak_memory,
+        }
+        if self.size is not None:
+            result["bytes"] = self.size()
+            result["throughput"] = result["bytes"] / result["best"]
+        return result
+
+# writes to memory and returns the length in bytes, arguments are passed on to write
+def output_bytes(write, spec, points, *args):
+    binary = len(args) > 1 and args[1]
+    output = io.BytesIO() if binary else io.StringIO()
+    write(spec, points, output, *args)
+    return len(output.getvalue()) if binary else len(output.getvalue().encode())
+
+# the DXF modes other than the default text LINEs, as [name, entity, binary]
+dxf_modes = [["lwpolyline", "lwpolyline", False], ["binary", "line", True], ["lwpolyline_binary", "lwpolyline", True]]
+
+def benchmark_cases():
+    spec = read_example("aquila_gps")
+    impedances = np.linspace(20, 119.5, 200)
+    impedances_large = np.linspace(20, 150, 100000)
+    widths = np.linspace(0.1, 10, 100000)
+
+    cases = [
+        Case("microstrip_impedance", lambda: em.microstrip_impedance(1.5, spec)),
+        Case("microstrip_width", lambda: em.microstrip_width(50, spec), setup=clear_caches),
+        Case("microstrip_width_cached", lambda: em.microstrip_width(50, spec)),
+        Case("microstrip_width_array_200", lambda: ea.microstrip_width(impedances, spec["dielectric_constant"], spec["dielectric_thickness"])),
+        Case("microstrip_width_array_100000", lambda: ea.microstrip_width(impedances_large, spec["dielectric_constant"], spec["dielectric_thickness"])),
+        Case("microstrip_impedance_array_100000", lambda: ea.microstrip_impedance(widths, spec["dielectric_constant"], spec["dielectric_thickness"])),
+    ]
+
+    specs = benchmark_specs()
+    for name in specs:
+        spec = specs[name]
+        tree = construct_array(spec)
+        points = tree.plot()
+        cases += [
+            Case("construct_array_" + name, lambda spec=spec: construct_array(spec), setup=clear_caches),
+            Case("plot_" + name, lambda tree=tree: tree.plot()),
+            Case("circuit_" + name, lambda spec=spec, tree=tree: circuit.circuit(spec, tree)),
+            Case("drc_" + name, lambda spec=spec, tree=tree: drc.check(spec, tree)),
+            Case("generate_file_" + name, lambda spec=spec, points=points: generate_file(spec, points, io.StringIO()),
+                 size=lambda spec=spec, points=points: output_bytes(generate_file, spec, points)),
+            Case("generate_dxf_" + name, lambda spec=spec, points=points: generate_dxf(spec, points, io.StringIO()),
+                 size=lambda spec=spec, points=points: output_bytes(generate_dxf, spec, points)),
+        ]
+        for mode, entity, binary in dxf_modes:
+            output = io.BytesIO if binary else io.StringIO
+            cases.append(Case("generate_dxf_" + mode + "_" + name,
+                              lambda spec=spec, points=points, entity=entity, binary=binary, output=output: generate_dxf(spec, points, output(), entity, binary),
+                              size=lambda spec=spec, points=points, entity=entity, binary=binary: output_bytes(generate_dxf, spec, points, entity, binary)))
+
+    # fifty boards of the two examples on one panel
+    examples = [design(specs["aquila_gps"]), design(specs["aquila_telem"])]
+    boards = [["board_" + str(i), examples[i % 2]] for i in range(panel_boards)]
+    packed = panel.panelize(boards, *panel_size)
+    cases += [
+        Case("panelize_" + str(panel_boards), lambda: panel.panelize(boards, *panel_size)),
+        Case("write_panel_kicad_" + str(panel_boards), lambda: packed.write_kicad(io.StringIO())),
+        Case("write_panel_dxf_" + str(panel_boards), lambda: packed.write_dxf(io.StringIO())),
+    ]
+    return cases
+
+############################## DXF equivalence ##############################
+
+# reads the group codes and values of a DXF file written by plot.py, text or binary
+def dxf_tags(data):
+    if not data.startswith(dxf_binary_sentinel):
+        lines = data.decode().split("\n")
+        for i in range(0, len(lines) - 1, 2):
+            code = int(lines[i])
+            value_format = dxf_value_format(code)
+            value = lines[i + 1].strip()
+            yield code, value if value_format is None else float(value) if value_format == "<d" else int(value)
+        return
+
+    wide_codes = b"$ACADVER" in data[:256] # R13 and later have two byte group codes
+    index = len(dxf_binary_sentinel)
+    while index < len(data):
+        code = struct.unpack_from("<H" if wide_codes else "<B", data, index)[0]
+        index += 2 if wide_codes else 1
+        value_format = dxf_value_format(code)
+        if value_format is None:
+            end = data.index(b"\0", index)
+            value = data[index:end].decode()
+            index = end + 1
+        else:
+            value = struct.unpack_from(value_format, data, index)[0]
+            index += struct.calcsize(value_format)
+        yield code, value
+
+# the edges drawn by a DXF file as a list of [x1, y1, x2, y2], with blocks drawn wherever they are inserted
+def dxf_edges(data):
+    entities = []
+    for code, value in dxf_tags(data):
+        if code == 0:
+            entities.append([value, []])
+        elif entities:
+            entities[-1][1].append([code, value])
+
+    model = []
+    blocks = {}
+    target = model
+    for kind, tags in entities:
+        if kind == "BLOCK":
+            target = blocks.setdefault(dict(tags)[2], [])
+        elif kind == "ENDBLK":
+            target = model
+        elif kind in ["LINE", "LWPOLYLINE", "INSERT"]:
+            target.append([kind, tags])
+
+    def edges(items, dx, dy):
+        result = []
+        for kind, tags in items:
+            values = dict(tags)
+            if kind == "LINE":
+                result.append([values[10] + dx, values[20] + dy, values[11] + dx, values[21] + dy])
+            elif kind == "LWPOLYLINE":
+                x = [value + dx for code, value in tags if code == 10]
+                y = [value + dy for code, value in tags if code == 20]
+                count = len(x) if values[70] & 1 else len(x) - 1
+                result += [[x[i], y[i], x[(i + 1) % len(x)], y[(i + 1) % len(x)]] for i in range(count)]
+            else:
+                result += edges(blocks[values[2]], dx + values[10], dy + values[20])
+        return result
+    return edges(model, 0, 0)
+
+# tests which points lie inside the edges, filled even-odd
+def even_odd(edges, queries):
+    edges = np.asarray(edges)
+    x1, y1, x2, y2 = edges[:, 0], edges[:, 1], edges[:, 2], edges[:, 3]
+    result = []
+    for x, y in queries:
+        spans = (y1 > y) != (y2 > y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            crossing = x1 + (y - y1)*(x2 - x1)/(y2 - y1)
+        result.append(np.count_nonzero(spans & (x < crossing)) % 2 == 1)
+    return np.array(result)
+
+# checks every DXF mode, flat and instanced, draws the same copper as the default text LINE output
+# flat outputs must draw exactly the same edges, instanced ones fill the same points on a grid over the design
+# returns a list of the modes that differ
+def check_dxf_modes(spec):
+    tree = construct_array(spec)
+    points = tree.plot()
+    reference = io.StringIO()
+    generate_dxf(spec, points, reference)
+    reference = dxf_edges(reference.getvalue().encode())
+
+    low = points.min(axis=0)
+    high = points.max(axis=0)
+    # the grid is offset by an irrational fraction so no point sits exactly on an edge
+    xs = low[0] + (np.arange(120) + 0.5**0.5)*(high[0] - low[0])/120
+    ys = -low[1] - (np.arange(60) + 0.3**0.5)*(high[1] - low[1])/60
+    grid = [[x, y] for x in xs for y in ys]
+    filled = even_odd(reference, grid)
+
+    failures = []
+    for entity in dxf_entity_types:
+        for binary in [False, True]:
+            for instanced in [False, True]:
+                output = io.BytesIO() if binary else io.StringIO()
+                if instanced:
+                    generate_instanced_dxf(spec, tree, output, entity, binary)
+                else:
+                    generate_dxf(spec, points, output, entity, binary)
+                data = output.getvalue() if binary else output.getvalue().encode()
+                edges = dxf_edges(data)
+                if instanced:
+                    same = bool(np.all(even_odd(edges, grid) == filled))
+                else:
+                    same = edges == reference
+                if not same:
+                    failures.append(entity + (" binary" if binary else " text") + (" instanced" if instanced else ""))
+    return failures
+
+# time to import aperture in a fresh interpreter, in seconds
+def import_time(repeat):
+    code = "import time; start = time.perf_counter(); import aperture; print(time.perf_counter() - start)"
+    times = []
+    for i in range(repeat):
+        output = subprocess.run([sys.executable, "-c", code], cwd=directory, capture_output=True, text=True, check=True).stdout
+        times.append(float(output))
+    return {"best": min(times), "median": statistics.median(times), "repeat": repeat, "number": 1, "budget": import_budget}
+
+# runs every case whose name contains name_filter, returns the results document
+def run_benchmarks(repeat=5, name_filter=""):
+    results = {}
+    for case in benchmark_cases():
+        if name_filter in case.name:
+            results[case.name] = case.run(repeat)
+    if name_filter in "import_aperture":
+        results["import_aperture"] = import_time(repeat)
+
+    specs = benchmark_specs()
+    dxf_failures = []
+    for name in ["aquila_gps", "aquila_telem", "synthetic_32"]:
+        dxf_failures += [name + " " + mode for mode in check_dxf_modes(specs[name])]
+
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.platform(),
+        "results": results,
+        "dxf_mode_failures": dxf_failures,
+    }
+
+# compares results against a baseline, returns a list of [name, baseline seconds, seconds, ratio]
+# for the cases that are more than threshold slower, plus the import if it is over budget
+def regressions(document, baseline, threshold=default_threshold):
+    found = []
+    for name in document["results"]:
+        if name not in baseline["results"]:
+            continue
+        before = baseline["results"][name]["best"]
+        after = document["results"][name]["best"]
+        if after > before*(1 + threshold):
+            found.append([name, before, after, after/before])
+
+    imported = document["results"].get("import_aperture")
+    if imported is not None and imported["best"] > import_budget:
+        found.append(["import_aperture", import_budget, imported["best"], imported["best"]/import_budget])
+    return found
+
+def print_results(document, baseline):
+    for name in document["results"]:
+        result = document["results"][name]
+        line = name.ljust(48) + str(round(result["best"]*1000, 3)).rjust(12) + " ms"
+        if "peak_memory" in result:
+            line += str(round(result["peak_memory"]/1024, 1)).rjust(12) + " KiB"
+        if "throughput" in result:
+            line += str(round(result["throughput"]/1e6, 1)).rjust(10) + " MB/s"
+        if baseline is not None and name in baseline["results"]:
+            line += "   x" + str(round(result["best"]/baseline["results"][name]["best"], 2))
+        print(line)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks Aperture and compares the results against a baseline")
+    parser.add_argument("--output", help="write the results as JSON to this file, - for standard output")
+    parser.add_argument("--baseline", default=baseline_path, help="baseline results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="replace the baseline with these results")
+    parser.add_argument("--threshold", type=float, default=default_threshold, help="fraction slower than the baseline that counts as a regression")
+    parser.add_argument("--repeat", type=int, default=5, help="times each case is run, the best is kept")
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this")
+    args = parser.parse_args()
+
+    document = run_benchmarks(args.repeat, args.filter)
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    if args.output == "-":
+        json.dump(document, sys.stdout, indent=2)
+        print()
+    else:
+        print_results(document, baseline)
+        if args.output:
+            with open(args.output, "w") as output:
+                json.dump(document, output, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as output:
+            json.dump(document, output, indent=2)
+        print("Baseline saved to " + args.baseline, file=sys.stderr)
+
+    for failure in document["dxf_mode_failures"]:
+        print("DXF mode differs from the text LINE output: " + failure, file=sys.stderr)
+    if document["dxf_mode_failures"]:
+        sys.exit(1)
+
+    if baseline is not None:
+        found = regressions(document, baseline, args.threshold)
+        for name, before, after, ratio in found:
+            print("Regression: " + name + " took " + str(round(after*1000, 3)) + " ms, baseline " + str(round(before*1000, 3)) + " ms", file=sys.stderr)
+        if found:
+            sys.exit(1)
@@ -0,0 +1,162 @@
+# Skips regenerating outputs that have not changed
+# a hash is taken over the normalised spec, the KiCAD template, the tool version and the source of the modules
+# that generate the outputs, and stored next to the outputs in <name>.hash.json
+# a run whose hash matches the stored one, with the outputs still in place, leaves them untouched
+# outputs can also be kept in a shared cache directory, so other checkouts reuse them, evicting the least recently
+# used entries once the directory grows past its size limit
+
+from functools import lru_cache
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from plot import template_path
+
+directory = os.path.dirname(os.path.abspath(__file__))
+
+# the modules whose code decides what is written, so editing any of them invalidates the hashes
+source_files = ["aperture.py", "components.py", "em_calcs.py", "em_arrays.py", "plot.py", "substrate_tables.py", "tuning.py"]
+
+# default size limit of a shared cache directory, in bytes
+default_max_size = 256*1024*1024
+
+# entries are assembled in directories named with this prefix, which eviction leaves alone unless they are older
+# than stale_staging seconds, when the run assembling them must have died
+staging_prefix = ".staging-"
+stale_staging = 3600
+
+# hash of the template and the source files, which do not change while running
+@lru_cache(maxsize=1)
+def source_digest():
+    digest = hashlib.sha256()
+    for path in [template_path] + [os.path.join(directory, name) for name in source_files]:
+        digest.update(os.path.basename(path).encode())
+        with open(path, "rb") as source:
+            digest.update(source.read())
+    return digest.hexdigest()
+
+# makes equal specs compare equal however they were written: keys are sorted and numbers made floats,
+# so 1575000000 and 1.575e9 hash the same
+def normalise(value):
+    if isinstance(value, dict):
+        return {key: normalise(value[key]) for key in sorted(value)}
+    if isinstance(value, list):
+        return [normalise(item) for item in value]
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+# hash of everything that decides the outputs, options holds the command line options that change them
+def output_hash(spec, version, options={}):
+    document = {"spec": normalise(spec), "options": normalise(options), "version": version, "source": source_digest()}
+    return hashlib.sha256(json.dumps(document, sort_keys=True).encode()).hexdigest()
+
+# path of the file storing the hash of the outputs generated from a specification file
+def stamp_path(filename):
+    return filename.replace(".json", "") + ".hash.json"
+
+# hash of the contents of a file
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as contents:
+        for block in iter(lambda: contents.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# checks the stamp holds digest and every output is still there as it was written
+# outputs is a dictionary of names to paths
+def up_to_date(stamp, digest, outputs):
+    try:
+        with open(stamp) as stamp_file:
+            stored = json.load(stamp_file)
+    except (OSError, ValueError):
+        return False
+    if stored.get("hash") != digest:
+        return False
+    for name in outputs:
+        try:
+            if file_digest(outputs[name]) != stored["outputs"].get(name):
+                return False
+        except (OSError, KeyError):
+            return False
+    return True
+
+def write_stamp(stamp, digest, outputs):
+    hashes = {name: file_digest(outputs[name]) for name in outputs}
+    with open(stamp, "w") as stamp_file:
+        json.dump({"hash": digest, "outputs": hashes}, stamp_file, indent=2)
+
+# a shared directory of outputs, one subdirectory per hash
+# the modification time of an entry records when it was last used
+class OutputCache:
+    def __init__(self, path, max_size=default_max_size):
+        self.path = path
+        self.max_size = max_size
+
+    def entry(self, digest):
+        return os.path.join(self.path, digest[:2], digest)
+
+    # copies the cached outputs for digest to their paths, returns False if they are not cached
+    def fetch(self, digest, outputs):
+        entry = self.entry(digest)
+        try:
+            for name in outputs:
+                shutil.copyfile(os.path.join(entry, name), outputs[name])
+            os.utime(entry)
+        except OSError:
+            return False
+        return True
+
+    # copies the outputs into the cache under digest, then evicts old entries if it has grown too big
+    # entries are assembled in a temporary directory and renamed into place, so readers never see half an entry
+    def store(self, digest, outputs):
+        entry = self.entry(digest)
+        if os.path.isdir(entry):
+            os.utime(entry)
+            return
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        temporary = tempfile.mkdtemp(prefix=staging_prefix, dir=os.path.dirname(entry))
+        for name in outputs:
+            shutil.copyfile(outputs[name], os.path.join(temporary, name))
+        try:
+            os.rename(temporary, entry)
+        except OSError:
+            # another run stored the same entry first
+            shutil.rmtree(temporary, ignore_errors=True)
+        self.evict()
+
+    # removes the least recently used entries until the cache fits in max_size
+    # entries still being assembled by store are not entries yet, and are skipped
+    def evict(self):
+        entries = []
+        total = 0
+        for prefix in os.listdir(self.path):
+            # anything else kept in the cache directory, such as a README, is not an entry
+            directory = os.path.join(self.path, prefix)
+            if not os.path.isdir(directory):
+                continue
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue
+            for name in names:
+                entry = os.path.join(directory, name)
+                try:
+                    if name.startswith(staging_prefix):
+                        if time.time() - os.path.getmtime(entry) > stale_staging:
+                            shutil.rmtree(entry, ignore_errors=True)
+                        continue
+                    size = sum(file.stat().st_size for file in os.scandir(entry))
+                    entries.append([os.path.getmtime(entry), size, entry])
+                except OSError:
+                    continue
+                total += size
+
+        for used, size, entry in sorted(entries):
+            if total <= self.max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
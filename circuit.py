@@ -0,0 +1,236 @@
+# Predicts the response of the whole feed network over frequency from a circuit model of its component tree
+# every line, bend and splitter arm is a length of microstrip line described by its ABCD matrix at each frequency,
+# stacked along the first axis so runs of lines are cascaded for the whole sweep with one batched matmul
+# splitter arms are joined in parallel at the splitter, and patches are loads from the transmission line model
+# of tuning.py; the corners trimmed off circularly polarised patches are ignored, and mitred bends are taken as
+# straight lines along their centre line, detours and all, so the model predicts the match and the split of power,
+# not the axial ratio
+# lines lose power in the dielectric if the spec gives its dissipation_factor, copper losses are ignored
+
+import numpy as np
+
+import em_arrays as ea
+from components import InsetFeed, LinearPatch, MicrostripLine, MicrostripToEnd, MitredBendAtPoint, PointBuffer, PowerSplitter2, SquarePatch
+from em_calcs import c
+from plot import fixed_shape
+import tuning
+
+# frequencies swept when none are given: this fraction either side of the spec frequency, with this many points
+default_span = 0.1
+default_points = 1001
+
+# impedance the input is matched to, that of the feed line
+reference_impedance = 50
+
+# ABCD matrices of a line of given width and length at each frequency, shape (frequencies, 2, 2)
+def line_abcd(spec, frequencies, width, length):
+    k = spec["dielectric_constant"]
+    h = spec["dielectric_thickness"]
+    z0 = ea.microstrip_impedance(width, k, h)
+    keff = ea.effective_dielectric_constant(width, k, h)
+    k0 = 2*np.pi*frequencies/c
+
+    # dielectric loss in nepers per mm, from the part of the field in the substrate
+    attenuation = k0*k*(keff - 1)*spec.get("dissipation_factor", 0)/(2*np.sqrt(keff)*(k - 1))
+    gamma_length = (attenuation + 1j*k0*np.sqrt(keff))*length
+    cosh = np.cosh(gamma_length)
+    sinh = np.sinh(gamma_length)
+    return np.stack([np.stack([cosh, z0*sinh], -1), np.stack([sinh/z0, cosh], -1)], -2)
+
+# the response of a subtree seen from its input
+# impedance is its input impedance (frequencies,), and for each patch port it holds the ratio of the port voltage
+# to the input voltage and the patch impedance (ports, frequencies), and the patch position relative to the input
+class Network:
+    def __init__(self, impedance, transfers, loads, offsets):
+        self.impedance = impedance
+        self.transfers = transfers
+        self.loads = loads
+        self.offsets = offsets
+
+    # the same network with its input moved by offset
+    def shifted(self, offset):
+        return Network(self.impedance, self.transfers, self.loads, self.offsets - offset)
+
+# a network seen through the two port abcd, which has load on its output
+def terminate(abcd, load):
+    a, b, c_, d = abcd[:, 0, 0], abcd[:, 0, 1], abcd[:, 1, 0], abcd[:, 1, 1]
+    impedance = (a*load.impedance + b)/(c_*load.impedance + d)
+    return Network(impedance, load.transfers/(a + b/load.impedance), load.loads, load.offsets)
+
+# networks whose inputs are joined at one point
+def parallel(networks):
+    impedance = 1/sum(1/network.impedance for network in networks)
+    return Network(impedance,
+        np.concatenate([network.transfers for network in networks]),
+        np.concatenate([network.loads for network in networks]),
+        np.concatenate([network.offsets for network in networks]))
+
+# [child, start] for each child of a component plotted at start, found by plotting it without its children
+def child_placements(component, start):
+    buffer = PointBuffer(16)
+    buffer.cut = {id(child) for child in component.nodes}
+    component.plot_into(buffer, start)
+    return buffer.cuts
+
+# models a component tree over frequency
+# subtrees that have the same shape wherever they are placed are solved once and reused
+class CircuitSolver:
+    def __init__(self, spec, frequencies):
+        self.spec = spec
+        self.frequencies = frequencies
+        self.solved = {} # id of a fixed shape component -> its Network
+        self.fixed = {} # id of a component -> whether it has a fixed shape
+        self.lines = {} # (width, length) -> ABCD matrices of the line
+
+    def fixed_shape(self, component):
+        if id(component) not in self.fixed:
+            self.fixed[id(component)] = fixed_shape(component)
+        return self.fixed[id(component)]
+
+    # ABCD matrices of a line, lines of the same size are repeated all over an array
+    def line_abcd(self, width, length):
+        if (width, length) not in self.lines:
+            self.lines[width, length] = line_abcd(self.spec, self.frequencies, width, length)
+        return self.lines[width, length]
+
+    def patch(self, patch, inset=0):
+        spec = self.spec
+        impedance = tuning.patch_impedance(patch.width, patch.length, inset, self.frequencies, spec["dielectric_constant"], spec["dielectric_thickness"])
+        return Network(impedance, np.ones((1, len(self.frequencies)), dtype=complex), impedance[None, :], np.zeros((1, 2)))
+
+    # the line a component is a length of, as its width and length, or None if it is not a line
+    def line(self, component, start):
+        if isinstance(component, MicrostripToEnd):
+            return component.width, component.end - start[0]
+        if isinstance(component, MicrostripLine):
+            return component.width, component.length
+        if isinstance(component, MitredBendAtPoint):
+            return component.width, component.bend_length(start) + component.height + component.extra
+        if isinstance(component, InsetFeed):
+            # the feed runs up a notch in the patch, to the inset where the patch is fed
+            return component.feed_width, component.inset_dist
+        return None
+
+    # solves the subtree of component placed at start, returns its Network
+    def solve(self, component, start):
+        fixed = self.fixed_shape(component)
+        if fixed and id(component) in self.solved:
+            return self.solved[id(component)]
+
+        if isinstance(component, (LinearPatch, SquarePatch)):
+            network = self.patch(component)
+        elif isinstance(component, PowerSplitter2):
+            arms = []
+            for i, (child, child_start) in enumerate(child_placements(component, start)):
+                arm = self.line_abcd(component.widths[i], component.branch_lengths[i])
+                load = self.solve(child, child_start).shifted(np.subtract(start, child_start))
+                arms.append(terminate(arm, load))
+            network = parallel(arms)
+        elif self.line(component, start) is not None:
+            network = self.solve_lines(component, start)
+        else:
+            raise ValueError("No circuit model for " + type(component).__name__)
+
+        if fixed:
+            self.solved[id(component)] = network
+        return network
+
+    # solves a run of lines from component down to the splitter or patch that ends it
+    # the lines are cascaded into one ABCD matrix before the load is put on the end
+    def solve_lines(self, component, start):
+        abcd = None
+        node, node_start = component, start
+        while True:
+            matrix = self.line_abcd(*self.line(node, node_start))
+            abcd = matrix if abcd is None else abcd @ matrix
+            children = child_placements(node, node_start)
+            if not children:
+                # an open line, with nothing on the end
+                a, c_ = abcd[:, 0, 0], abcd[:, 1, 0]
+                empty = np.zeros((0, len(self.frequencies)), dtype=complex)
+                return Network(a/c_, empty, empty, np.zeros((0, 2)))
+
+            child, child_start = children[0]
+            if isinstance(node, InsetFeed) and isinstance(child, LinearPatch):
+                load = self.patch(child, node.inset_dist)
+            elif self.line(child, child_start) is not None and not (self.fixed_shape(child) and id(child) in self.solved):
+                node, node_start = child, child_start
+                continue
+            else:
+                load = self.solve(child, child_start)
+            return terminate(abcd, load.shifted(np.subtract(start, child_start)))
+
+# the response of an array over frequency, fed at its root
+class CircuitResponse:
+    def __init__(self, spec, frequencies, network, reference=reference_impedance):
+        self.spec = spec
+        self.frequencies = frequencies
+        self.impedance = network.impedance
+        self.reference = reference
+        self.s11 = (network.impedance - reference)/(network.impedance + reference)
+        # voltages for an incident wave of 1 V at the input, (ports, frequencies)
+        self.voltages = network.transfers*(1 + self.s11)
+        self.loads = network.loads
+        self.positions = network.offsets
+
+    def s11_db(self):
+        return 20*np.log10(np.maximum(np.abs(self.s11), 1e-10))
+
+    # fraction of the incident power delivered to each patch, (ports, frequencies)
+    def port_power(self):
+        return np.abs(self.voltages)**2*(1/self.loads).real*self.reference
+
+    # phase of the voltage at each patch in degrees, relative to the first patch
+    def port_phase(self):
+        return np.degrees(np.angle(self.voltages/self.voltages[:1]))
+
+    # the band around the best match where S11 is below threshold dB
+    # returns the lowest and highest frequency of the band, nan if the match never reaches the threshold
+    def bandwidth(self, threshold=-10):
+        s11 = self.s11_db()
+        best = np.argmin(s11)
+        if s11[best] > threshold:
+            return float("nan"), float("nan")
+        below = s11 <= threshold
+        low = best
+        while low > 0 and below[low - 1]:
+            low -= 1
+        high = best
+        while high < len(below) - 1 and below[high + 1]:
+            high += 1
+        return float(self.frequencies[low]), float(self.frequencies[high])
+
+    # the response at the frequency closest to frequency, the spec frequency by default
+    def summary(self, frequency=None, threshold=-10):
+        if frequency is None:
+            frequency = self.spec["frequency"]
+        i = int(np.argmin(np.abs(self.frequencies - frequency)))
+        s11 = self.s11_db()
+        best = int(np.argmin(s11))
+        lower, upper = self.bandwidth(threshold)
+        power = self.port_power()[:, i]
+        power_db = 10*np.log10(np.maximum(power, 1e-30))
+        phase = self.port_phase()[:, i]
+        return {
+            "frequency": float(self.frequencies[i]),
+            "s11_db": float(s11[i]),
+            "input_impedance": [float(self.impedance[i].real), float(self.impedance[i].imag)],
+            "best_match_frequency": float(self.frequencies[best]),
+            "best_match_s11_db": float(s11[best]),
+            "bandwidth_lower": lower,
+            "bandwidth_upper": upper,
+            "bandwidth": upper - lower,
+            "delivered": float(power.sum()),
+            "port_power_db": [float(value) for value in power_db],
+            "port_phase": [float(value) for value in phase],
+            "power_imbalance_db": float(power_db.max() - power_db.min()),
+            "phase_spread": float(phase.max() - phase.min()),
+        }
+
+# solves the feed network of a design over frequencies in Hz, by default default_span either side of the spec frequency
+def circuit(spec, tree, frequencies=None):
+    if frequencies is None:
+        frequencies = spec["frequency"]*np.linspace(1 - default_span, 1 + default_span, default_points)
+    frequencies = np.asarray(frequencies, dtype=float)
+    network = CircuitSolver(spec, frequencies).solve(tree, [0.0, 0.0])
+    return CircuitResponse(spec, frequencies, network)
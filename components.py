@@ -9,29 +9,115 @@ class Dir(Enum):
     DOWN = 3
 
 
+# rotation taking a component's own coordinates onto the board for each direction
+# a component's points are plotted as matrix @ point + start
+orientations = {
+    Dir.LEFT: ((1, 0), (0, 1)), # default
+    Dir.UP: ((0, 1), (-1, 0)),
+    Dir.RIGHT: ((-1, 0), (0, 1)),
+    Dir.DOWN: ((0, 1), (1, 0)),
+}
+
+# components built without a direction face left
+def orientation(direction):
+    if isinstance(direction, Dir):
+        return orientations[direction]
+    return orientations[Dir.LEFT]
+
+# growable float64 array that every component of a tree writes its points into
+# doubles in size when full, so plotting is linear in the number of points
+class PointBuffer:
+    def __init__(self, capacity=256):
+        import numpy as np
+        self.array = np.empty((capacity, 2))
+        self.length = 0
+        self.placements = None
+        self.cut = None # ids of components left out, see Component.plot_without
+        self.cuts = []
+        self.owners = None # [component, start, count] for each run of points, see Component.plot_with_owners
+
+    # transforms points from component coordinates and appends them
+    def add(self, points, matrix, start):
+        import numpy as np
+        points = np.asarray(points, dtype=float) @ np.asarray(matrix, dtype=float).T + start
+
+        end = self.length + len(points)
+        if end > len(self.array):
+            grown = np.empty((max(end, 2*len(self.array)), 2))
+            grown[:self.length] = self.array[:self.length]
+            self.array = grown
+        self.array[self.length:end] = points
+        self.length = end
+
+    # returns the points added so far as an (N, 2) array
+    def points(self):
+        return self.array[:self.length].copy()
+
+
 class Component:
+    # whether the component's shape is the same wherever it is plotted, so copies differ only by translation
+    position_independent = True
+
     def __init__(self, spec, nodes=[]):
         self.name = "unnamed"
         self.spec = spec
         self.nodes = nodes
-        self.points = []
-    
-    def translate(self, point):
-        if self.direction == Dir.LEFT: pass # defalt
-        if self.direction == Dir.UP: point = [point[1], -point[0]]
-        if self.direction == Dir.RIGHT: point = [-point[0], point[1]]
-        if self.direction == Dir.DOWN: point = [point[1], point[0]]
 
-        return [point[0] + self.start[0], point[1] + self.start[1]]
+    # returns the outline of this component and its children as an (N, 2) array
+    # start is where the component's origin sits on the board
+    # nothing is stored on the components, so a tree can be plotted any number of times
+    def plot(self, start=[0, 0]):
+        buffer = PointBuffer()
+        self.plot_into(buffer, [float(start[0]), float(start[1])])
+        return buffer.points()
+
+    # returns [component, start] for every component in the tree, in the order they are plotted
+    def placements(self, start=[0, 0]):
+        buffer = PointBuffer()
+        start = [float(start[0]), float(start[1])]
+        buffer.placements = [[self, start]]
+        self.plot_into(buffer, start)
+        return buffer.placements
+
+    # returns the outline with the subtrees of the components in cut left out, and [component, start] for each
+    # subtree left out, so they can be drawn separately; the outline closes across each place one was joined
+    # cut is a set of component ids
+    def plot_without(self, cut, start=[0, 0]):
+        buffer = PointBuffer()
+        buffer.cut = cut
+        self.plot_into(buffer, [float(start[0]), float(start[1])])
+        return buffer.points(), buffer.cuts
+
+    # returns the outline like plot, and [component, start, count] for each run of count points a component added,
+    # in the order of the points, so each point can be traced back to the component that drew it
+    def plot_with_owners(self, start=[0, 0]):
+        buffer = PointBuffer()
+        buffer.owners = []
+        self.plot_into(buffer, [float(start[0]), float(start[1])])
+        return buffer.points(), buffer.owners
+
+    # takes a point in component coordinates and returns it on the board
+    def translate(self, point, start):
+        matrix = orientation(self.direction)
+        return [matrix[0][0]*point[0] + matrix[0][1]*point[1] + start[0],
+                matrix[1][0]*point[0] + matrix[1][1]*point[1] + start[1]]
+
+    def add_points(self, buffer, start, points):
+        if buffer.owners is not None:
+            buffer.owners.append([self, start, len(points)])
+        buffer.add(points, orientation(self.direction), start)
     
-    def add_point(self, point):
-        self.points.append(self.translate(point))
-    
-    def plot_child(self, child_number, node_location):
+    def plot_child(self, buffer, start, child_number, node_location):
         if len(self.nodes) <= child_number: return
 
         child = self.nodes[child_number]
-        self.points.extend(child.plot(self.translate(node_location)))
+        child_start = self.translate(node_location, start)
+        if buffer.cut is not None and id(child) in buffer.cut:
+            buffer.cuts.append([child, child_start])
+            return
+        if buffer.placements is not None:
+            buffer.placements.append([child, child_start])
+        child.plot_into(buffer, child_start)
 
 
 
@@ -45,15 +131,10 @@ class MicrostripLine(Component):
         self.direction = direction
         self.width = em.microstrip_width(z, spec)
     
-    def plot(self, start):
-        self.start = start
-        self.add_point([0, self.width/2])
-        self.add_point([self.length, self.width/2])
-        self.plot_child(0, [self.length, 0])
-        self.add_point([self.length, -self.width/2])
-        self.add_point([0, -self.width/2])
-
-        return self.points
+    def plot_into(self, buffer, start):
+        self.add_points(buffer, start, [[0, self.width/2], [self.length, self.width/2]])
+        self.plot_child(buffer, start, 0, [self.length, 0])
+        self.add_points(buffer, start, [[self.length, -self.width/2], [0, -self.width/2]])
 
 
 class MatchLine(MicrostripLine):
@@ -64,80 +145,110 @@ class MatchLine(MicrostripLine):
         super().__init__(spec, z, length, direction, nodes)
 
 class MicrostripToEnd(MicrostripLine):
+    position_independent = False
+
     def __init__(self, spec, z, end, direction, nodes=[]):
         super().__init__(spec, z, 0, direction, nodes)
         self.end = end
 
-    def plot(self, start):
-        self.start = start
+    def plot_into(self, buffer, start):
         length = self.end - start[0]
-        self.add_point([0, self.width/2])
-        self.add_point([length, self.width/2])
-        self.plot_child(0, [length, 0])
-        self.add_point([length, -self.width/2])
-        self.add_point([0, -self.width/2])
-
-        return self.points
+        self.add_points(buffer, start, [[0, self.width/2], [length, self.width/2]])
+        self.plot_child(buffer, start, 0, [length, 0])
+        self.add_points(buffer, start, [[length, -self.width/2], [0, -self.width/2]])
 
 
-class PowerSplitter2_pinfeed(Component):
-    def __init__(self, spec, zin, zout, hole_size, direction, nodes=[]):
+# two way splitter made of a quarter wave transformer arm either side of the feed
+# ratio is the fraction of the power delivered to child 0, arms are equal unless it is given
+# child 0 is on the +x side and child 1 on the -x side
+class PowerSplitter2(Component):
+    def __init__(self, spec, zin, zout, direction, nodes=[], ratio=0.5):
         super().__init__(spec, nodes)
-        z = sqrt(zout*zin*2)
-        self.width = em.microstrip_width(z, spec)
-        self.branch_length = em.effective_wavelength(self.width, spec)/4
+        self.ratio = ratio
+        # each arm transforms zout up to the share of zin that takes its fraction of the power
+        self.widths = [em.microstrip_width(sqrt(zout*zin/ratio), spec), em.microstrip_width(sqrt(zout*zin/(1-ratio)), spec)]
+        self.branch_lengths = [em.effective_wavelength(width, spec)/4 for width in self.widths]
+        self.width = self.widths[0]
+        self.branch_length = self.branch_lengths[0]
         self.direction = direction
-        self.hole_size = hole_size
 
-    def plot(self, start):
-        self.start = start
+    # points along the -y edge between the two arms, stepping between the arm widths if they differ
+    def lower_edge(self):
+        points = [[self.branch_lengths[0], -self.widths[0]/2]]
+        if self.widths[0] != self.widths[1]:
+            points += [[0, -self.widths[0]/2], [0, -self.widths[1]/2]]
+        return points + [[-self.branch_lengths[1], -self.widths[1]/2]]
 
-        
-        self.add_point([self.branch_length, self.width/2])
-        self.plot_child(0, [self.branch_length, 0])
-        self.add_point([self.branch_length, -self.width/2])
-        self.add_point([-self.branch_length, -self.width/2])
-        self.plot_child(1, [-self.branch_length, 0])
-        self.add_point([-self.branch_length, self.width/2])
-        
-        self.add_point([0, self.width/2])
-        self.add_point([0, self.hole_size])
-        self.add_point([-self.hole_size, 0])
-        self.add_point([0, -self.hole_size])
-        self.add_point([self.hole_size, 0])
-        self.add_point([0, self.hole_size])
-        self.add_point([0, self.width/2])
-
-        return self.points
-
-class PowerSplitter2_linefeed(Component):
-    def __init__(self, spec, zin, zout, direction, nodes=[]):
-        super().__init__(spec, nodes)
-        z = sqrt(zout*zin*2)
-        self.width = em.microstrip_width(z, spec)
+class PowerSplitter2_pinfeed(PowerSplitter2):
+    def __init__(self, spec, zin, zout, hole_size, direction, nodes=[], ratio=0.5):
+        super().__init__(spec, zin, zout, direction, nodes, ratio)
+        self.hole_size = hole_size
+
+    # half width of the copper around the pin: where the arms differ, the wider arm's width is carried on to
+    # hole_size past the pin, so the hole is as far from the edge of the narrower arm as from the wider
+    def pad(self):
+        return max(self.widths)/2
+
+    # the -y edge between the two arms, stepping out to the pad around the pin
+    def lower_edge(self):
+        right, left, pad = self.widths[0]/2, self.widths[1]/2, self.pad()
+        points = [[self.branch_lengths[0], -right]]
+        if right < pad:
+            points += [[self.hole_size, -right], [self.hole_size, -pad]]
+        if left < pad:
+            points += [[-self.hole_size, -pad], [-self.hole_size, -left]]
+        return points + [[-self.branch_lengths[1], -left]]
+
+    def plot_into(self, buffer, start):
+        right, left, pad = self.widths[0]/2, self.widths[1]/2, self.pad()
+        self.add_points(buffer, start, [[self.branch_lengths[0], right]])
+        self.plot_child(buffer, start, 0, [self.branch_lengths[0], 0])
+        self.add_points(buffer, start, self.lower_edge())
+        self.plot_child(buffer, start, 1, [-self.branch_lengths[1], 0])
+        points = [[-self.branch_lengths[1], left]]
+        if left < pad:
+            points += [[-self.hole_size, left], [-self.hole_size, pad]]
+        points += [
+            [0, pad],
+            [0, self.hole_size],
+            [-self.hole_size, 0],
+            [0, -self.hole_size],
+            [self.hole_size, 0],
+            [0, self.hole_size],
+            [0, pad],
+        ]
+        if right < pad:
+            points += [[self.hole_size, pad], [self.hole_size, right]]
+        self.add_points(buffer, start, points)
+
+class PowerSplitter2_linefeed(PowerSplitter2):
+    def __init__(self, spec, zin, zout, direction, nodes=[], ratio=0.5):
+        super().__init__(spec, zin, zout, direction, nodes, ratio)
         self.feed_width = em.microstrip_width(zin, spec)
-        self.branch_length = em.effective_wavelength(self.width, spec)/4
-        self.direction = direction
 
-    def plot(self, start):
-        self.start = start
+    def plot_into(self, buffer, start):
+        self.add_points(buffer, start, [
+            [self.feed_width/2, 0],
+            [self.feed_width/2, self.widths[0]/2],
 
-        self.add_point([self.feed_width/2, 0])
-        self.add_point([self.feed_width/2, self.width/2])
+            [self.branch_lengths[0], self.widths[0]/2],
+        ])
+        self.plot_child(buffer, start, 0, [self.branch_lengths[0], 0])
+        self.add_points(buffer, start, self.lower_edge())
+        self.plot_child(buffer, start, 1, [-self.branch_lengths[1], 0])
+        self.add_points(buffer, start, [
+            [-self.branch_lengths[1], self.widths[1]/2],
 
-        self.add_point([self.branch_length, self.width/2])
-        self.plot_child(0, [self.branch_length, 0])
-        self.add_point([self.branch_length, -self.width/2])
-        self.add_point([-self.branch_length, -self.width/2])
-        self.plot_child(1, [-self.branch_length, 0])
-        self.add_point([-self.branch_length, self.width/2])
+            [-self.feed_width/2, self.widths[1]/2],
+            [-self.feed_width/2, 0],
+        ])
 
-        self.add_point([-self.feed_width/2, self.width/2])
-        self.add_point([-self.feed_width/2, 0])
+class MitredBendAtPoint(Component):
+    position_independent = False
 
-        return self.points
+    # length added to the line by a detour, see MeanderedBend
+    extra = 0
 
-class MitredBendAtPoint(Component):
     def __init__(self, spec, z, point, height, direction, nodes=[]):
         super().__init__(spec, nodes)
         self.width = em.microstrip_width(z, spec)
@@ -147,22 +258,84 @@ class MitredBendAtPoint(Component):
         self.point = point
         self.direction = direction
     
-    def plot(self, start):
-        self.start = start
-        length = abs(self.point - start[0])
+    # distance along the line before the bend
+    def bend_length(self, start):
+        return abs(self.point - start[0])
+
+    def plot_into(self, buffer, start):
+        length = self.bend_length(start)
+
+        self.add_points(buffer, start, [
+            [0, -self.width/2],
+            [length-self.width/2, -self.width/2],
+
+            [length-self.width/2, -self.height],
+        ])
+        self.plot_child(buffer, start, 0, [length, -self.height])
+        self.add_points(buffer, start, [
+            [length+self.width/2, -self.height],
 
-        self.add_point([0, -self.width/2])
-        self.add_point([length-self.width/2, -self.width/2])
+            [length+self.width/2, -self.width/2-self.a],
+            [length-self.width/2-self.a, self.width/2],
 
-        self.add_point([length-self.width/2, -self.height])
-        self.plot_child(0, [length, -self.height])
-        self.add_point([length+self.width/2, -self.height])
+            [0, self.width/2],
+        ])
 
-        self.add_point([length+self.width/2, -self.width/2-self.a])
-        self.add_point([length-self.width/2-self.a, self.width/2])
+# mitred bend after a fixed length rather than at a point on the board
+# its shape does not depend on where it is plotted, so one bend can appear in several places in a tree
+class MitredBend(MitredBendAtPoint):
+    position_independent = True
 
-        self.add_point([0, self.width/2])
-        return self.points
+    def __init__(self, spec, z, length, height, direction, nodes=[]):
+        super().__init__(spec, z, None, height, direction, nodes)
+        self.length = length
+
+    def bend_length(self, start):
+        return self.length
+
+# mitred bend with a U shaped detour in its drop, which makes the line extra mm longer without moving its end
+# the detour runs out on the far side of the drop from the splitter, just below the mitre, extra/2 out and back
+# the drop must be at least min_height and extra at least min_extra for the detour to fit
+class MeanderedBend(MitredBend):
+    def __init__(self, spec, z, length, height, extra, direction, nodes=[]):
+        super().__init__(spec, z, length, height, direction, nodes)
+        self.extra = extra
+        # centre lines of the legs of the detour below the corner, with two widths of gap between them
+        self.first_leg = self.a + 2*self.width
+        self.second_leg = self.first_leg + 3*self.width
+        self.min_height = self.second_leg + 3*self.width
+        self.min_extra = 4*self.width
+
+    def plot_into(self, buffer, start):
+        length = self.bend_length(start)
+        w = self.width
+        reach = length + self.extra/2
+
+        self.add_points(buffer, start, [
+            [0, -w/2],
+            [length-w/2, -w/2],
+
+            [length-w/2, -self.first_leg-w/2],
+            [reach-w/2, -self.first_leg-w/2],
+            [reach-w/2, -self.second_leg+w/2],
+            [length-w/2, -self.second_leg+w/2],
+
+            [length-w/2, -self.height],
+        ])
+        self.plot_child(buffer, start, 0, [length, -self.height])
+        self.add_points(buffer, start, [
+            [length+w/2, -self.height],
+
+            [length+w/2, -self.second_leg-w/2],
+            [reach+w/2, -self.second_leg-w/2],
+            [reach+w/2, -self.first_leg+w/2],
+            [length+w/2, -self.first_leg+w/2],
+
+            [length+w/2, -w/2-self.a],
+            [length-w/2-self.a, w/2],
+
+            [0, w/2],
+        ])
 
 class LinearPatch(Component):
     def __init__(self, spec, direction, nodes=[]):
@@ -173,14 +346,13 @@ class LinearPatch(Component):
         self.direction = direction
 
 
-    def plot(self, start):
-        self.start = start
-        self.add_point([0, self.width/2])
-        self.add_point([self.length, self.width/2])
-        self.add_point([self.length, -self.width/2])
-        self.add_point([0, -self.width/2])
-
-        return self.points
+    def plot_into(self, buffer, start):
+        self.add_points(buffer, start, [
+            [0, self.width/2],
+            [self.length, self.width/2],
+            [self.length, -self.width/2],
+            [0, -self.width/2],
+        ])
 
 class SquarePatch(Component):
     def __init__(self, spec, direction, nodes=[]):
@@ -198,35 +370,40 @@ class SquarePatch(Component):
 
         self.trim = 1/8
 
-    def plot(self, start):
-        self.start = start
+    def plot_into(self, buffer, start):
         if self.polarisation == 1:
-            self.add_point([0, self.width/2])
+            points = [
+                [0, self.width/2],
 
-            self.add_point([self.length*(1-self.trim), self.width/2])
-            self.add_point([self.length, self.width*(1/2 - self.trim)])
+                [self.length*(1-self.trim), self.width/2],
+                [self.length, self.width*(1/2 - self.trim)],
 
-            self.add_point([self.length, -self.width/2])
+                [self.length, -self.width/2],
 
-            self.add_point([self.length*self.trim, -self.width/2])
-            self.add_point([0, -self.width*(1/2 - self.trim)])
+                [self.length*self.trim, -self.width/2],
+                [0, -self.width*(1/2 - self.trim)],
+            ]
         elif self.polarisation == -1:
-            self.add_point([0, self.width*(1/2 - self.trim)])
-            self.add_point([self.length*self.trim, self.width/2])
+            points = [
+                [0, self.width*(1/2 - self.trim)],
+                [self.length*self.trim, self.width/2],
 
-            self.add_point([self.length, self.width/2])
+                [self.length, self.width/2],
 
-            self.add_point([self.length, -self.width*(1/2 - self.trim)])
-            self.add_point([self.length*(1-self.trim), -self.width/2])
+                [self.length, -self.width*(1/2 - self.trim)],
+                [self.length*(1-self.trim), -self.width/2],
 
-            self.add_point([0, -self.width/2])
+                [0, -self.width/2],
+            ]
         else:
-            self.add_point([0, self.width/2])
-            self.add_point([self.length, self.width/2])
-            self.add_point([self.length, -self.width/2])
-            self.add_point([0, -self.width/2])
+            points = [
+                [0, self.width/2],
+                [self.length, self.width/2],
+                [self.length, -self.width/2],
+                [0, -self.width/2],
+            ]
 
-        return self.points
+        self.add_points(buffer, start, points)
 
 class InsetFeed(Component):
     def __init__(self, spec, zin, direction, nodes=[]):
@@ -238,19 +415,19 @@ class InsetFeed(Component):
         self.inset_dist = em.inset_distance(spec, zin)
         self.direction = direction
 
-    def plot(self, start):
-        self.start = start
-
-        self.add_point([0, self.feed_width/2])
-        self.add_point([self.inset_dist, self.feed_width/2])
-        self.add_point([self.inset_dist, self.inset_width/2])
-        self.add_point([0, self.inset_width/2])
-
-        self.plot_child(0, [0, 0])
-
-        self.add_point([0, -self.inset_width/2])
-        self.add_point([self.inset_dist, -self.inset_width/2])
-        self.add_point([self.inset_dist, -self.feed_width/2])
-        self.add_point([0, -self.feed_width/2])
-
-        return self.points
\ No newline at end of file
+    def plot_into(self, buffer, start):
+        self.add_points(buffer, start, [
+            [0, self.feed_width/2],
+            [self.inset_dist, self.feed_width/2],
+            [self.inset_dist, self.inset_width/2],
+            [0, self.inset_width/2],
+        ])
+
+        self.plot_child(buffer, start, 0, [0, 0])
+
+        self.add_points(buffer, start, [
+            [0, -self.inset_width/2],
+            [self.inset_dist, -self.inset_width/2],
+            [self.inset_dist, -self.feed_width/2],
+            [0, -self.feed_width/2],
+        ])
@@ -0,0 +1,302 @@
+# Wraps the flat design around the rocket body and exports it as a triangle mesh
+# the flat x axis runs around the circumference and the flat y axis along the rocket,
+# so a design conforms to the body without importing it into a CAD tool first
+
+import struct
+
+import numpy as np
+
+from plot import sheet_corners
+
+# largest angle around the body spanned by one facet, so the mesh follows the curvature
+max_facet_angle = np.radians(2)
+
+# maps flat points onto the body, with the rocket axis along z
+# x is measured around the body at body_radius, as on the flat board, and the points sit at surface_radius
+# returns an array with a last axis of [x, y, z]
+def wrap(points, body_radius, surface_radius):
+    points = np.asarray(points, dtype=float)
+    angle = points[..., 0] / body_radius
+    surface_radius = np.asarray(surface_radius, dtype=float)
+    return np.stack([surface_radius*np.cos(angle), surface_radius*np.sin(angle), -points[..., 1]], axis=-1)
+
+# splits the area inside a closed outline into trapezoids with horizontal top and bottom edges
+# the outline is filled even-odd, so the keyhole around the feed pin is left out as it is in KiCAD
+# returns (N, 6) array of [y0, y1, left x at y0, left x at y1, right x at y0, right x at y1]
+def trapezoids(points, slabs_per_chunk=256):
+    start = np.asarray(points, dtype=float)
+    end = np.roll(start, -1, axis=0)
+    sloped = start[:, 1] != end[:, 1]
+    start = start[sloped]
+    end = end[sloped]
+
+    low = np.minimum(start[:, 1], end[:, 1])
+    high = np.maximum(start[:, 1], end[:, 1])
+    slope = (end[:, 0] - start[:, 0]) / (end[:, 1] - start[:, 1])
+
+    # every vertex height bounds a slab, so an edge either spans a slab completely or misses it
+    heights = np.unique(np.concatenate([low, high]))
+    result = []
+    for i in range(0, len(heights) - 1, slabs_per_chunk):
+        y0 = heights[i:i + slabs_per_chunk]
+        y1 = heights[i + 1:i + slabs_per_chunk + 1]
+        y0 = y0[:len(y1)]
+
+        slab, edge = np.nonzero((low <= y0[:, None]) & (high >= y1[:, None]))
+        x0 = start[edge, 0] + (y0[slab] - start[edge, 1])*slope[edge]
+        x1 = start[edge, 0] + (y1[slab] - start[edge, 1])*slope[edge]
+
+        # pair the crossings of each slab from the left, each pair bounding a filled trapezoid
+        order = np.lexsort((x0 + x1, slab))
+        slab = slab[order]
+        x0 = x0[order]
+        x1 = x1[order]
+        rank = np.arange(len(slab)) - np.searchsorted(slab, slab)
+        left = np.nonzero(rank % 2 == 0)[0]
+        right = left + 1
+
+        result.append(np.column_stack([y0[slab[left]], y1[slab[left]], x0[left], x1[left], x0[right], x1[right]]))
+
+    if not result:
+        return np.empty((0, 6))
+    return np.concatenate(result)
+
+# points closer than this in x and y, in mm, are merged into one vertex
+merge_distance = 1e-6
+
+# merges points closer than distance to each other, returns the index of the vertex each point becomes
+# each point is keyed by its cell on a grid of that size and on the grid shifted by half a cell, in each axis,
+# so two points within half a cell of each other share at least one of the four keys
+def merge_points(points, distance=merge_distance):
+    cells = np.floor(points/distance).astype(np.int64)
+    shifted = np.floor(points/distance + 0.5).astype(np.int64)
+    keys = [np.column_stack([x[:, 0], y[:, 1]]) for x in [cells, shifted] for y in [cells, shifted]]
+    groups = [np.unique(key, axis=0, return_inverse=True)[1].reshape(-1) for key in keys]
+
+    # each point takes the smallest label of the points it shares a key with, until no label changes
+    label = np.arange(len(points))
+    changed = True
+    while changed:
+        changed = False
+        for group in groups:
+            smallest = np.full(group.max() + 1, len(points))
+            np.minimum.at(smallest, group, label)
+            if np.any(smallest[group] != label):
+                label = smallest[group]
+                changed = True
+    return np.unique(label, return_inverse=True)[1].reshape(-1)
+
+# triangulates the area inside a flat outline, cut into columns no wider than max_width
+# the trapezoids are cut on a grid of columns shared by all of them, and every vertex on a trapezoid's top or bottom
+# edge splits that edge, so triangles meet edge to edge with no vertex in the middle of another triangle's edge
+# returns (vertices, faces): (N, 2) array of flat vertices and (M, 3) array of their indices, each face anticlockwise
+def fill_faces(points, max_width):
+    traps = trapezoids(points)
+    # trapezoids of no width lie between edges running along each other and hold no copper
+    traps = traps[(traps[:, 4] > traps[:, 2]) | (traps[:, 5] > traps[:, 3])]
+
+    # each trapezoid is cut into a cell for every column it covers
+    first = np.floor(np.minimum(traps[:, 2], traps[:, 3])/max_width).astype(np.int64)
+    last = np.maximum(np.ceil(np.maximum(traps[:, 4], traps[:, 5])/max_width).astype(np.int64) - 1, first)
+    columns = last - first + 1
+    cell = np.repeat(np.arange(len(traps)), columns)
+    column = first[cell] + np.arange(len(cell)) - np.repeat(np.cumsum(columns) - columns, columns)
+    xa = column*max_width
+    xb = (column + 1)*max_width
+    y0, y1, l0, l1, r0, r1 = traps[cell].T
+
+    # t runs from 0 at y0 to 1 at y1, the left side is at l0 + t*(l1 - l0) and the right at r0 + t*(r1 - r0)
+    # a cell covers the t where the left side is left of xb and the right side right of xa
+    dl = l1 - l0
+    dr = r1 - r0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        left_xa, left_xb = (xa - l0)/dl, (xb - l0)/dl
+        right_xa, right_xb = (xa - r0)/dr, (xb - r0)/dr
+    ta = np.maximum.reduce([np.zeros(len(cell)), np.where(dl < 0, left_xb, 0), np.where(dr > 0, right_xa, 0)])
+    tb = np.minimum.reduce([np.ones(len(cell)), np.where(dl > 0, left_xb, 1), np.where(dr < 0, right_xa, 1)])
+    keep = (ta < tb) & ((dl != 0) | (l0 < xb)) & ((dr != 0) | (r0 > xa))
+    cell, xa, xb, y0, y1, l0, l1, r0, r1, ta, tb = [a[keep] for a in [cell, xa, xb, y0, y1, l0, l1, r0, r1, ta, tb]]
+    # the sides turn along the column's edges where they cross them
+    tl = np.clip(np.nan_to_num(left_xa[keep], nan=0), ta, tb)
+    tr = np.clip(np.nan_to_num(right_xb[keep], nan=0), ta, tb)
+
+    # the ends of the cell are computed exactly as the trapezoid's corners, so neighbouring cells share them
+    def y(t):
+        return np.where(t == 0, y0, np.where(t == 1, y1, y0 + t*(y1 - y0)))
+    def left(t):
+        return np.clip(np.where(t == 0, l0, np.where(t == 1, l1, l0 + t*(l1 - l0))), xa, xb)
+    def right(t):
+        return np.clip(np.where(t == 0, r0, np.where(t == 1, r1, r0 + t*(r1 - r0))), xa, xb)
+
+    # each cell is a convex polygon of up to six corners, anticlockwise from its bottom left, repeated where it has fewer
+    corners = np.stack([
+        np.column_stack([left(ta), y(ta)]),
+        np.column_stack([right(ta), y(ta)]),
+        np.column_stack([right(tr), y(tr)]),
+        np.column_stack([right(tb), y(tb)]),
+        np.column_stack([left(tb), y(tb)]),
+        np.column_stack([left(tl), y(tl)]),
+    ], axis=1)
+    index = merge_points(corners.reshape(-1, 2)).reshape(-1, 6)
+    count = index.max() + 1
+    vertices = np.zeros((count, 2))
+    vertices[index.reshape(-1)] = corners.reshape(-1, 2)
+    # each cell is fanned from its centre, a vertex of its own
+    centres = count + np.arange(len(index))
+    vertices = np.concatenate([vertices, corners.mean(axis=1)])
+
+    # the vertices on each slab's bottom and top edges, sorted along the edge, so the edges can be split at them
+    bottom = ta == 0
+    top = tb == 1
+    on_line = np.concatenate([index[bottom, 0], index[bottom, 1], index[top, 3], index[top, 4]])
+    height = np.concatenate([y0[bottom], y0[bottom], y1[top], y1[top]])
+    on_line, unique = np.unique(on_line, return_index=True)
+    height = height[unique]
+    order = np.lexsort((vertices[on_line, 0], height))
+    on_line = on_line[order]
+    position = np.zeros(count, dtype=np.int64)
+    position[on_line] = np.arange(len(on_line))
+
+    # a face from the centre to each side of the cell, the bottom and top split at every vertex along them
+    faces = [np.column_stack([centres, index[:, i], index[:, i + 1]]) for i in [1, 2, 4]]
+    faces.append(np.column_stack([centres, index[:, 5], index[:, 0]]))
+    for start, end, edge in [[0, 1, bottom], [3, 4, top]]:
+        a = position[index[edge, start]]
+        b = position[index[edge, end]]
+        pieces = np.abs(b - a)
+        owner = np.repeat(np.arange(len(a)), pieces)
+        step = np.arange(len(owner)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+        direction = np.sign(b - a)[owner]
+        here = a[owner] + step*direction
+        faces.append(np.column_stack([centres[edge][owner], on_line[here], on_line[here + direction]]))
+    faces = np.concatenate(faces)
+
+    # corners repeated where a cell has fewer than six leave faces of no area
+    faces = faces[(faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 1]) & (faces[:, 0] != faces[:, 2])]
+    return vertices, faces
+
+# the edges of faces used by only one face, which bound the area they cover, as (K, 2) array of vertex indices
+# each edge runs the way it does in its face, so an anticlockwise face has the area on its left
+def boundary_edges(faces):
+    edges = np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]])
+    unique, inverse, counts = np.unique(np.sort(edges, axis=1), axis=0, return_inverse=True, return_counts=True)
+    return edges[counts[inverse.reshape(-1)] == 1]
+
+# flips triangles so their normals point along the given directions
+def orient(triangles, directions):
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    flip = np.einsum("ij,ij->i", normals, directions) < 0
+    triangles[flip] = triangles[flip][:, ::-1]
+    return triangles
+
+# direction pointing away from the rocket axis at each triangle
+def outward(triangles):
+    centres = triangles.mean(axis=1)
+    centres[:, 2] = 0
+    return centres
+
+# builds the copper as a solid of copper_thickness on top of the substrate
+# the top, bottom and side walls share their vertices, so every edge of the mesh is shared by exactly two triangles
+# returns (M, 3, 3) array of triangles with outward normals
+def copper_mesh(spec, points, max_angle=max_facet_angle):
+    body_radius = spec["body_radius"]
+    inner = body_radius + spec["dielectric_thickness"]
+    outer = inner + spec["copper_thickness"]
+    max_width = max_angle * body_radius
+
+    vertices, faces = fill_faces(points, max_width)
+    low = wrap(vertices, body_radius, inner)
+    high = wrap(vertices, body_radius, outer)
+    top = orient(high[faces], outward(high[faces]))
+    bottom = orient(low[faces], -outward(low[faces]))
+
+    # side walls along the edges bounding the faces, facing away from the copper
+    edges = boundary_edges(faces)
+    start, end = edges[:, 0], edges[:, 1]
+    walls = np.concatenate([np.stack([low[start], low[end], high[end]], axis=1), np.stack([low[start], high[end], high[start]], axis=1)])
+
+    # the faces are anticlockwise, so the copper is on the left of each edge and the flat outward normal on its right
+    edge = vertices[end] - vertices[start]
+    length = np.maximum(np.hypot(edge[:, 0], edge[:, 1]), 1e-12)
+    normal_x = edge[:, 1] / length
+    normal_y = -edge[:, 0] / length
+    angle = (vertices[start, 0] + vertices[end, 0]) / 2 / body_radius
+    direction = np.column_stack([-np.sin(angle)*normal_x, np.cos(angle)*normal_x, -normal_y])
+    walls = orient(walls, np.concatenate([direction, direction]))
+
+    return np.concatenate([top, bottom, walls])
+
+# builds the substrate as a tube around the body covering the length of the board
+# returns (M, 3, 3) array of triangles with outward normals
+def substrate_mesh(spec, points, max_angle=max_facet_angle):
+    inner = spec["body_radius"]
+    outer = inner + spec["dielectric_thickness"]
+    sheet_top_left, sheet_bottom_right = sheet_corners(spec, points)
+    z = np.array([-sheet_bottom_right[1], -sheet_top_left[1]])
+
+    steps = int(np.ceil(2*np.pi / max_angle))
+    # the last facet ends on the angle the first starts at, so the tube closes exactly
+    a0 = np.linspace(-np.pi, np.pi, steps + 1)[:-1]
+    a1 = np.roll(a0, -1)
+
+    def ring(radius, angle, z):
+        return np.stack([radius*np.cos(angle), radius*np.sin(angle), np.full_like(angle, z)], axis=-1)
+
+    def quads(p00, p01, p11, p10):
+        return np.concatenate([np.stack([p00, p01, p11], axis=1), np.stack([p00, p11, p10], axis=1)])
+
+    outer_face = quads(ring(outer, a0, z[0]), ring(outer, a1, z[0]), ring(outer, a1, z[1]), ring(outer, a0, z[1]))
+    inner_face = quads(ring(inner, a0, z[0]), ring(inner, a1, z[0]), ring(inner, a1, z[1]), ring(inner, a0, z[1]))
+    ends = [quads(ring(inner, a0, end), ring(inner, a1, end), ring(outer, a1, end), ring(outer, a0, end)) for end in z]
+
+    outer_face = orient(outer_face, outward(outer_face))
+    inner_face = orient(inner_face, -outward(inner_face))
+    ends[0] = orient(ends[0], np.tile([0, 0, -1.0], (len(ends[0]), 1)))
+    ends[1] = orient(ends[1], np.tile([0, 0, 1.0], (len(ends[1]), 1)))
+
+    return np.concatenate([outer_face, inner_face] + ends)
+
+# writes triangles as a binary STL file, destination is a path or a binary file-like object
+def write_stl(triangles, destination, name="aperture"):
+    triangles = np.asarray(triangles, dtype=float)
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+
+    records = np.zeros(len(triangles), dtype=[("normal", "<f4", 3), ("vertices", "<f4", (3, 3)), ("attribute", "<u2")])
+    records["normal"] = normals
+    records["vertices"] = triangles
+
+    header = name.encode("ascii", "replace")[:80].ljust(80, b" ")
+    if hasattr(destination, "write"):
+        destination.write(header + struct.pack("<I", len(records)) + records.tobytes())
+    else:
+        with open(destination, "wb") as output:
+            output.write(header + struct.pack("<I", len(records)) + records.tobytes())
+
+# converts triangles to shared float32 vertices and int32 faces
+def indexed(triangles):
+    vertices, faces = np.unique(np.asarray(triangles, dtype=np.float32).reshape(-1, 3), axis=0, return_inverse=True)
+    return vertices, faces.reshape(-1, 3).astype(np.int32)
+
+# writes the meshes as a compressed .npz of indexed vertices and faces, one pair per named mesh
+def write_npz(destination, **meshes):
+    arrays = {}
+    for name in meshes:
+        arrays[name + "_vertices"], arrays[name + "_faces"] = indexed(meshes[name])
+    np.savez_compressed(destination, **arrays)
+
+# writes the conformed copper and substrate of a design as <base>_copper.stl and <base>_substrate.stl
+# and, if npz is set, both together as <base>.npz
+# returns the paths written
+def generate_mesh(spec, points, base, npz=False):
+    copper = copper_mesh(spec, points)
+    substrate = substrate_mesh(spec, points)
+
+    paths = [base + "_copper.stl", base + "_substrate.stl"]
+    write_stl(copper, paths[0], "aperture copper")
+    write_stl(substrate, paths[1], "aperture substrate")
+    if npz:
+        paths.append(base + ".npz")
+        write_npz(paths[2], copper=copper, substrate=substrate)
+    return paths
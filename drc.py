@@ -0,0 +1,238 @@
+# Checks the copper outline of a design against design rules before it is written
+# the outline is one closed polygon, where parts join it touches itself and keyhole slits run out to holes,
+# so edges may touch and run back along each other but must not cross
+# rules:
+#     self_intersection - two edges of the outline cross, where parts of the copper overlap
+#     min_width - copper narrower than the minimum width, between facing edges, between the end of an edge and
+#                 another edge, or as drawn by a component
+#     clearance - a gap narrower than the minimum clearance, between facing edges or the end of an edge and another
+#     seam - copper past the ends of the board, or closer to the copper across the seam than the clearance
+# candidate pairs of edges are found with a uniform grid, so a check takes time linear in the size of the outline
+# each violation names the components that drew the edges involved, and where they were placed
+
+import numpy as np
+
+from components import PowerSplitter2, InsetFeed
+from plot import board_circumference
+
+# fab minimums in mm, typical of a board house's standard process
+default_min_width = 0.15
+default_min_clearance = 0.15
+
+# points closer than this to a line (mm) count as lying on it
+collinear_tolerance = 1e-9
+
+# facing edges run back along each other to within this cosine
+facing_cosine = -0.9
+
+# the outline runs close to itself around every corner, so a gap between the end of an edge and an edge it does not
+# face only counts where the way round the outline from one side of the gap to the other is more than this many
+# times as long as the gap is wide
+detour = 2
+
+# widths a component is drawn with, as [name, width]
+def component_widths(component):
+    widths = []
+    if isinstance(component, PowerSplitter2):
+        widths += [["arm " + str(i), width] for i, width in enumerate(component.widths)]
+        if hasattr(component, "feed_width"):
+            widths.append(["feed", component.feed_width])
+    elif isinstance(component, InsetFeed):
+        widths.append(["feed", component.feed_width])
+    elif hasattr(component, "width"):
+        widths.append(["line", component.width])
+    return widths
+
+# describes a component and where it was placed, for reports
+def describe(component, start):
+    return type(component).__name__ + " at [" + str(round(start[0], 3)) + ", " + str(round(start[1], 3)) + "]"
+
+# pairs [i, j], i < j, of edges whose bounding boxes come within margin of each other
+# each edge is put in every grid cell its box (grown by margin/2) covers and pairs are taken within each cell
+def candidate_pairs(low, high, margin):
+    low = low - margin/2
+    high = high + margin/2
+    extent = high.max(0) - low.min(0)
+    # cells about the size of a typical edge, so most edges cover a cell or two
+    size = max(float(np.median((high - low).max(1))), margin, float(extent.max())/4096, 1e-6)
+    first = np.floor((low - low.min(0))/size).astype(np.int64)
+    last = np.floor((high - low.min(0))/size).astype(np.int64)
+    counts = last - first + 1
+    columns = int(last[:, 1].max()) + 1
+
+    # one entry per edge and cell covered
+    cells = counts[:, 0]*counts[:, 1]
+    edges = np.repeat(np.arange(len(low)), cells)
+    within = np.arange(len(edges)) - np.repeat(np.cumsum(cells) - cells, cells)
+    cx = first[edges, 0] + within // counts[edges, 1]
+    cy = first[edges, 1] + within % counts[edges, 1]
+    keys = cx*columns + cy
+
+    order = np.lexsort((edges, keys))
+    keys = keys[order]
+    edges = edges[order]
+    group_end = np.searchsorted(keys, keys, side="right")
+
+    pairs = []
+    active = np.arange(len(keys))
+    step = 1
+    while len(active):
+        active = active[active + step < group_end[active]]
+        pairs.append(np.stack([edges[active], edges[active + step]], 1))
+        step += 1
+    pairs = np.concatenate(pairs) if pairs else np.zeros((0, 2), dtype=np.int64)
+
+    # keep the boxes that really are within margin of each other, once per pair
+    i, j = pairs[:, 0], pairs[:, 1]
+    close = np.all((low[i] <= high[j]) & (low[j] <= high[i]), axis=1) & (i != j)
+    pairs = np.sort(pairs[close], axis=1)
+    return np.unique(pairs, axis=0)
+
+def cross(a, b):
+    return a[..., 0]*b[..., 1] - a[..., 1]*b[..., 0]
+
+# distance from points to segments from p to q, and the closest points on the segments
+def point_segment(points, p, q):
+    d = q - p
+    t = np.clip(np.sum((points - p)*d, -1)/np.maximum(np.sum(d*d, -1), 1e-300), 0, 1)
+    closest = p + t[..., None]*d
+    return np.linalg.norm(points - closest, axis=-1), closest
+
+# checks the outline of a tree against the rules, returns a list of violations
+# each violation is a dictionary of the rule, its location [x, y], the value found and the limit it broke,
+# and the components that drew the copper involved
+def check(spec, tree, min_width=default_min_width, min_clearance=default_min_clearance):
+    points, owners = tree.plot_with_owners([0, 0])
+    owner = np.repeat(np.arange(len(owners)), [count for component, start, count in owners])
+    violations = []
+
+    def violation(rule, location, value, limit, point_indices):
+        names = []
+        for index in point_indices:
+            component, start = owners[owner[index]][:2]
+            if describe(component, start) not in names:
+                names.append(describe(component, start))
+        violations.append({"rule": rule, "location": [float(location[0]), float(location[1])], "value": float(value), "limit": float(limit), "components": names})
+
+    # widths as drawn, which catches lines too narrow to show up as facing edges, such as those of no width at all
+    checked = set()
+    for component, start, count in owners:
+        if id(component) in checked:
+            continue
+        checked.add(id(component))
+        for name, width in component_widths(component):
+            if not width >= min_width:
+                violations.append({"rule": "min_width", "location": [float(start[0]), float(start[1])], "value": float(width), "limit": min_width, "components": [describe(component, start) + " (" + name + ")"]})
+
+    # edges from each point to the next, leaving out those of no length
+    # along is how far round the outline each edge starts
+    p = points
+    q = np.roll(points, -1, axis=0)
+    length = np.linalg.norm(q - p, axis=1)
+    along = np.cumsum(length) - length
+    perimeter = float(np.sum(length))
+    keep = np.nonzero(length > 0)[0]
+    p, q, length, along = p[keep], q[keep], length[keep], along[keep]
+    n = len(keep)
+    direction = (q - p)/length[:, None]
+
+    # the interior is to the left of each edge when the outline runs anticlockwise
+    area = np.sum(cross(p, q))/2
+    inside_left = area > 0
+
+    margin = max(min_width, min_clearance)
+    pairs = candidate_pairs(np.minimum(p, q), np.maximum(p, q), margin)
+    i, j = pairs[:, 0], pairs[:, 1]
+    # neighbouring edges share a point
+    neighbours = (j - i == 1) | ((i == 0) & (j == n - 1))
+    i, j = i[~neighbours], j[~neighbours]
+
+    # edges cross where each has the ends of the other strictly either side of it, measured as distances so
+    # ends lying on the other edge, where parts join, do not count
+    o1 = cross(direction[i], p[j] - p[i])
+    o2 = cross(direction[i], q[j] - p[i])
+    o3 = cross(direction[j], p[i] - p[j])
+    o4 = cross(direction[j], q[i] - p[j])
+    apart = [np.abs(o) > collinear_tolerance for o in [o1, o2, o3, o4]]
+    crossing = (o1*o2 < 0) & (o3*o4 < 0) & apart[0] & apart[1] & apart[2] & apart[3]
+    for a, b, t in zip(i[crossing], j[crossing], o1[crossing]/(o1 - o2)[crossing]):
+        location = p[b] + t*(q[b] - p[b])
+        violation("self_intersection", location, 0, 0, [keep[a], keep[b]])
+
+    # facing edges run back along each other, overlapping when one is projected onto the other
+    facing = np.sum(direction[i]*direction[j], 1) < facing_cosine
+    along_start = np.sum((p[j] - p[i])*direction[i], 1)
+    along_end = np.sum((q[j] - p[i])*direction[i], 1)
+    overlap = np.minimum(length[i], np.maximum(along_start, along_end)) - np.maximum(0, np.minimum(along_start, along_end))
+    facing &= (overlap > 1e-6) & ~crossing
+    others = ~facing & ~crossing
+    end_edges = np.concatenate([i[others], j[others]])
+    other_edges = np.concatenate([j[others], i[others]])
+    i, j = i[facing], j[facing]
+
+    distance_p, closest_p = point_segment(p[j], p[i], q[i])
+    distance_q, closest_q = point_segment(q[j], p[i], q[i])
+    distance_i, closest_i = point_segment(p[i], p[j], q[j])
+    distance_iq, closest_iq = point_segment(q[i], p[j], q[j])
+    distances = np.stack([distance_p, distance_q, distance_i, distance_iq], 1)
+    nearest = np.argmin(distances, 1)
+    distance = distances[np.arange(len(i)), nearest]
+    ends = np.stack([p[j], q[j], p[i], q[i]], 1)[np.arange(len(i)), nearest]
+    closest = np.stack([closest_p, closest_q, closest_i, closest_iq], 1)[np.arange(len(i)), nearest]
+
+    # copper lies between the edges if the other edge is on the inside of this one
+    side = cross(direction[i], (p[j] + q[j])/2 - p[i])
+    copper = (side > 0) == inside_left
+    # edges lying along each other, at no distance, are slits in the outline or lines drawn with no width,
+    # which the widths as drawn already cover
+    narrow = (distance > collinear_tolerance) & np.where(copper, distance < min_width, distance < min_clearance)
+    for a, b, d, is_copper, end, near in zip(i[narrow], j[narrow], distance[narrow], copper[narrow], ends[narrow], closest[narrow]):
+        rule, limit = ("min_width", min_width) if is_copper else ("clearance", min_clearance)
+        violation(rule, (end + near)/2, d, limit, [keep[a], keep[b]])
+
+    # the start of each edge against the edges it does not face, which catches the end of a line beside the corner of
+    # an edge perpendicular to it, where no edges face each other across the gap
+    # each gap is reported once, at its narrowest, however many ends and edges meet across it
+    a, b = end_edges, other_edges
+    distance, closest = point_segment(p[a], p[b], q[b])
+    detour_length = np.abs(along[a] - along[b] - np.linalg.norm(closest - p[b], axis=1))
+    detour_length = np.minimum(detour_length, perimeter - detour_length)
+    copper = (cross(direction[b], p[a] - p[b]) > 0) == inside_left
+    narrow = (distance > collinear_tolerance) & (detour_length > detour*distance) & np.where(copper, distance < min_width, distance < min_clearance)
+    gaps = set()
+    for index in np.nonzero(narrow)[0][np.argsort(distance[narrow], kind="stable")]:
+        end, near = p[a[index]], closest[index]
+        middle = (round(float(end[0] + near[0])/2, 6), round(float(end[1] + near[1])/2, 6))
+        if a[index] in gaps or middle in gaps:
+            continue
+        # a gap running along one edge, as where a line steps to a narrower one at a slit, is that edge, not a gap
+        # (along the two edges of a slit it is a gap, as the slit has no width)
+        if np.sum(point_segment(np.array(middle), p, q)[0] < collinear_tolerance) % 2:
+            continue
+        gaps.update([a[index], middle])
+        rule, limit = ("min_width", min_width) if copper[index] else ("clearance", min_clearance)
+        violation(rule, middle, distance[index], limit, [keep[a[index]], keep[b[index]]])
+
+    # the board's ends meet at the seam, so copper must stay inside them and clear of the copper across the seam
+    half = board_circumference(spec)/2
+    outside = np.nonzero(np.abs(points[:, 0]) > half)[0]
+    reported = set()
+    for index in outside:
+        if owner[index] not in reported:
+            reported.add(owner[index])
+            violation("seam", points[index], abs(points[index, 0]) - half, 0, [index])
+    if not len(outside):
+        left = int(np.argmin(points[:, 0]))
+        right = int(np.argmax(points[:, 0]))
+        gap = 2*half - (points[right, 0] - points[left, 0])
+        if gap < min_clearance:
+            violation("seam", [half, points[right, 1]], gap, min_clearance, [right, left])
+
+    return violations
+
+# counts of violations by rule
+def counts(violations):
+    result = {}
+    for item in violations:
+        result[item["rule"]] = result.get(item["rule"], 0) + 1
+    return result
@@ -0,0 +1,203 @@
+# Array versions of the functions in em_calcs.py
+# every argument may be a number or a numpy array, arrays broadcast against each other
+# results match the scalar functions, which take a single spec dict instead
+
+import numpy as np
+
+from em_calcs import c
+
+# calculates wavelength in mm
+def wavelength(frequency, dielectric_constant):
+    f = np.asarray(frequency, dtype=float)
+    k = np.asarray(dielectric_constant, dtype=float)
+    return c / f / np.sqrt(k)
+
+############################## microstrip transmission lines ##############################
+
+# takes line width, dielectric constant and thickness
+# returns effective dielectric constant of the microstrip line
+# narrow (width/h < 1) and wide lines use different formulas, selected with a mask
+def effective_dielectric_constant(width, dielectric_constant, dielectric_thickness):
+    width = np.asarray(width, dtype=float)
+    k = np.asarray(dielectric_constant, dtype=float)
+    h = np.asarray(dielectric_thickness, dtype=float)
+
+    narrow = width/h < 1
+    wide_keff = (k+1)/2 + (k-1)/ (2*np.sqrt(1+12*h/width))
+    narrow_keff = (k+1)/2 + (k-1)/2*(1/np.sqrt(1+12*h/width) + 0.04*(1-width/h)**2 )
+
+    return np.where(narrow, narrow_keff, wide_keff)
+
+# takes line width in mm, frequency, dielectric constant and thickness
+# returns effective wavelength in the microstrip line in mm
+def effective_wavelength(width, frequency, dielectric_constant, dielectric_thickness):
+    f = np.asarray(frequency, dtype=float)
+    keff = effective_dielectric_constant(width, dielectric_constant, dielectric_thickness)
+    return c / f / np.sqrt(keff)
+
+# takes width in mm, dielectric constant and thickness
+# returns impedance in ohms of microstrip line
+def microstrip_impedance(width, dielectric_constant, dielectric_thickness):
+    width = np.asarray(width, dtype=float)
+    h = np.asarray(dielectric_thickness, dtype=float)
+
+    narrow = width/h < 1
+    keff = effective_dielectric_constant(width, dielectric_constant, h)
+
+    narrow_z = 60/np.sqrt(keff)*np.log(8*h/width + 0.25*width/h)
+    wide_z = 120*np.pi / np.sqrt(keff) / (width/h +1.393+2/3*np.log(width/h+1.444))
+
+    return np.where(narrow, narrow_z, wide_z)
+
+# closed form estimate of the width for impedance z, see em_calcs.microstrip_width_estimate
+def microstrip_width_estimate(z, h, k):
+    z = np.asarray(z, dtype=float)
+    h = np.asarray(h, dtype=float)
+    k = np.asarray(k, dtype=float)
+
+    a = z/60*np.sqrt((k+1)/2) + (k-1)/(k+1)*(0.23 + 0.11/k)
+    with np.errstate(over="ignore", divide="ignore", invalid="ignore"):
+        u = np.where(a < 350, 8*np.exp(a) / (np.exp(2*a) - 2), 8*np.exp(-a))
+        b = 60*np.pi**2 / (z*np.sqrt(k))
+        wide = 2/np.pi*(b - 1 - np.log(2*b - 1) + (k-1)/(2*k)*(np.log(b - 1) + 0.39 - 0.61/k))
+    u = np.where((u > 2) | (u <= 0), np.where(b > 1, wide, 0), u)
+    u = np.where(u <= 0, 1, u)
+    return u*h
+
+# takes desired impedance in ohms, dielectric constant and thickness
+# returns required line width in mm, accurate to within tolerance ohms, nan where no width between h/1e6 and h*1e4
+# has the impedance
+# every width is solved at once as em_calcs.microstrip_width solves one, with Newton steps (here in log width) that
+# fall back to bisection, and impedances in the step at width = h give the width at the step
+# each step only evaluates the widths that have not yet converged
+def microstrip_width(impedance, dielectric_constant, dielectric_thickness, tolerance=1e-6):
+    z, k, h = np.broadcast_arrays(*[np.asarray(a, dtype=float) for a in [impedance, dielectric_constant, dielectric_thickness]])
+    shape = z.shape
+    z, k, h = z.ravel(), k.ravel(), h.ravel()
+    width = np.full(z.shape, np.nan)
+
+    # no width has an impedance inside the step
+    step_ends = [microstrip_impedance(h, k, h), microstrip_impedance(h*(1 - 1e-12), k, h)]
+    in_step = (np.minimum(*step_ends) <= z) & (z <= np.maximum(*step_ends))
+    width[in_step] = h[in_step]
+
+    # impedance falls as width grows, so the log widths low and high bracket the target
+    low = np.log(h*1e-6)
+    high = np.log(h*1e4)
+    found = (microstrip_impedance(np.exp(low), k, h) > z) & (microstrip_impedance(np.exp(high), k, h) < z)
+
+    active = np.flatnonzero(found & ~in_step)
+    z, k, h, low, high = z[active], k[active], h[active], low[active], high[active]
+    x = np.clip(np.log(microstrip_width_estimate(z, h, k)), low, high)
+    previous_error = np.full(x.shape, np.inf)
+    for i in range(100):
+        error = microstrip_impedance(np.exp(x), k, h) - z
+        done = (np.abs(error) < tolerance) | (high - low < 1e-12)
+        width[active[done]] = np.exp(x[done])
+        remaining = ~done
+        if not np.any(remaining):
+            break
+        active, z, k, h, low, high, x, error, previous_error = [a[remaining] for a in [active, z, k, h, low, high, x, error, previous_error]]
+        low = np.where(error > 0, x, low)
+        high = np.where(error > 0, high, x)
+
+        # bisect where the step leaves the bracket or the error has stopped falling
+        dx = 1e-7
+        slope = (microstrip_impedance(np.exp(x + dx), k, h) - microstrip_impedance(np.exp(x - dx), k, h))/(2*dx)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            newton = x - error/slope
+        bisect = ~((low < newton) & (newton < high)) | (np.abs(error) > np.abs(previous_error)/2)
+        x = np.where(bisect, (low + high)/2, newton)
+        previous_error = error
+
+    return width.reshape(shape)
+
+# takes line width and dielectric thickness and calculates corner dimensions for ideal bend
+# see em_calcs.mitred_corner
+def mitred_corner(width, dielectric_thickness):
+    width = np.asarray(width, dtype=float)
+    h = np.asarray(dielectric_thickness, dtype=float)
+    x = width * np.sqrt(2) * (0.52 + 0.65*np.exp(-1.35*width/h))
+    return x * np.sqrt(2) - width
+
+############################## patch antennas ##############################
+
+# length of a patch of given width, shared by microstrip_patch and square_patch
+def _patch_length(width, f, k, h):
+    keff = (k+1)/2 + (k-1)/ (2*np.sqrt(1+12*h/width))
+    return c / (2*f*np.sqrt(keff)) - 2*0.412*h*(keff+0.3)*(width/h+0.264)/(k - 0.258)/(width/h+0.8)
+
+# resonant frequency of a patch of given width and length, the inverse of _patch_length
+# takes width and length in mm, dielectric constant and thickness
+def patch_resonant_frequency(width, length, dielectric_constant, dielectric_thickness):
+    width = np.asarray(width, dtype=float)
+    length = np.asarray(length, dtype=float)
+    k = np.asarray(dielectric_constant, dtype=float)
+    h = np.asarray(dielectric_thickness, dtype=float)
+
+    keff = (k+1)/2 + (k-1)/ (2*np.sqrt(1+12*h/width))
+    extension = 2*0.412*h*(keff+0.3)*(width/h+0.264)/(k - 0.258)/(width/h+0.8)
+    return c / (2*np.sqrt(keff)*(length + extension))
+
+# calculates patch dimensions for simple edge fed linear polarised patch
+# returns [width, length] arrays, patch_length overrides the length like the spec option
+def microstrip_patch(frequency, dielectric_constant, dielectric_thickness, patch_length=None):
+    f = np.asarray(frequency, dtype=float)
+    k = np.asarray(dielectric_constant, dtype=float)
+    h = np.asarray(dielectric_thickness, dtype=float)
+
+    width = c / (2*f*np.sqrt((k+1)/2))
+    length = _patch_length(width, f, k, h)
+
+    # override
+    if patch_length is not None:
+        length = np.asarray(patch_length, dtype=float)
+
+    return np.broadcast_arrays(width, length)
+
+# similar to above, but for a square patch
+def square_patch(frequency, dielectric_constant, dielectric_thickness, patch_length=None):
+    f = np.asarray(frequency, dtype=float)
+    k = np.asarray(dielectric_constant, dtype=float)
+    h = np.asarray(dielectric_thickness, dtype=float)
+
+    width = c / (2*f*np.sqrt(k)) # first pass width
+    length = _patch_length(width, f, k, h)
+
+    # override, broadcast against the substrate so the patch has the shape it would without it
+    if patch_length is not None:
+        length = np.broadcast_arrays(np.asarray(patch_length, dtype=float), length)[0]
+
+    return np.broadcast_arrays(length, length)
+
+# takes patch width, frequency, dielectric constant and thickness
+# returns approximate maximum edge impedance at resonance
+def microstrip_patch_impedance(width, frequency, dielectric_constant, dielectric_thickness):
+    width = np.asarray(width, dtype=float)
+    k = np.asarray(dielectric_constant, dtype=float)
+    h = np.asarray(dielectric_thickness, dtype=float)
+
+    y = wavelength(frequency, k)
+
+    g = (width/(120*y))*(1-((1/24)*(k*h)**2))
+
+    return np.abs(1/2/g)
+
+# takes desired impedance, frequency, dielectric constant and thickness
+# returns inset distance required to match a linear patch
+# patch_length and inset_distance act as the spec overrides do
+def inset_distance(zin, frequency, dielectric_constant, dielectric_thickness, patch_length=None, inset_distance=None):
+    width, length = microstrip_patch(frequency, dielectric_constant, dielectric_thickness, patch_length)
+
+    zedge = microstrip_patch_impedance(width, frequency, dielectric_constant, dielectric_thickness)
+
+    # no inset can match an impedance above the edge impedance
+    zin = np.asarray(zin, dtype=float)
+    with np.errstate(invalid="ignore"):
+        dist = np.where(zin <= zedge, length / np.pi * np.arccos(np.sqrt(zin/zedge)), np.nan)
+
+    # override
+    if inset_distance is not None:
+        dist = np.broadcast_to(np.asarray(inset_distance, dtype=float), dist.shape)
+
+    return dist
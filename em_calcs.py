@@ -1,12 +1,12 @@
 # Contains functions for calculating impedances, wavelengths etc.
 
 from cmath import pi
+from functools import lru_cache
+from math import acos
 from math import exp
 from math import sqrt
 from math import log
 
-from numpy import arccos
-
 c = 3e11 # mm/s
 
 # calculates wavelength in mm
@@ -58,34 +58,126 @@ def microstrip_impedance(width, spec):
         return 120*pi / sqrt(keff) / (width/h +1.393+2/3*log(width/h+1.444))
     
 
+# how much work microstrip_width has done, read by profiling.py
+# calls counts every request and hits those answered from the cache, the rest are either looked up or solved
+# iterations the solver steps taken and bisections those that fell back to bisecting
+# and steps the requests, cached or not, whose impedance fell in the step of microstrip_impedance at width = h,
+# so missed the tolerance
+counters = {"microstrip_width_calls": 0, "microstrip_width_hits": 0, "microstrip_width_solves": 0, "microstrip_width_iterations": 0, "microstrip_width_bisections": 0, "microstrip_width_lookups": 0, "microstrip_width_steps": 0}
+
+# substrate tables widths are looked up in instead of being solved for, set by substrate_tables.use
+# lookups count the widths found in them to within the tolerance
+tables = None
+
 # takes desired impedance in ohms and spec data
-# returns required line width in mm or 0 if not found
-# uses binary search based on microstrip_impedance
-def microstrip_width(zt, spec):
+# returns required line width in mm, accurate to within tolerance ohms
+# except: microstrip_impedance steps at width = h, by up to about 0.3 ohm (see impedance_step), and no width has an
+# impedance inside the step, so for those impedances the width at the step is returned and the tolerance is not met
+# these are counted in counters["microstrip_width_steps"]; with strict they raise ValueError instead, and the widths
+# are always solved for rather than looked up, as substrate tables are only accurate to substrate_tables.accuracy
+# widths looked up in substrate tables are checked against the tolerance too, and solved for when they miss it
+# raises ValueError if no width can be found
+def microstrip_width(zt, spec, tolerance=1e-6, strict=False):
     h = spec["dielectric_thickness"]
     k = spec["dielectric_constant"]
     t = spec["copper_thickness"]
+    # a request the cache answers neither looks the width up nor solves for it
+    # cheaper than comparing _microstrip_width.cache_info() before and after, which would double the cost of a hit
+    misses = counters["microstrip_width_lookups"] + counters["microstrip_width_solves"]
+    width, stepped = _microstrip_width(zt, h, k, t, tolerance, strict)
+    counters["microstrip_width_calls"] += 1
+    if counters["microstrip_width_lookups"] + counters["microstrip_width_solves"] == misses:
+        counters["microstrip_width_hits"] += 1
+    if stepped:
+        counters["microstrip_width_steps"] += 1
+    return width
+
+# the impedances either side of the step in microstrip_impedance at width = h, as [wide side, narrow side]
+# the wide formula holds at width = h and the narrow one just below it
+def impedance_step(spec):
+    h = spec["dielectric_thickness"]
+    return [microstrip_impedance(h, spec), microstrip_impedance(h*(1 - 1e-12), spec)]
+
+# closed form estimate of the width for impedance z, used as the solver starting point
+# formula source: Hammerstad, E O 1975, "Equations for Microstrip Circuit Design"
+def microstrip_width_estimate(z, h, k):
+    a = z/60*sqrt((k+1)/2) + (k-1)/(k+1)*(0.23 + 0.11/k)
+    if a < 350: # exp(2a) overflows above this, the line is very narrow anyway
+        u = 8*exp(a) / (exp(2*a) - 2)
+    else:
+        u = 8*exp(-a)
+    if u > 2 or u <= 0:
+        b = 60*pi**2 / (z*sqrt(k))
+        u = 2/pi*(b - 1 - log(2*b - 1) + (k-1)/(2*k)*(log(b - 1) + 0.39 - 0.61/k)) if b > 1 else 0
+    if u <= 0:
+        u = 1
+    return u*h
+
+# solver behind microstrip_width, cached on (z, h, k, t) as the same lines are requested many times
+# Newton steps on microstrip_impedance, falling back to bisection whenever a step leaves the bracket
+# returns [width, whether the impedance fell in the step], the counters that depend on the cache are kept by
+# microstrip_width
+@lru_cache(maxsize=1024)
+def _microstrip_width(zt, h, k, t, tolerance, strict=False):
+    if not zt > 0:
+        raise ValueError("Cannot find microstrip width for impedance " + str(zt) + " ohm")
+    spec = {"dielectric_thickness": h, "dielectric_constant": k}
+    width = None
+    if tables is not None and not strict:
+        width = tables.microstrip_width(zt, h, k, t)
+        if width is not None and abs(microstrip_impedance(width, spec) - zt) < tolerance:
+            counters["microstrip_width_lookups"] += 1
+            return width, False
+    counters["microstrip_width_solves"] += 1
+
+    # a looked up width that missed the tolerance is still the best place to start
+    if width is None:
+        width = microstrip_width_estimate(zt, h, k)
+
+    # impedance falls as width grows, so widen the bracket until it holds the target
+    low = width
+    high = width
+    for i in range(64):
+        if microstrip_impedance(low, spec) > zt: break
+        low /= 2
+    else:
+        raise ValueError("No microstrip width found for impedance " + str(zt) + " ohm, it is too high for this substrate")
+    for i in range(64):
+        if microstrip_impedance(high, spec) < zt: break
+        high *= 2
+    else:
+        raise ValueError("No microstrip width found for impedance " + str(zt) + " ohm, it is too low for this substrate")
 
-    # starting points
-    low = 0.1
-    high = 5
-
-    # somewhat arbitrary parameters
-    acceptable_error = 0.5 # ohm
     max_runs = 100
-    
+    previous_error = float("inf")
     for i in range(max_runs):
-        mid = (low + high)/2
-        z = microstrip_impedance(mid, spec)
-
-        if abs(z - zt) < acceptable_error:
-            return mid
-        elif z > zt:
-            low = mid
+        counters["microstrip_width_iterations"] += 1
+        error = microstrip_impedance(width, spec) - zt
+        if abs(error) < tolerance:
+            return width, False
+        if error > 0:
+            low = width
         else:
-            high = mid 
-    
-    return 0 # not found
+            high = width
+
+        # the impedance formula steps slightly at width = h, so a root may not exist to tolerance
+        # the bracket then closes onto the step, which is the best available answer
+        if high - low < 1e-12*high:
+            if strict:
+                raise ValueError("No microstrip width found for impedance " + str(zt) + " ohm to within " + str(tolerance) + " ohm, it falls in the step of the impedance formula at width = dielectric_thickness, the closest is " + str(zt + error) + " ohm")
+            return width, True
+
+        step = width*1e-7
+        slope = (microstrip_impedance(width + step, spec) - microstrip_impedance(width - step, spec)) / (2*step)
+        width = width - error/slope if slope < 0 else low
+
+        # bisect when the step leaves the bracket or the error has stopped falling
+        if not low < width < high or abs(error) > abs(previous_error)/2:
+            counters["microstrip_width_bisections"] += 1
+            width = (low + high)/2
+        previous_error = error
+
+    raise ValueError("Microstrip width for impedance " + str(zt) + " ohm did not converge")
 
 
 # takes line width and spec and calculates corner dimensions for ideal bend
@@ -158,6 +250,10 @@ def microstrip_patch_impedance(spec, width):
 
     g = (width/(120*y))*(1-((1/24)*(k*h)**2))
 
+    # override
+    if "patch_impedance" in spec:
+        return spec["patch_impedance"]
+
     return abs(1/2/g)
 
 # takes desired impedance and patch edge impedance
@@ -172,7 +268,8 @@ def inset_distance(spec, zin):
 
     length = patch_dimensions[1]
 
-    dist = length / pi * arccos(sqrt(zin/zedge))
+    # no inset can match an impedance above the edge impedance
+    dist = length / pi * acos(sqrt(zin/zedge)) if zin <= zedge else float("nan")
 
     # override
     if "inset_distance" in spec:
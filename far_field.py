@@ -0,0 +1,160 @@
+# Estimates the far-field gain pattern of the conformal array
+# each patch is modelled by the cavity model of a rectangular patch: two radiating edges a patch length apart,
+# facing out from the body, with nothing radiated behind the patch's own ground plane
+# the patterns are summed with the phase of each patch's position on the cylinder, fed in phase
+# gains are directivities, that is the gain of a lossless array
+
+from functools import lru_cache
+
+import numpy as np
+
+from components import LinearPatch, SquarePatch
+from em_calcs import c
+
+# spacing of the table each element pattern is cached on, in azimuth
+table_step = np.radians(0.25)
+
+# patches summed together in one step of far_field
+patches_per_chunk = 4
+
+# sinc(x) = sin(x)/x
+def sinc(x):
+    return np.sinc(x/np.pi)
+
+# the patches of a design, found by walking its component tree
+# returns azimuth (radians) and axial position (mm) of each patch centre, and the patch components
+def patch_positions(spec, tree):
+    angles = []
+    heights = []
+    patches = []
+    for component, start in tree.placements():
+        if isinstance(component, (LinearPatch, SquarePatch)):
+            centre = component.translate([component.length/2, 0], start)
+            angles.append(centre[0]/spec["body_radius"])
+            heights.append(-centre[1])
+            patches.append(component)
+    return np.array(angles), np.array(heights), patches
+
+# field of one patch facing along +x at the origin, tabulated over theta and a fine azimuth table
+# cached per frequency, substrate and patch, so repeated designs and sweeps reuse the table
+# returns e_theta and e_phi, each (len(theta), len(azimuths)) complex
+@lru_cache(maxsize=32)
+def element_table(frequency, radius, width, length, polarisation, theta):
+    theta = np.array(theta)[:, None]
+    phi = np.arange(0, 2*np.pi, table_step)[None, :]
+    k0 = 2*np.pi*frequency/c
+
+    # direction cosines along the patch normal (x), around the body (y) and along the axis (z)
+    a = np.sin(theta)*np.cos(phi)
+    v = np.sin(theta)*np.sin(phi)
+    u = np.cos(theta)*np.ones_like(phi)
+
+    # mode resonant along the axis, its radiating edges are magnetic currents around the body (y)
+    # E is along r x y = cos(theta) sin(phi) phi - cos(phi) theta, the axis direction at broadside
+    axial = sinc(k0*width*v/2)*np.cos(k0*length*u/2)
+    e_theta = -axial*np.cos(phi)
+    e_phi = axial*np.cos(theta)*np.sin(phi)
+
+    if polarisation != 0:
+        # mode resonant around the body, edges along the axis (z), in quadrature for circular polarisation
+        # E is along r x z = -sin(theta) phi, and polarisation 1 gives right hand circular at broadside
+        around = sinc(k0*width*u/2)*np.cos(k0*length*v/2)
+        e_phi = e_phi - 1j*polarisation*around*(-np.sin(theta))
+
+    # no radiation behind the patch, where the body shadows it
+    front = a > 0
+    phase = np.exp(1j*k0*radius*a)
+    return np.where(front, e_theta*phase, 0), np.where(front, e_phi*phase, 0)
+
+# the gain pattern of an array over a theta/phi grid
+class FarField:
+    def __init__(self, theta, phi, e_theta, e_phi):
+        self.theta = theta
+        self.phi = phi
+        self.e_theta = e_theta
+        self.e_phi = e_phi
+
+        intensity = np.abs(e_theta)**2 + np.abs(e_phi)**2
+        # integrate over the sphere with the trapezium rule in theta, phi wraps around
+        weights = np.sin(theta)[:, None]*np.gradient(theta)[:, None]*(2*np.pi/len(phi))
+        self.gain = 4*np.pi*intensity/np.sum(intensity*weights)
+        self.weights = weights
+
+    # gain in dBi, exact nulls are floored at -100 dBi
+    def gain_db(self):
+        return 10*np.log10(np.maximum(self.gain, 1e-10))
+
+    # ratio of the major to minor axis of the polarisation ellipse, in dB, nan where there is no field
+    def axial_ratio_db(self):
+        right = np.abs(self.e_theta + 1j*self.e_phi)
+        left = np.abs(self.e_theta - 1j*self.e_phi)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return 20*np.log10((right + left)/np.abs(right - left))
+
+    # gain in dB around the roll plane, perpendicular to the rocket axis
+    def roll_plane(self):
+        i = np.argmin(np.abs(self.theta - np.pi/2))
+        return self.gain_db()[i]
+
+    # fraction of the sphere where the gain is at least threshold dBi
+    def coverage(self, threshold=-10):
+        return float(np.sum(self.weights*(self.gain_db() >= threshold)) / (4*np.pi))
+
+    # azimuths of nulls in the roll plane, minima at least depth dB below the roll plane peak
+    def nulls(self, depth=20):
+        roll = self.roll_plane()
+        minimum = (roll <= np.roll(roll, 1)) & (roll <= np.roll(roll, -1)) & (roll < roll.max() - depth)
+        return np.degrees(self.phi[minimum])
+
+    def summary(self, null_depth=20, coverage_threshold=-10):
+        roll = self.roll_plane()
+        result = {
+            "peak_gain": float(self.gain_db().max()),
+            "roll_plane_max": float(roll.max()),
+            "roll_plane_min": float(roll.min()),
+            "roll_plane_ripple": float(roll.max() - roll.min()),
+            "nulls": [float(angle) for angle in self.nulls(null_depth)],
+            "coverage": self.coverage(coverage_threshold),
+        }
+        i = np.argmin(np.abs(self.theta - np.pi/2))
+        axial_ratio = self.axial_ratio_db()[i]
+        result["roll_plane_axial_ratio_min"] = float(np.nanmin(axial_ratio))
+        result["roll_plane_axial_ratio_max"] = float(np.nanmax(axial_ratio))
+        return result
+
+# computes the far field of a design over a grid with steps in degrees
+# theta is measured from the rocket axis (nose direction) and phi around it from the feed pin
+def far_field(spec, tree, theta_step=1, phi_step=1):
+    theta = np.radians(np.arange(0, 180 + theta_step/2, theta_step))
+    phi = np.radians(np.arange(0, 360, phi_step))
+
+    angles, heights, patches = patch_positions(spec, tree)
+    if not patches:
+        raise ValueError("The design has no patches")
+
+    # every patch in an array is the same, so one table serves them all
+    patch = patches[0]
+    polarisation = getattr(patch, "polarisation", 0)
+    radius = spec["body_radius"] + spec["dielectric_thickness"]
+    table_theta, table_phi = element_table(spec["frequency"], radius, patch.width, patch.length, polarisation, tuple(theta))
+
+    # look up each patch's pattern at its azimuth relative to the patch, interpolating the table
+    relative = np.mod(phi[None, :] - angles[:, None], 2*np.pi) / table_step
+    below = np.floor(relative).astype(int)
+    fraction = relative - below
+    below = below % table_theta.shape[1]
+    above = (below + 1) % table_theta.shape[1]
+
+    k0 = 2*np.pi*spec["frequency"]/c
+    axial_phase = np.exp(1j*k0*heights[:, None]*np.cos(theta)[None, :]) # (patches, theta)
+
+    # patches are summed a few at a time, the (theta, patches, phi) arrays are too big to be quick all at once
+    e_theta = np.zeros((len(theta), len(phi)), dtype=complex)
+    e_phi = np.zeros((len(theta), len(phi)), dtype=complex)
+    for i in range(0, len(angles), patches_per_chunk):
+        part = slice(i, i + patches_per_chunk)
+        for table, total in [(table_theta, e_theta), (table_phi, e_phi)]:
+            samples = table[:, below[part]]*(1 - fraction[part]) + table[:, above[part]]*fraction[part] # (theta, patches, phi)
+            total += np.einsum("tpf,pt->tf", samples, axial_phase[part])
+
+    return FarField(theta, phi, e_theta, e_phi)
@@ -0,0 +1,134 @@
+# Writes the Gerber (RS-274X with X2 attributes) and Excellon drill files a board house makes the board from
+# F.Cu is the copper outline as one region, B.Cu a ground plane over the whole board with an anti-pad cleared
+# around each feed pin, Edge.Cuts the board's edge and the drill file a hole for each feed pin
+# the feed pin is where PowerSplitter2_pinfeed is placed, drilled hole_size across, which fits inside the diamond
+# the splitter leaves in the copper; arrays of a single patch are fed by a line to the edge and have no pin
+# coordinates are those of the DXF: mm from the feed point, y up
+# files are named as KiCAD plots them: <name>-F_Cu.gbr, <name>-B_Cu.gbr, <name>-Edge_Cuts.gbr and <name>-NPTH.drl
+
+import numpy as np
+
+from components import PowerSplitter2_pinfeed
+from plot import chunk_size, output_file, sheet_corners
+
+# ground plane cleared around a feed pin beyond the edge of its hole, in mm
+antipad_clearance = 0.5
+
+# width of the line the board edge is drawn with, in mm
+edge_width = 0.1
+
+# coordinates are written as integers of a millionth of a mm, with 4 integer and 6 decimal digits
+gerber_scale = 1e6
+gerber_point = "X{}Y{}D01*\n"
+
+# the header of a Gerber file, function is the value of its FileFunction attribute
+def gerber_header(function):
+    return (
+        "%TF.GenerationSoftware,CUSF,Aperture*%\n"
+        "%TF.SameCoordinates,Original*%\n"
+        "%TF.FileFunction," + function + "*%\n"
+        "%TF.FilePolarity,Positive*%\n"
+        "%FSLAX46Y46*%\n"
+        "%MOMM*%\n"
+        "%LPD*%\n"
+        "G01*\n"
+    )
+
+gerber_footer = "M02*\n"
+
+# formats a point as Gerber coordinates, y flipped as in the DXF
+def gerber_coordinates(x, y):
+    return "X" + str(int(round(x*gerber_scale))) + "Y" + str(int(round(-y*gerber_scale)))
+
+# writes a closed outline as a region: a move to its first point, a draw to each point after it and back to the first
+def write_region(output, points):
+    points = np.asarray(points, dtype=float)
+    output.write("G36*\n" + gerber_coordinates(*points[0]) + "D02*\n")
+    for i in range(1, len(points), chunk_size):
+        chunk = np.rint(points[i:i + chunk_size]*[gerber_scale, -gerber_scale]).astype(np.int64).tolist()
+        output.write("".join([gerber_point.format(x, y) for x, y in chunk]))
+    output.write(gerber_coordinates(*points[0]) + "D01*\nG37*\n")
+
+# the corners of the board as an outline
+def board_outline(spec, points):
+    (left, top), (right, bottom) = sheet_corners(spec, points)
+    return [[left, top], [right, top], [right, bottom], [left, bottom]]
+
+# the feed pins of a tree, as [x, y, hole diameter]
+# found by plotting the tree and noting where each PowerSplitter2_pinfeed was placed
+def feed_pins(tree):
+    points, owners = tree.plot_with_owners([0, 0])
+    pins = []
+    found = set()
+    for component, start, count in owners:
+        if isinstance(component, PowerSplitter2_pinfeed) and (id(component), tuple(start)) not in found:
+            found.add((id(component), tuple(start)))
+            pins.append([start[0], start[1], component.hole_size])
+    return pins
+
+# writes the copper outline as the top copper layer
+def generate_copper_gerber(spec, points, destination):
+    with output_file(destination) as output:
+        output.write(gerber_header("Copper,L1,Top"))
+        write_region(output, points)
+        output.write(gerber_footer)
+
+# writes a ground plane over the whole board as the bottom copper layer, cleared around each pin
+# antipad is the diameter cleared, by default the hole with antipad_clearance around it
+def generate_ground_gerber(spec, points, pins, destination, antipad=None):
+    with output_file(destination) as output:
+        output.write(gerber_header("Copper,L2,Bot"))
+        diameters = sorted(set(pin[2] + 2*antipad_clearance if antipad is None else antipad for pin in pins))
+        for i, diameter in enumerate(diameters):
+            output.write("%ADD" + str(10 + i) + "C," + "%.6f" % diameter + "*%\n")
+
+        write_region(output, board_outline(spec, points))
+        if pins:
+            output.write("%LPC*%\n")
+            for x, y, hole in pins:
+                diameter = hole + 2*antipad_clearance if antipad is None else antipad
+                output.write("D" + str(10 + diameters.index(diameter)) + "*\n" + gerber_coordinates(x, y) + "D03*\n")
+        output.write(gerber_footer)
+
+# writes the board's edge
+def generate_edge_gerber(spec, points, destination):
+    outline = board_outline(spec, points)
+    with output_file(destination) as output:
+        output.write(gerber_header("Profile,NP"))
+        output.write("%ADD10C," + "%.6f" % edge_width + "*%\nD10*\n")
+        output.write(gerber_coordinates(*outline[0]) + "D02*\n")
+        output.write("".join([gerber_coordinates(*point) + "D01*\n" for point in outline[1:] + outline[:1]]))
+        output.write(gerber_footer)
+
+# writes an Excellon drill file of the feed pin holes, which are not plated as each pin is soldered to the copper
+def generate_drill(pins, destination):
+    diameters = sorted(set(pin[2] for pin in pins))
+    with output_file(destination) as output:
+        output.write("M48\n; #@! TF.GenerationSoftware,CUSF,Aperture\n; #@! TF.SameCoordinates,Original\n; #@! TF.FileFunction,NonPlated,1,2,NPTH\nFMAT,2\nMETRIC\n")
+        output.write("".join(["T" + str(i + 1) + "C" + "%.3f" % diameter + "\n" for i, diameter in enumerate(diameters)]))
+        output.write("%\nG90\nG05\n")
+        for i, diameter in enumerate(diameters):
+            output.write("T" + str(i + 1) + "\n")
+            output.write("".join(["X" + "%.6f" % x + "Y" + "%.6f" % (0 - y) + "\n" for x, y, hole in pins if hole == diameter]))
+        output.write("T0\nM30\n")
+
+# the fabrication files of a design, as [suffix of the file name, function writing it to a destination]
+# the drill file is left out if the design has no feed pin
+def gerber_outputs(spec, tree, points, antipad=None):
+    pins = feed_pins(tree)
+    outputs = [
+        ["-F_Cu.gbr", lambda destination: generate_copper_gerber(spec, points, destination)],
+        ["-B_Cu.gbr", lambda destination: generate_ground_gerber(spec, points, pins, destination, antipad)],
+        ["-Edge_Cuts.gbr", lambda destination: generate_edge_gerber(spec, points, destination)],
+    ]
+    if pins:
+        outputs.append(["-NPTH.drl", lambda destination: generate_drill(pins, destination)])
+    return outputs
+
+# writes the fabrication files of a design next to base, returns their paths
+def generate_gerbers(spec, tree, points, base, antipad=None):
+    paths = []
+    for suffix, write in gerber_outputs(spec, tree, points, antipad):
+        write(base + suffix)
+        paths.append(base + suffix)
+    return paths
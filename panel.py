@@ -0,0 +1,212 @@
+# Packs several designs onto one panel, written as one KiCAD file and one DXF
+# each design keeps its own board, the whole circumference by its height as aperture.py draws it, and the boards
+# are packed with a skyline bottom-left packer: boards go in tallest first, each at the lowest point of the skyline
+# it fits, upright or turned a quarter turn, which packs fifty boards in about a millisecond
+# the panel's edge and every board's edge are drawn as edge cuts, so each board is routed out of the panel
+# run with:
+#     python panel.py aquila_gps.json aquila_telem.json --size 600 450 --output flight
+# a specification given more than once is put on the panel that many times
+
+import argparse
+import os
+
+import numpy as np
+
+import aperture
+from plot import DXFWriter, dxf_entities, dxf_entity_types, dxf_footer, output_file, sheet_corners, template_parts, title_block, write_kicad_points
+
+# gap between boards, and between the boards and the panel edge, in mm
+default_spacing = 2
+
+# the panel's top left corner on the KiCAD page
+panel_offset = [10, 10]
+
+# places rectangles of sizes [width, height] in a width by height area, top left corner at [0, 0]
+# returns [x, y, turned] for each rectangle in the order given, turned if it was placed a quarter turn round,
+# or None if it did not fit
+def pack(sizes, width, height, rotate=True):
+    # each segment of the skyline is [x, y, width], y the lowest free point above that stretch of the area
+    skyline = [[0, 0, width]]
+    placements = [None]*len(sizes)
+    order = sorted(range(len(sizes)), key=lambda i: (-max(sizes[i]), -min(sizes[i])))
+
+    for i in order:
+        best = None
+        orientations = [(sizes[i][0], sizes[i][1], False)]
+        if rotate and sizes[i][0] != sizes[i][1]:
+            orientations.append((sizes[i][1], sizes[i][0], True))
+        for w, h, turned in orientations:
+            for start in range(len(skyline)):
+                x = skyline[start][0]
+                if x + w > width:
+                    break
+                # the rectangle rests on the highest segment under it
+                y = 0
+                end = start
+                while end < len(skyline) and skyline[end][0] < x + w:
+                    y = max(y, skyline[end][1])
+                    end += 1
+                if y + h > height:
+                    continue
+                # lowest bottom edge first, then leftmost
+                score = (y + h, x)
+                if best is None or score < best[0]:
+                    best = (score, x, y, w, h, turned)
+        if best is None:
+            continue
+
+        score, x, y, w, h, turned = best
+        placements[i] = [x, y, turned]
+
+        # the rectangle becomes a segment of the skyline, cutting back the segments it covers
+        covered = []
+        for segment in skyline:
+            left, right = segment[0], segment[0] + segment[2]
+            if right <= x or left >= x + w:
+                covered.append(segment)
+                continue
+            if left < x:
+                covered.append([left, segment[1], x - left])
+            if right > x + w:
+                covered.append([x + w, segment[1], right - x - w])
+        covered.append([x, y + h, w])
+        covered.sort()
+
+        # neighbouring segments at the same height are merged
+        skyline = [covered[0]]
+        for segment in covered[1:]:
+            if segment[1] == skyline[-1][1]:
+                skyline[-1][2] += segment[2]
+            else:
+                skyline.append(segment)
+    return placements
+
+# a design on a panel, at [x, y] from the panel's top left corner and turned a quarter turn if turned
+class Placement:
+    def __init__(self, name, design, x, y, turned):
+        self.name = name
+        self.design = design
+        self.x = x
+        self.y = y
+        self.turned = turned
+        self.corners = sheet_corners(design.spec, design.points)
+
+    # width and height of the board as placed
+    def size(self):
+        width = self.corners[1][0] - self.corners[0][0]
+        height = self.corners[1][1] - self.corners[0][1]
+        return [height, width] if self.turned else [width, height]
+
+    # moves points of the design to where the board lies on the panel, offset added to them
+    def place(self, points, offset):
+        points = np.asarray(points, dtype=float) - self.corners[0]
+        if self.turned:
+            # a quarter turn clockwise, not a reflection, so the copper stays on the same side of the board
+            height = self.corners[1][1] - self.corners[0][1]
+            points = np.stack([height - points[:, 1], points[:, 0]], 1)
+        return points + [self.x + offset[0], self.y + offset[1]]
+
+    # the board's edge as placed, as [top left, bottom right]
+    def edge(self, offset):
+        width, height = self.size()
+        return [[self.x + offset[0], self.y + offset[1]], [self.x + offset[0] + width, self.y + offset[1] + height]]
+
+# designs packed onto a panel of width by height mm
+class Panel:
+    def __init__(self, width, height, placements):
+        self.width = width
+        self.height = height
+        self.placements = placements
+
+    # fraction of the panel covered by boards
+    def utilisation(self):
+        return sum(placement.size()[0]*placement.size()[1] for placement in self.placements)/(self.width*self.height)
+
+    # writes the panel as a KiCAD PCB file, the copper of every design and the edges of the panel and boards
+    def write_kicad(self, destination):
+        before_title, after_title, after_contents = template_parts()
+        # the page is made big enough for the panel
+        paper = "(paper \"User\" " + str(self.width + 2*panel_offset[0]) + " " + str(self.height + 2*panel_offset[1]) + ")"
+        before_title = before_title.replace("(paper \"A3\")", paper, 1)
+        edges = [[panel_offset, [self.width + panel_offset[0], self.height + panel_offset[1]]]] + [placement.edge(panel_offset) for placement in self.placements]
+
+        with output_file(destination) as output:
+            output.write(before_title)
+            output.write(title_block)
+            output.write(after_title)
+            for placement in self.placements:
+                output.write("  (gr_poly\n    (pts\n")
+                write_kicad_points(output, placement.place(placement.design.points, panel_offset), [0, 0])
+                output.write("    )\n  (layer \"F.Cu\") (width 0) (fill solid))\n")
+            for top_left, bottom_right in edges:
+                output.write("  (gr_rect (start " + str(top_left[0]) + " " + str(top_left[1]) + ") (end " + str(bottom_right[0]) + " " + str(bottom_right[1]) + ") (layer \"Edge.Cuts\") (width 0) (fill none))\n")
+            output.write(after_contents)
+
+    # writes the panel as a DXF, the copper on layer TOP and the edges of the panel and boards on EDGE_CUTS
+    # entity and binary are as for generate_dxf
+    def write_dxf(self, destination, entity="line", binary=False):
+        edges = [[[0, 0], [self.width, self.height]]] + [placement.edge([0, 0]) for placement in self.placements]
+        with output_file(destination, "wb" if binary else "w") as output:
+            writer = DXFWriter(output, entity, binary)
+            writer.tables(edge_cuts=True)
+            writer.write(dxf_entities)
+            for placement in self.placements:
+                writer.outline(placement.place(placement.design.points, [0, 0]))
+            for corners in edges:
+                writer.rectangle(corners, "EDGE_CUTS")
+            writer.write(dxf_footer)
+
+# packs designs, a list of [name, Design], onto a panel of width by height mm, spacing mm apart
+# rotate lets boards be turned a quarter turn to fit
+# raises ValueError naming the designs that do not fit
+def panelize(designs, width, height, spacing=default_spacing, rotate=True):
+    corners = [sheet_corners(design.spec, design.points) for name, design in designs]
+    # each board is packed with the spacing on its right and below, in an area the spacing in from the panel's edge
+    sizes = [[bottom_right[0] - top_left[0] + spacing, bottom_right[1] - top_left[1] + spacing] for top_left, bottom_right in corners]
+    positions = pack(sizes, width - spacing, height - spacing, rotate)
+
+    missing = [designs[i][0] for i in range(len(designs)) if positions[i] is None]
+    if missing:
+        raise ValueError(str(len(missing)) + " of " + str(len(designs)) + " boards do not fit on a " + str(width) + " by " + str(height) + " mm panel: " + ", ".join(missing))
+
+    placements = [Placement(name, design, x + spacing, y + spacing, turned) for (name, design), (x, y, turned) in zip(designs, positions)]
+    return Panel(width, height, placements)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Packs several designs onto one panel, written as one KiCAD file and one DXF")
+    parser.add_argument("specification", nargs="+", help="specification JSON files, each given once for every copy on the panel")
+    parser.add_argument("--size", type=float, nargs=2, required=True, metavar=("WIDTH", "HEIGHT"), help="size of the panel in mm")
+    parser.add_argument("--output", required=True, help="name of the output files, written as NAME.kicad_pcb and NAME.dxf")
+    parser.add_argument("--spacing", type=float, default=default_spacing, help="gap between boards, and between boards and the panel edge, in mm")
+    parser.add_argument("--no-rotate", action="store_true", help="keep every board upright rather than turning some to fit")
+    parser.add_argument("--tune", action="store_true", help="tune the patch length and inset of every design, as aperture.py --tune")
+    parser.add_argument("--dxf-entity", choices=dxf_entity_types, default="line", help="write the DXF outlines as a LINE per edge or as one closed LWPOLYLINE")
+    parser.add_argument("--binary-dxf", action="store_true", help="write binary rather than text DXF")
+    args = parser.parse_args()
+
+    # a specification given more than once is designed once
+    designed = {}
+    designs = []
+    for filename in args.specification:
+        if filename not in designed:
+            try:
+                spec = aperture.read_specification_file(filename)
+                if aperture.sweep_fields(spec):
+                    raise aperture.SpecificationError("Sweeps cannot be panelized, give each design its own file")
+                designed[filename] = aperture.design(spec, args.tune)
+            except ValueError as e:
+                aperture.critical_error(filename + ": " + str(e))
+        designs.append([os.path.basename(filename).replace(".json", ""), designed[filename]])
+
+    try:
+        panel = panelize(designs, args.size[0], args.size[1], args.spacing, not args.no_rotate)
+    except ValueError as e:
+        aperture.critical_error(str(e))
+
+    panel.write_kicad(args.output + ".kicad_pcb")
+    panel.write_dxf(args.output + ".dxf", args.dxf_entity, args.binary_dxf)
+
+    for placement in panel.placements:
+        print(placement.name + " at [" + str(round(placement.x, 3)) + ", " + str(round(placement.y, 3)) + "]" + (", turned" if placement.turned else ""))
+    print("Packed " + str(len(panel.placements)) + " boards, " + str(round(100*panel.utilisation(), 1)) + "% of the panel")
+    print("Output files generated at " + args.output + ".kicad_pcb, " + args.output + ".dxf")
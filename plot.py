@@ -1,94 +1,518 @@
 from components import *
+from contextlib import contextmanager
+from functools import lru_cache
 from math import pi
+import os
+import struct
 import em_calcs as em
 
-# takes array of points and formats them into a KiCAD PCB file
-def generate_file(spec, points, destination):
-    template = open("pcb_template.kicad_pcb", "r").read()
+# the KiCAD template is read once, from next to this file rather than the working directory
+template_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pcb_template.kicad_pcb")
+
+title_block = "(title_block\n    (title \"antenna\")\n    (comment 1 \"Generated by Aperture.py by Daniel Fearn\")\n    (comment 2 \"github.com/cusf/aperture\")\n  )"
+
+# points are formatted and written this many at a time, so memory use does not grow with the design
+chunk_size = 4096
+
+# returns the template split around its title block and contents placeholders
+@lru_cache(maxsize=1)
+def template_parts():
+    with open(template_path, "r") as template_file:
+        template = template_file.read()
+    before_contents, after_contents = template.split("contentscontents", 1)
+    before_title, after_title = before_contents.split("titleblocktitleblock", 1)
+    return before_title, after_title, after_contents
+
+# yields the points in lists of at most chunk_size [x, y] pairs
+def point_chunks(points, overlap=0):
+    for i in range(0, len(points), chunk_size):
+        chunk = points[i:i + chunk_size + overlap]
+        if hasattr(chunk, "tolist"):
+            chunk = chunk.tolist()
+        yield chunk
+
+# writes to destination if it is a file-like object, otherwise opens it as a path
+# mode is "w" for text or "wb" for binary files
+@contextmanager
+def output_file(destination, mode="w"):
+    if hasattr(destination, "write"):
+        yield destination
+    else:
+        with open(destination, mode) as output:
+            yield output
+
+# length of the board around the body, to the 0.1 mm it is drawn to
+# the board runs from -circumference/2 to circumference/2, where its ends meet at the seam
+def board_circumference(spec):
+    return round(float(spec["body_radius"])*2*pi, 1)
 
+# takes array of points and returns the corners of the board around them
+# the board wraps the whole circumference and extends 20 mm beyond the antenna
+def sheet_corners(spec, points):
     furthest_point = 0
-    for p in points:
-        if p[1] < furthest_point:
-            furthest_point = round(p[1],1)
+    for chunk in point_chunks(points):
+        for p in chunk:
+            if p[1] < furthest_point:
+                furthest_point = round(p[1],1)
 
-    circumference = round(float(spec["body_radius"])*2*pi, 1)
+    circumference = board_circumference(spec)
 
     sheet_top_left = [-circumference/2, furthest_point-20]
     sheet_bottom_right = [circumference/2, 20]
+    return sheet_top_left, sheet_bottom_right
 
-    print("Sheet size [width, height]: ", [sheet_bottom_right[0] - sheet_top_left[0], sheet_bottom_right[1] - sheet_top_left[1]])
+# returns the [width, height] of the board around the points
+def sheet_size(spec, points):
+    sheet_top_left, sheet_bottom_right = sheet_corners(spec, points)
+    return [sheet_bottom_right[0] - sheet_top_left[0], sheet_bottom_right[1] - sheet_top_left[1]]
 
-    antenna_string = "  (gr_poly\n    (pts\n"
+kicad_point = "      (xy {} {})\n"
 
-    centre_offset = [210, 200] # move shape to center of page, arbitrary
+centre_offset = [210, 200] # move shape to center of page, arbitrary
+
+# writes a KiCAD PCB file around the copper written inside it, with the board edge fitted to points
+# destination is a path or a file-like object
+@contextmanager
+def kicad_board(spec, points, destination):
+    before_title, after_title, after_contents = template_parts()
+
+    sheet_top_left, sheet_bottom_right = sheet_corners(spec, points)
 
     sheet_top_left[0] += centre_offset[0]
     sheet_top_left[1] += centre_offset[1]
     sheet_bottom_right[0] += centre_offset[0]
     sheet_bottom_right[1] += centre_offset[1]
 
-    for p in points:
-        antenna_string += "      (xy " + str(p[0]+centre_offset[0]) + " " + str(p[1]+centre_offset[1]) + ")\n"
-    
-    antenna_string += "    )\n  (layer \"F.Cu\") (width 0) (fill solid))"
+    with output_file(destination) as output:
+        output.write(before_title)
+        output.write(title_block)
+        output.write(after_title)
 
-    antenna_string += "(gr_rect (start "+str(sheet_top_left[0])+" "+str(sheet_top_left[1])+") (end "+str(sheet_bottom_right[0])+" "+str(sheet_bottom_right[1])+") (layer \"Edge.Cuts\") (width 0) (fill none))"
+        yield output
 
-    template = template.replace("contentscontents", antenna_string)
+        output.write("(gr_rect (start "+str(sheet_top_left[0])+" "+str(sheet_top_left[1])+") (end "+str(sheet_bottom_right[0])+" "+str(sheet_bottom_right[1])+") (layer \"Edge.Cuts\") (width 0) (fill none))")
 
-    title_block = "(title_block\n    (title \"antenna\")\n    (comment 1 \"Generated by Aperture.py by Daniel Fearn\")\n    (comment 2 \"github.com/cusf/aperture\")\n  )"
+        output.write(after_contents)
 
-    template = template.replace("titleblocktitleblock", title_block)
+# writes the points formatted as KiCAD xy entries, moved by offset
+def write_kicad_points(output, points, offset, point_format=kicad_point):
+    for chunk in point_chunks(points):
+        output.write("".join([point_format.format(p[0]+offset[0], p[1]+offset[1]) for p in chunk]))
+
+# takes array of points and writes them as a KiCAD PCB file
+# destination is a path or a file-like object
+def generate_file(spec, points, destination):
+    with kicad_board(spec, points, destination) as output:
+        output.write("  (gr_poly\n    (pts\n")
+        write_kicad_points(output, points, centre_offset)
+        output.write("    )\n  (layer \"F.Cu\") (width 0) (fill solid))")
 
-    open(destination, "w").write(template)
+dxf_header_section = "  0\nSECTION\n  2\nHEADER\n  0\nENDSEC"
+dxf_tables = dxf_header_section + "\n  0\nSECTION\n  2\nTABLES\n  0\nTABLE\n  2\nLAYER\n  70\n1\n  0\nLAYER\n  2\nTOP\n  70\n0\n  62\n7\n  6\nCONTINUOUS\n  0\nENDTAB\n  0\nENDSEC"
+dxf_entities = "\n  0\nSECTION\n  2\nENTITIES"
+# the layer of board edges in panels, added to the layer table after TOP
+dxf_edge_cuts_layer = "\n  0\nLAYER\n  2\nEDGE_CUTS\n  70\n0\n  62\n1\n  6\nCONTINUOUS"
+dxf_header = dxf_tables + dxf_entities
+dxf_footer = "\n  0\nENDSEC\n  0\nEOF"
+dxf_line_format = "\n  0\nLINE\n  8\nTOP\n  6\nCONTINUOUS\n  10\n{}\n  20\n{}\n  11\n{}\n  21\n{}"
 
 # helper function to generate DXF code for a line given two points
 def dxf_line(x1, y1, x2, y2):
-    return "\n  0\nLINE\n  8\nTOP\n  6\nCONTINUOUS\n  10\n"+str(x1)+"\n  20\n"+str(y1)+"\n  11\n"+str(x2)+"\n  21\n"+str(y2)
+    return dxf_line_format.format(x1, y1, x2, y2)
+
+# writes a closed outline as DXF lines, one per edge
+def write_dxf_outline(output, points):
+    # chunks overlap by one point so the edge between them is written
+    for chunk in point_chunks(points, overlap=1):
+        output.write("".join([dxf_line_format.format(a[0], -a[1], b[0], -b[1]) for a, b in zip(chunk, chunk[1:])]))
+
+    first = points[0]
+    last = points[len(points)-1]
+    output.write(dxf_line(last[0], -last[1], first[0], -first[1]))
+
+# LWPOLYLINE is an R2000 entity, so files using it say so in their header and mark the entity's subclasses
+dxf_r2000_header_section = "  0\nSECTION\n  2\nHEADER\n  9\n$ACADVER\n  1\nAC1015\n  0\nENDSEC"
+dxf_polyline_format = "\n  0\nLWPOLYLINE\n100\nAcDbEntity\n  8\nTOP\n  6\nCONTINUOUS\n100\nAcDbPolyline\n  90\n{}\n  70\n1"
+dxf_vertex_format = "\n  10\n{}\n  20\n{}"
+
+# ways an outline can be written: a LINE per edge, or one closed LWPOLYLINE which writes each vertex once
+dxf_entity_types = ["line", "lwpolyline"]
+
+dxf_binary_sentinel = b"AutoCAD Binary DXF\r\n\x1a\x00"
+
+# struct format of the values of a group code in binary DXF, None for strings
+def dxf_value_format(code):
+    if 10 <= code < 60:
+        return "<d"
+    if 60 <= code < 80:
+        return "<h"
+    if 90 <= code < 100:
+        return "<i"
+    return None
+
+# converts DXF text, as written by the formats above, to binary DXF
+# group codes are one byte in R12 files and two bytes, with wide_codes, from R13 on
+def dxf_binary(text, wide_codes=False):
+    lines = text.strip("\n").split("\n")
+    data = []
+    for i in range(0, len(lines), 2):
+        code = int(lines[i])
+        value_format = dxf_value_format(code)
+        data.append(struct.pack("<H" if wide_codes else "<B", code))
+        if value_format is None:
+            data.append(lines[i + 1].encode("ascii") + b"\0")
+        elif value_format == "<d":
+            data.append(struct.pack(value_format, float(lines[i + 1])))
+        else:
+            data.append(struct.pack(value_format, int(lines[i + 1])))
+    return b"".join(data)
+
+# binary DXF records for many entities at once, each a fixed prefix followed by coordinates
+# columns is a list of (group code, array of values) written after the prefix in every record
+def dxf_binary_records(prefix, columns, wide_codes=False):
+    import numpy as np
+    fields = [("prefix", "u1", (len(prefix),))]
+    for i in range(len(columns)):
+        fields += [("code" + str(i), "<u2" if wide_codes else "u1"), ("value" + str(i), "<f8")]
+    records = np.empty(len(columns[0][1]), dtype=fields)
+    records["prefix"] = np.frombuffer(prefix, dtype="u1")
+    for i, (code, values) in enumerate(columns):
+        records["code" + str(i)] = code
+        records["value" + str(i)] = values
+    return records.tobytes()
+
+# writes DXF text and outlines to output, as text or as binary DXF
+# entity is one of dxf_entity_types, files with LWPOLYLINEs are R2000 and the rest R12
+class DXFWriter:
+    def __init__(self, output, entity="line", binary=False):
+        if entity not in dxf_entity_types:
+            raise ValueError("DXF entity must be one of " + ", ".join(dxf_entity_types) + ", not " + str(entity))
+        self.output = output
+        self.entity = entity
+        self.binary = binary
+        self.wide_codes = entity == "lwpolyline"
+        if binary:
+            output.write(dxf_binary_sentinel)
+
+    def write(self, text):
+        self.output.write(dxf_binary(text, self.wide_codes) if self.binary else text)
+
+    # writes the header and tables sections, with the EDGE_CUTS layer as well as TOP if edge_cuts is set
+    def tables(self, edge_cuts=False):
+        tables = dxf_tables
+        if edge_cuts:
+            tables = tables.replace("LAYER\n  70\n1\n", "LAYER\n  70\n2\n", 1).replace("\n  0\nENDTAB", dxf_edge_cuts_layer + "\n  0\nENDTAB", 1)
+        if self.entity == "lwpolyline":
+            tables = tables.replace(dxf_header_section, dxf_r2000_header_section, 1)
+        self.write(tables)
+
+    # writes a rectangle given as [top left, bottom right] on layer
+    def rectangle(self, corners, layer):
+        (left, top), (right, bottom) = corners
+        points = [[left, top], [right, top], [right, bottom], [left, bottom]]
+        if self.entity == "lwpolyline":
+            text = dxf_polyline_format.format(len(points)) + "".join([dxf_vertex_format.format(p[0], -p[1]) for p in points])
+        else:
+            text = "".join([dxf_line(a[0], -a[1], b[0], -b[1]) for a, b in zip(points, points[1:] + points[:1])])
+        self.write(text.replace("  8\nTOP", "  8\n" + layer))
+
+    # writes a closed outline, y is flipped as DXF y points up
+    def outline(self, points):
+        if self.binary:
+            self.binary_outline(points)
+        elif self.entity == "lwpolyline":
+            self.output.write(dxf_polyline_format.format(len(points)))
+            for chunk in point_chunks(points):
+                self.output.write("".join([dxf_vertex_format.format(p[0], -p[1]) for p in chunk]))
+        else:
+            write_dxf_outline(self.output, points)
+
+    def binary_outline(self, points):
+        import numpy as np
+        points = np.asarray(points, dtype=float)
+        if self.entity == "lwpolyline":
+            self.write(dxf_polyline_format.format(len(points)))
+            for i in range(0, len(points), chunk_size):
+                chunk = points[i:i + chunk_size]
+                self.output.write(dxf_binary_records(b"", [(10, chunk[:, 0]), (20, -chunk[:, 1])], self.wide_codes))
+        else:
+            prefix = dxf_binary(dxf_line_format.split("\n  10")[0], self.wide_codes)
+            for i in range(0, len(points), chunk_size):
+                start = points[i:i + chunk_size]
+                end = points[(np.arange(i, i + len(start)) + 1) % len(points)]
+                self.output.write(dxf_binary_records(prefix, [(10, start[:, 0]), (20, -start[:, 1]), (11, end[:, 0]), (21, -end[:, 1])], self.wide_codes))
+
+# takes array of points and writes them as a DXF file, one line per edge of the outline
+# entity is one of dxf_entity_types, and binary writes binary rather than text DXF
+# destination is a path or a file-like object, opened in binary for binary DXF
+def generate_dxf(spec, points, destination, entity="line", binary=False):
+    with output_file(destination, "wb" if binary else "w") as output:
+        writer = DXFWriter(output, entity, binary)
+        writer.tables()
+        writer.write(dxf_entities)
+        writer.outline(points)
+        writer.write(dxf_footer)
+
+############################## instanced output ##############################
+
+# the feed network reuses the same component objects for every copy of a patch or group of patches
+# (see ArrayBuilder.group), so each copy can be written once and placed wherever it appears
+# a copy is drawn as its own closed outline, which shares an edge with the outline it was cut from
+
+# whether every component in a subtree has the same shape wherever it is plotted
+def fixed_shape(component):
+    return component.position_independent and all(fixed_shape(child) for child in component.nodes)
 
-# takes array of points and formats them into a DXF file
-def generate_dxf(spec, points, destination):
-    headers = "  0\nSECTION\n  2\nHEADER\n  0\nENDSEC\n  0\nSECTION\n  2\nTABLES\n  0\nTABLE\n  2\nLAYER\n  70\n1\n  0\nLAYER\n  2\nTOP\n  70\n0\n  62\n7\n  6\nCONTINUOUS\n  0\nENDTAB\n  0\nENDSEC\n  0\nSECTION\n  2\nENTITIES"
-    contents = ""
+# ids of the components worth drawing once and placing wherever they appear: those with a fixed shape that
+# are joined to more than one place in the tree, or that appear more than once under a parent that is not itself placed
+# this way, so a part that only ever appears inside one repeated subtree is drawn as part of that subtree
+def repeated_components(tree):
+    counts = {}
+    slots = {}
+    components = {}
 
-    for i in range(len(points)-1):
-        contents += dxf_line(points[i][0], -points[i][1], points[i+1][0], -points[i+1][1])
-        pass
-    
-    contents += dxf_line(points[i+1][0], -points[i+1][1], points[0][0], -points[0][1])
-    open(destination, "w").write(headers + contents + "\n  0\nENDSEC\n  0\nEOF")
+    def visit(component):
+        for slot, child in enumerate(component.nodes):
+            if id(child) not in components:
+                components[id(child)] = child
+                counts[id(child)] = 0
+                slots[id(child)] = set()
+            counts[id(child)] += 1
+            slots[id(child)].add((id(component), slot))
+            visit(child)
+    visit(tree)
+
+    repeated = set()
+    for key in components: # parents are found before their children
+        if counts[key] < 2 or not fixed_shape(components[key]):
+            continue
+        if len(slots[key]) > 1 or list(slots[key])[0][0] not in repeated:
+            repeated.add(key)
+    return repeated
+
+# the outline of each repeated component at the origin, with any repeated components inside it cut out
+# returns a list of [component, name, outline, [[child, start], ...]], children before the components that place them
+def instance_definitions(tree, repeated):
+    definitions = []
+    names = {}
+
+    def define(component):
+        if id(component) in names:
+            return
+        outline, children = component.plot_without(repeated)
+        for child, start in children:
+            define(child)
+        names[id(component)] = type(component).__name__.upper() + "_" + str(len(names) + 1)
+        definitions.append([component, names[id(component)], outline, children])
+
+    outline, children = tree.plot_without(repeated)
+    for child, start in children:
+        define(child)
+    return definitions, names, outline, children
+
+dxf_blocks = "\n  0\nSECTION\n  2\nBLOCKS"
+dxf_block = "\n  0\nBLOCK\n  8\nTOP\n  2\n{0}\n  70\n0\n  10\n0.0\n  20\n0.0\n  30\n0.0\n  3\n{0}"
+dxf_block_end = "\n  0\nENDBLK\n  8\nTOP"
+dxf_section_end = "\n  0\nENDSEC"
+dxf_insert = "\n  0\nINSERT\n  8\nTOP\n  2\n{}\n  10\n{}\n  20\n{}\n  30\n0.0"
+
+# writes a tree as a DXF file with each repeated subtree defined once as a BLOCK and placed with INSERTs
+# blocks are nested, so the file grows with the number of different subtrees rather than the number of patches
+# entity, binary and destination are as for generate_dxf
+def generate_instanced_dxf(spec, tree, destination, entity="line", binary=False):
+    repeated = repeated_components(tree)
+    definitions, names, outline, children = instance_definitions(tree, repeated)
+
+    with output_file(destination, "wb" if binary else "w") as output:
+        writer = DXFWriter(output, entity, binary)
+        writer.tables()
+
+        writer.write(dxf_blocks)
+        for component, name, block_outline, block_children in definitions:
+            writer.write(dxf_block.format(name))
+            writer.outline(block_outline)
+            for child, start in block_children:
+                writer.write(dxf_insert.format(names[id(child)], start[0], -start[1]))
+            writer.write(dxf_block_end)
+        writer.write(dxf_section_end)
+
+        writer.write(dxf_entities)
+        writer.outline(outline)
+        for child, start in children:
+            writer.write(dxf_insert.format(names[id(child)], start[0], -start[1]))
+        writer.write(dxf_footer)
+
+kicad_footprint = """  (footprint "aperture:{name}" (layer "F.Cu")
+    (at {x} {y})
+    (attr board_only exclude_from_pos_files exclude_from_bom)
+    (fp_text reference "AP{number}" (at 0 0) (layer "F.Fab") hide
+      (effects (font (size 1 1) (thickness 0.15)))
+    )
+    (fp_text value "{name}" (at 0 0) (layer "F.Fab") hide
+      (effects (font (size 1 1) (thickness 0.15)))
+    )
+    (fp_poly
+      (pts
+"""
+kicad_footprint_point = "        (xy {} {})\n"
+kicad_footprint_end = "      )\n      (layer \"F.Cu\") (width 0) (fill solid))\n  )\n"
+
+# writes a tree as a KiCAD PCB file with each outermost repeated subtree as a footprint, one per place it appears
+# KiCAD footprints cannot contain other footprints, so each holds the whole outline of its subtree,
+# and a board file holds a copy of each footprint's shape for every placement
+# destination is a path or a file-like object
+def generate_instanced_file(spec, tree, destination):
+    repeated = repeated_components(tree)
+    outline, children = tree.plot_without(repeated)
+    shapes = {}
+
+    with kicad_board(spec, tree.plot(), destination) as output:
+        output.write("  (gr_poly\n    (pts\n")
+        write_kicad_points(output, outline, centre_offset)
+        output.write("    )\n  (layer \"F.Cu\") (width 0) (fill solid))\n")
+
+        for number, (child, start) in enumerate(children, 1):
+            if id(child) not in shapes:
+                shapes[id(child)] = [type(child).__name__.upper() + "_" + str(len(shapes) + 1), child.plot()]
+            name, shape = shapes[id(child)]
+            output.write(kicad_footprint.format(name=name, x=start[0] + centre_offset[0], y=start[1] + centre_offset[1], number=number))
+            write_kicad_points(output, shape, [0, 0], kicad_footprint_point)
+            output.write(kicad_footprint_end)
 
 # generates recursive tree of microstrip components based on specification
+# the patches are spaced evenly around the circumference and fed from a pin at the centre
+# through a binary tree of power splitters, see ArrayBuilder
 def construct_array(spec):
-    tube_circumference = spec["body_radius"]*2*pi
-    spacing = tube_circumference/8
-
-    if spec["polarisation"] == "axial":
-        patch1 = InsetFeed(spec, 50, Dir.UP, [LinearPatch(spec, Dir.UP, [])])
-        patch2 = InsetFeed(spec, 50, Dir.UP, [LinearPatch(spec, Dir.UP, [])])
-        patch3 = InsetFeed(spec, 50, Dir.UP, [LinearPatch(spec, Dir.UP, [])])
-        patch4 = InsetFeed(spec, 50, Dir.UP, [LinearPatch(spec, Dir.UP, [])])
-    else:
+    return ArrayBuilder(spec).build()
+
+# builds the feed network for any number of patches
+# each group of patches is fed by a splitter, with a bend from each arm down to the feed of half the group
+# groups of the same size are identical apart from their position, so each size is built once and shared
+# every patch of a group sits at the same depth below its feed, at the end of the same length of line, so the
+# patches are fed in phase: bends drop further on the shallower side, each splitter is placed where the lines
+# either side come out the same length, and where it cannot be (the pin is at the centre of the array) the
+# shorter side is made up with a MeanderedBend
+class ArrayBuilder:
+    # the spec fields that only change the patch and its feed, see rebuild_element
+    element_fields = ["patch_length", "inset_distance", "patch_impedance", "polarisation"]
+
+    # lines closer in length than this (mm) count as the same
+    path_tolerance = 1e-6
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.patch_count = spec["patch_count"]
+        if self.patch_count != int(self.patch_count) or self.patch_count < 1:
+            raise ValueError("patch_count must be a positive whole number, not " + str(self.patch_count))
+        self.patch_count = int(self.patch_count)
+
+        tube_circumference = spec["body_radius"]*2*pi
+        self.spacing = tube_circumference/self.patch_count
+        self.bend_height = 10
+        self.groups = {}
+        self.patch = self.element()
+        self.tree = None
+
+        # a splitter arm as a length of 50 ohm line: both are a quarter wave, whatever the arm's width
+        self.arm_length = em.effective_wavelength(em.microstrip_width(50, spec), spec)/4
+
+    # a single patch with its feed, used at every position in the array
+    def element(self):
+        spec = self.spec
+        if spec["polarisation"] == "axial":
+            return InsetFeed(spec, 50, Dir.UP, [LinearPatch(spec, Dir.UP, [])])
         patch_impedance = em.microstrip_patch_impedance(spec, em.square_patch(spec)[0])
-        patch1  = MatchLine(spec, 50, patch_impedance, Dir.UP, [SquarePatch(spec, Dir.UP, [])])
-        patch2  = MatchLine(spec, 50, patch_impedance, Dir.UP, [SquarePatch(spec, Dir.UP, [])])
-        patch3  = MatchLine(spec, 50, patch_impedance, Dir.UP, [SquarePatch(spec, Dir.UP, [])])
-        patch4  = MatchLine(spec, 50, patch_impedance, Dir.UP, [SquarePatch(spec, Dir.UP, [])])
-    
-    if spec["patch_count"] == 2:
-        branch1 = patch1
-        branch2 = patch2
-    elif spec["patch_count"] == 4:
-        benda = MitredBendAtPoint(spec, 50, -3*spacing, 10, Dir.RIGHT, [patch1])
-        bendb = MitredBendAtPoint(spec, 50, -spacing, 10, Dir.LEFT, [patch2])
-        bendc = MitredBendAtPoint(spec, 50, spacing, 10, Dir.RIGHT, [patch3])
-        bendd = MitredBendAtPoint(spec, 50, 3*spacing, 10, Dir.LEFT, [patch4])
-        branch1 = PowerSplitter2_linefeed(spec, 50, 50, [], [bendb, benda])
-        branch2 = PowerSplitter2_linefeed(spec, 50, 50, [], [bendd, bendc])
-    else:
-        return patch1 # return only a single patch with its feed, useful for validation testing
+        return MatchLine(spec, 50, patch_impedance, Dir.UP, [SquarePatch(spec, Dir.UP, [])])
+
+    # splits count patches into the halves fed by the +x and -x arms of a splitter
+    # odd counts put the extra patch on the -x side and use an unequal splitter
+    def halves(self, count):
+        return count//2, count - count//2
+
+    # joins the halves of a group of count patches to a splitter of the given type through bends
+    # positions are measured from the first (-x) patch of the group, the splitter is placed at feed if it is given,
+    # otherwise where the lines to the patches of both halves are the same length
+    # returns the splitter, its position, and the depth of the patches below it and the length of line to them,
+    # counting each splitter arm as arm_length
+    def split(self, count, splitter, args, feed=None):
+        right, left = self.halves(count)
+        right_group, right_feed, right_depth, right_path = self.group(right)
+        left_group, left_feed, left_depth, left_path = self.group(left)
+        right_feed += left*self.spacing
+
+        splitter = splitter(self.spec, 50, 50, *args, Dir.LEFT, [], right/count)
+        right_arm, left_arm = splitter.branch_lengths
+        # the line to the patches of each half beyond its depth, which the bends' runs along the arms must even out
+        right_excess = right_path - right_depth
+        left_excess = left_path - left_depth
+        if feed is None:
+            # halfway between the halves when they are the same, kept where the arms still reach
+            feed = (left_feed + right_feed)/2 + ((left_arm - right_arm) + (right_excess - left_excess))/2
+            feed = max(min(feed, right_feed - right_arm), left_feed + left_arm)
+
+        right_length = right_feed - feed - right_arm
+        left_length = feed - left_feed - left_arm
+        if right_length < 0 or left_length < 0:
+            raise ValueError("Patches " + str(round(self.spacing, 1)) + " mm apart are too close together for the power splitter arms")
+
+        # whatever is left uneven is made up with a detour on the shorter side, or on both if it is too short for one
+        right_extra = left_extra = 0
+        difference = (right_length + right_excess) - (left_length + left_excess)
+        if abs(difference) > self.path_tolerance:
+            minimum = MeanderedBend(self.spec, 50, 0, 0, 0, Dir.LEFT).min_extra
+            padding = minimum if abs(difference) < minimum else 0
+            right_extra = padding + max(-difference, 0)
+            left_extra = padding + max(difference, 0)
+
+        bends = []
+        for length, extra, group, direction in [[right_length, right_extra, right_group, Dir.LEFT], [left_length, left_extra, left_group, Dir.RIGHT]]:
+            if extra:
+                bend = MeanderedBend(self.spec, 50, length, 0, extra, direction, [group])
+                bend.height = max(self.bend_height, bend.min_height)
+            else:
+                bend = MitredBend(self.spec, 50, length, self.bend_height, direction, [group])
+            bends.append(bend)
+
+        # the bend on the shallower side drops further, so the patches of both halves end up level
+        depth = max(bends[0].height + right_depth, bends[1].height + left_depth)
+        bends[0].height += depth - (bends[0].height + right_depth)
+        bends[1].height += depth - (bends[1].height + left_depth)
+        splitter.nodes = bends
+        path = self.arm_length + right_length + bends[0].height + right_extra + right_path
+        return splitter, feed, depth, path
+
+    # feed network for a group of count neighbouring patches, fed by a line splitter
+    # returns the network, the position of its feed measured from the first patch, and the depth of the patches
+    # below the feed and the length of line to them, as split does
+    def group(self, count):
+        if count == 1:
+            return self.patch, 0, 0, 0
+        if count not in self.groups:
+            self.groups[count] = self.split(count, PowerSplitter2_linefeed, [])
+        return self.groups[count]
+
+    # the whole array, fed through the pin at its centre so the patches are spaced evenly across the board
+    def build(self):
+        if self.patch_count == 1:
+            self.tree = self.patch # return only a single patch with its feed, useful for validation testing
+        else:
+            centre = (self.patch_count - 1)*self.spacing/2
+            self.tree = self.split(self.patch_count, PowerSplitter2_pinfeed, [0.3], centre)[0]
+        return self.tree
 
+    # rebuilds the array for a spec differing from the built one only in element_fields
+    # the feed network is kept and the new patch and feed joined to it wherever the old one was
+    # returns the array
+    def rebuild_element(self, spec):
+        old = self.patch
+        self.spec = spec
+        self.patch = self.element()
+        if self.tree is old:
+            self.tree = self.patch
+            return self.tree
 
-    bend1 = MitredBendAtPoint(spec, 50, -2*spacing, 10, Dir.RIGHT, [branch1])
-    bend2 = MitredBendAtPoint(spec, 50, 2*spacing, 10, Dir.LEFT, [branch2])
-    return PowerSplitter2_pinfeed(spec, 50, 50, 0.3, [], [bend2, bend1])
\ No newline at end of file
+        splitters = [group[0] for group in self.groups.values()] + [self.tree]
+        for splitter in splitters:
+            for bend in splitter.nodes:
+                bend.nodes = [self.patch if node is old else node for node in bend.nodes]
+        return self.tree
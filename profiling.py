@@ -0,0 +1,150 @@
+# Records where the time goes in the aperture pipeline
+# each stage of a design is wrapped in stage(), which records its wall time, memory allocated and
+# microstrip_width work while a Profiler is active and does nothing otherwise
+# from python:
+#     with profiling.profile() as profiler:
+#         aperture.design(spec)
+#     profiler.write("profile.json")
+
+from contextlib import contextmanager, nullcontext
+import json
+import os
+import time
+import tracemalloc
+
+import em_calcs
+
+# the profiler recording stages, None when profiling is off
+active = None
+
+# times a stage of the pipeline if a profiler is active
+def stage(name):
+    if active is None:
+        return nullcontext()
+    return active.stage(name)
+
+# records stages as they run
+# memory tracing with tracemalloc slows the pipeline down, so it can be turned off,
+# and cprofile also runs the python profiler over the whole of the profiled code
+class Profiler:
+    def __init__(self, memory=True, cprofile=False):
+        self.memory = memory
+        self.stages = [] # finished stages, in the order they finished
+        self.open = [] # stages running, outermost first
+        self.origin = time.perf_counter()
+        self.cprofile = None
+        if cprofile:
+            import cProfile
+            self.cprofile = cProfile.Profile()
+
+    # folds the memory peak so far into every running stage, before it is reset
+    def record_peak(self):
+        peak = tracemalloc.get_traced_memory()[1]
+        for record in self.open:
+            record["peak_memory"] = max(record["peak_memory"], peak - record["start_memory"])
+
+    @contextmanager
+    def stage(self, name):
+        record = {
+            "name": name,
+            "start": time.perf_counter() - self.origin,
+            "depth": len(self.open),
+            "counters": dict(em_calcs.counters),
+        }
+        if self.memory and tracemalloc.is_tracing():
+            self.record_peak()
+            tracemalloc.reset_peak()
+            record["start_memory"] = tracemalloc.get_traced_memory()[0]
+            record["peak_memory"] = 0
+        self.open.append(record)
+
+        try:
+            yield record
+        finally:
+            if "start_memory" in record:
+                self.record_peak()
+                record["allocated"] = tracemalloc.get_traced_memory()[0] - record.pop("start_memory")
+            record["duration"] = time.perf_counter() - self.origin - record["start"]
+            record["counters"] = {key: em_calcs.counters[key] - record["counters"][key] for key in em_calcs.counters}
+            self.open.pop()
+            self.stages.append(record)
+
+    # totals for each stage name: calls, total time and the largest memory peak
+    def summary(self):
+        totals = {}
+        for record in self.stages:
+            total = totals.setdefault(record["name"], {"calls": 0, "time": 0, "peak_memory": 0, "counters": {}})
+            total["calls"] += 1
+            total["time"] += record["duration"]
+            total["peak_memory"] = max(total["peak_memory"], record.get("peak_memory", 0))
+            for key in record["counters"]:
+                total["counters"][key] = total["counters"].get(key, 0) + record["counters"][key]
+        return totals
+
+    # microstrip_width work done inside all the stages
+    def counters(self):
+        totals = dict.fromkeys(em_calcs.counters, 0)
+        for record in self.stages:
+            if record["depth"] == 0:
+                for key in record["counters"]:
+                    totals[key] += record["counters"][key]
+        return totals
+
+    # the stages and their totals as a JSON document, times in seconds and memory in bytes
+    def trace(self):
+        return {"stages": sorted(self.stages, key=lambda record: record["start"]), "summary": self.summary()}
+
+    # the stages in Chrome trace event format, for chrome://tracing or Perfetto
+    def chrome_trace(self):
+        events = []
+        for record in self.stages:
+            arguments = dict(record["counters"])
+            for key in ["peak_memory", "allocated"]:
+                if key in record:
+                    arguments[key] = record[key]
+            events.append({
+                "name": record["name"],
+                "ph": "X",
+                "ts": record["start"]*1e6,
+                "dur": record["duration"]*1e6,
+                "pid": os.getpid(),
+                "tid": 0,
+                "args": arguments,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    # writes the trace to a file, format is "json" or "chrome"
+    def write(self, path, format="json"):
+        document = self.chrome_trace() if format == "chrome" else self.trace()
+        with open(path, "w") as output:
+            json.dump(document, output, indent=2)
+
+    # writes the python profiler's statistics, readable with pstats or snakeviz
+    def write_cprofile(self, path):
+        self.cprofile.dump_stats(path)
+
+# profiles the code run inside it, yielding the Profiler
+# memory tracing is started if it is not already running, and stopped again afterwards
+@contextmanager
+def profile(memory=True, cprofile=False):
+    global active
+    profiler = Profiler(memory, cprofile)
+    previous = active
+    started_tracing = memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    if profiler.cprofile is not None:
+        profiler.cprofile.enable()
+    active = profiler
+
+    try:
+        # numpy is imported when it is first needed, which would charge a few hundred ms to whichever stage that is
+        with profiler.stage("import_numpy"):
+            import numpy
+        yield profiler
+    finally:
+        active = previous
+        if profiler.cprofile is not None:
+            profiler.cprofile.disable()
+        if started_tracing:
+            tracemalloc.stop()
@@ -0,0 +1,284 @@
+# Serves designs over HTTP from a long running process, for tools and notebooks that design over and over
+# calls skip process startup, the numpy import and the template read, the worker processes keep their
+# microstrip_width caches between requests, and a design already made is answered from memory
+# run with:
+#     python server.py [--port 8470 | --unix PATH] [--workers N]
+# POST /design with {"spec": {...}, "tune": false, "instanced": false, "dxf_entity": "line", "binary_dxf": false}
+# returns {"parameters": {...}, "sheet_size": [...], "kicad_pcb": "...", "dxf": "..."}, with "tuned" if tuned
+# and the binary DXF base64 encoded, or {"error": "..."} with status 400 if the spec cannot be designed
+# GET /health returns the server's version and counts of requests, designs and cache hits
+
+import argparse
+import asyncio
+import base64
+from collections import OrderedDict
+import io
+import json
+
+import aperture
+import cache
+
+default_host = "127.0.0.1"
+default_port = 8470
+
+# responses kept in memory, the least recently used are dropped beyond this
+default_cache_entries = 256
+
+# largest request body accepted, in bytes
+max_body = 16*1024*1024
+
+# the options a request may set, with their defaults
+default_options = {"tune": False, "instanced": False, "dxf_entity": "line", "binary_dxf": False}
+
+statuses = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+# run once in each worker process, so the first request does not pay for the imports and template read
+def warm():
+    import numpy
+    from plot import template_parts
+    template_parts()
+
+# designs a spec and renders its outputs in memory, run in the worker processes
+# returns the response document
+def render(spec, options):
+    result = aperture.design(spec, options["tune"])
+    kicad = io.StringIO()
+    result.write_kicad(kicad, options["instanced"])
+    dxf = io.BytesIO() if options["binary_dxf"] else io.StringIO()
+    result.write_dxf(dxf, options["instanced"], options["dxf_entity"], options["binary_dxf"])
+
+    document = {"parameters": result.parameters, "sheet_size": aperture.sheet_size(result.spec, result.points), "kicad_pcb": kicad.getvalue()}
+    if options["binary_dxf"]:
+        document["dxf"] = base64.b64encode(dxf.getvalue()).decode("ascii")
+        document["dxf_encoding"] = "base64"
+    else:
+        document["dxf"] = dxf.getvalue()
+    if result.tuned is not None:
+        document["tuned"] = result.tuned.summary()
+    return document
+
+# checks the options of a request, returns them with defaults filled in
+def request_options(request):
+    options = dict(default_options)
+    for key in request:
+        if key == "spec":
+            continue
+        if key not in options:
+            raise aperture.SpecificationError("Unknown option " + key)
+        options[key] = request[key]
+    if options["dxf_entity"] not in aperture.dxf_entity_types:
+        raise aperture.SpecificationError("dxf_entity must be one of " + ", ".join(aperture.dxf_entity_types))
+    for key in ["tune", "instanced", "binary_dxf"]:
+        if not isinstance(options[key], bool):
+            raise aperture.SpecificationError(key + " must be true or false")
+    return options
+
+# answers requests on the event loop, designing in a pool of worker processes
+# workers=0 designs in a thread of this process instead
+class DesignServer:
+    def __init__(self, workers=1, cache_entries=default_cache_entries):
+        self.workers = workers
+        self.pool = None
+        if workers:
+            from concurrent.futures import ProcessPoolExecutor
+            self.pool = ProcessPoolExecutor(max_workers=workers, initializer=warm)
+        self.cache_entries = cache_entries
+        self.responses = OrderedDict() # hash of the request -> encoded response, least recently used first
+        self.running = {} # hash of the request -> future of the design, so identical requests share one design
+        self.counts = {"requests": 0, "designs": 0, "hits": 0, "errors": 0}
+
+    # starts the worker processes, which the pool otherwise leaves until the first request
+    async def start(self):
+        await asyncio.get_running_loop().run_in_executor(self.pool, warm)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    # returns the encoded response to a design request and whether it came from the cache
+    async def design(self, request):
+        if not isinstance(request, dict) or not isinstance(request.get("spec"), dict):
+            raise aperture.SpecificationError("The request must be a JSON object with the specification in spec")
+        spec = request["spec"]
+        options = request_options(request)
+        if aperture.sweep_fields(spec):
+            raise aperture.SpecificationError("Sweeps are not served, send each design of the sweep on its own")
+
+        digest = cache.output_hash(spec, aperture.__version__, options)
+        if digest in self.responses:
+            self.responses.move_to_end(digest)
+            self.counts["hits"] += 1
+            return self.responses[digest], True
+
+        if digest not in self.running:
+            self.counts["designs"] += 1
+            self.running[digest] = asyncio.get_running_loop().run_in_executor(self.pool, render, spec, options)
+        try:
+            document = await self.running[digest]
+        finally:
+            self.running.pop(digest, None)
+
+        body = json.dumps(document).encode()
+        self.responses[digest] = body
+        while len(self.responses) > self.cache_entries:
+            self.responses.popitem(last=False)
+        return body, False
+
+    # returns the status, body and any extra headers of the response to a request
+    async def respond(self, method, path, body):
+        self.counts["requests"] += 1
+        if path == "/health":
+            if method != "GET":
+                return 405, {"error": "Use GET for /health"}, {}
+            health = {"status": "ok", "version": aperture.__version__, "workers": self.workers, "cached": len(self.responses)}
+            health.update(self.counts)
+            return 200, health, {}
+
+        if path != "/design":
+            return 404, {"error": "Not found: " + path}, {}
+        if method != "POST":
+            return 405, {"error": "Use POST for /design"}, {}
+        try:
+            response, hit = await self.design(json.loads(body))
+        except (ValueError, ArithmeticError) as e:
+            # includes SpecificationError and requests that are not JSON, classified as aperture.sweep_point does
+            self.counts["errors"] += 1
+            return 400, {"error": str(e)}, {}
+        except (TypeError, KeyError) as e:
+            # a value of the wrong type in the spec, which its checks do not catch, is the client's error too
+            self.counts["errors"] += 1
+            return 400, {"error": type(e).__name__ + ": " + str(e)}, {}
+        except Exception as e:
+            self.counts["errors"] += 1
+            return 500, {"error": type(e).__name__ + ": " + str(e)}, {}
+        return 200, response, {"X-Aperture-Cache": "hit" if hit else "miss"}
+
+    # serves one connection, keeping it open between requests unless the client closes it
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self.send(writer, 400, {"error": "Malformed request line"}, {}, False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in [b"\r\n", b"\n", b""]:
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+                try:
+                    length = int(headers.get("content-length", 0) or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self.send(writer, 400, {"error": "Invalid Content-Length"}, {}, False)
+                    break
+                if length > max_body:
+                    await self.send(writer, 413, {"error": "Request body over " + str(max_body) + " bytes"}, {}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status, response, extra = await self.respond(method, path.split("?")[0], body)
+                await self.send(writer, status, response, extra, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    # writes a response, which is encoded JSON bytes or a document to encode
+    async def send(self, writer, status, response, extra, keep_alive):
+        if not isinstance(response, bytes):
+            response = json.dumps(response).encode()
+        headers = {"Content-Type": "application/json", "Content-Length": str(len(response)), "Connection": "keep-alive" if keep_alive else "close"}
+        headers.update(extra)
+        head = "HTTP/1.1 " + str(status) + " " + statuses[status] + "\r\n" + "".join(name + ": " + headers[name] + "\r\n" for name in headers) + "\r\n"
+        writer.write(head.encode("latin-1") + response)
+        await writer.drain()
+
+# serves designs until cancelled, on a unix socket if one is given, otherwise on host and port
+async def serve(host=default_host, port=default_port, unix=None, workers=1, cache_entries=default_cache_entries):
+    server = DesignServer(workers, cache_entries)
+    try:
+        await server.start()
+        if unix is not None:
+            listener = await asyncio.start_unix_server(server.handle, path=unix)
+            address = unix
+        else:
+            listener = await asyncio.start_server(server.handle, host, port)
+            address = "http://" + host + ":" + str(port)
+        print("Serving designs at " + address, flush=True)
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+# a connection to a running server, kept open between requests so each one skips the connection setup
+# from python:
+#     client = server.Client()
+#     result = client.design(spec)
+class Client:
+    def __init__(self, host=default_host, port=default_port, unix=None, timeout=60):
+        import http.client
+        if unix is not None:
+            import socket
+
+            class UnixConnection(http.client.HTTPConnection):
+                def connect(self):
+                    self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    self.sock.settimeout(timeout)
+                    self.sock.connect(unix)
+
+            self.connection = UnixConnection("localhost", timeout=timeout)
+        else:
+            self.connection = http.client.HTTPConnection(host, port, timeout=timeout)
+
+    # returns the status and decoded document of a response
+    def request(self, method, path, document=None):
+        body = None if document is None else json.dumps(document)
+        self.connection.request(method, path, body, {"Content-Type": "application/json"})
+        response = self.connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    # designs a spec, options are those of default_options
+    # returns the response document, with a binary DXF decoded to bytes
+    # raises ValueError if the server could not design it
+    def design(self, spec, **options):
+        request = dict(options)
+        request["spec"] = spec
+        status, document = self.request("POST", "/design", request)
+        if status != 200:
+            raise ValueError(document["error"])
+        if document.get("dxf_encoding") == "base64":
+            document["dxf"] = base64.b64decode(document["dxf"])
+        return document
+
+    def health(self):
+        return self.request("GET", "/health")[1]
+
+    def close(self):
+        self.connection.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve Aperture designs over HTTP")
+    parser.add_argument("--host", default=default_host, help="address to listen on (default: localhost only)")
+    parser.add_argument("--port", type=int, default=default_port, help="port to listen on")
+    parser.add_argument("--unix", metavar="PATH", help="listen on a unix socket instead of a port")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes designing requests, 0 designs in a thread of the server")
+    parser.add_argument("--cache-entries", type=int, default=default_cache_entries, help="responses kept in memory for repeated designs")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.workers, args.cache_entries))
+    except KeyboardInterrupt:
+        pass
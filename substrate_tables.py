@@ -0,0 +1,221 @@
+# Precomputed tables of microstrip lines on a substrate, looked up in place of solving for line widths
+# each table holds, for widths from a thousandth to a thousand times the dielectric thickness, the line impedance,
+# the effective wavelength times frequency and the mitred_corner of bends, from the formulas of em_arrays
+# tables are saved as .npy files, one per (dielectric_constant, dielectric_thickness, copper_thickness), and loaded
+# memory mapped and read only, so the worker processes of sweeps, batches and the server share one copy of each
+# file names carry table_version and a hash of the formulas, so tables made before either changed are never read
+# use with:
+#     python substrate_tables.py examples/*.json --directory DIR    (builds and checks the tables for those specs)
+#     python aperture.py spec.json --tables DIR
+# or from python, substrate_tables.use(directory) before designing
+
+import hashlib
+from math import exp
+import os
+import tempfile
+
+import numpy as np
+
+import em_arrays as ea
+import em_calcs
+from em_calcs import c
+
+# bumped whenever the layout of the tables changes
+table_version = 1
+
+# widths covered, in decades either side of the dielectric thickness, and the points in each half of the table
+span = 3
+points = 16385
+
+# largest relative error of any looked up value against the formulas, checked when a table is built
+accuracy = 1e-6
+
+# rows of a table, each with a value for every point
+rows = ["log_width", "width", "impedance", "wavelength_frequency", "mitred_corner"]
+
+directory = os.path.dirname(os.path.abspath(__file__))
+
+# hash of the formulas the tables are made from
+def formula_digest():
+    digest = hashlib.sha256()
+    for name in ["em_calcs.py", "em_arrays.py", "substrate_tables.py"]:
+        with open(os.path.join(directory, name), "rb") as source:
+            digest.update(source.read())
+    return digest.hexdigest()[:12]
+
+# file name of the table of a substrate
+def table_name(k, h, t, digest):
+    return "substrate_v" + str(table_version) + "_k" + repr(float(k)) + "_h" + repr(float(h)) + "_t" + repr(float(t)) + "_" + digest + ".npy"
+
+# computes the table of a substrate, shape (rows, 2*points), ordered from the widest line to the narrowest
+# so the impedance rises along it and can be searched
+# the impedance formulas step at width = h, so wide lines (the first half) and narrow lines (the second half)
+# each have their own grid, meeting at width = h with the wide formula at it and the narrow one just below it
+def compute_table(k, h):
+    wide = np.linspace(span*np.log(10), 0, points)
+    narrow = np.linspace(0, -span*np.log(10), points)
+    widths = h*np.exp(np.concatenate([wide, narrow]))
+    widths[points] = np.nextafter(h, 0)
+    return np.stack([
+        np.log(widths/h),
+        widths,
+        ea.microstrip_impedance(widths, k, h),
+        c/np.sqrt(ea.effective_dielectric_constant(widths, k, h)),
+        ea.mitred_corner(widths, h),
+    ])
+
+# the table of one substrate, with interpolated lookups that take numbers or arrays
+# values outside the widths or impedances covered are nan
+class SubstrateTable:
+    def __init__(self, table, k, h, t):
+        # a plain array over the same memory, indexing a memmap is several times slower
+        self.table = table.view(np.ndarray)
+        self.k = k
+        self.h = h
+        self.t = t
+        self.step = span*np.log(10)/(points - 1)
+        self.log_width = self.table[0]
+        self.impedances = self.table[2]
+
+    # interpolates a row at widths, within the half of the table on their side of the step
+    def row(self, name, width):
+        x = np.log(np.asarray(width, dtype=float)/self.h)
+        inside = (x >= -span*np.log(10)) & (x <= span*np.log(10))
+        narrow = x < 0
+        position = np.where(narrow, -x, span*np.log(10) - x)/self.step
+        local = np.clip(np.floor(position).astype(np.int64), 0, points - 2)
+        index = local + np.where(narrow, points, 0)
+        values = self.table[rows.index(name)]
+        result = values[index] + (position - local)*(values[index + 1] - values[index])
+        return np.where(inside, result, np.nan)
+
+    def impedance(self, width):
+        return self.row("impedance", width)
+
+    def effective_wavelength(self, width, frequency):
+        return self.row("wavelength_frequency", width)/frequency
+
+    def mitred_corner(self, width):
+        return self.row("mitred_corner", width)
+
+    # width of line with impedance z, interpolated in log width between the impedances either side
+    # impedances in the step at width = h give width h, as em_calcs.microstrip_width does
+    def microstrip_width(self, z):
+        z = np.asarray(z, dtype=float)
+        impedance = self.impedances
+        log_width = self.log_width
+        index = np.clip(np.searchsorted(impedance, z), 1, len(impedance) - 1)
+        low, high = impedance[index - 1], impedance[index]
+        x = log_width[index - 1] + (z - low)/(high - low)*(log_width[index] - log_width[index - 1])
+        inside = (z >= impedance[0]) & (z <= impedance[-1])
+        return np.where(inside, self.h*np.exp(x), np.nan)
+
+    # microstrip_width of a single impedance in plain floats, which skips numpy's overhead on single values
+    # returns None outside the table
+    def width(self, z):
+        impedance = self.impedances
+        index = int(impedance.searchsorted(z))
+        if index == 0 or index == len(impedance):
+            return None if z != impedance[0] else float(self.table[1, 0])
+        low, high = float(impedance[index - 1]), float(impedance[index])
+        before, after = float(self.log_width[index - 1]), float(self.log_width[index])
+        return self.h*exp(before + (z - low)/(high - low)*(after - before))
+
+    # largest relative error of each lookup against the formulas, at the midpoints between the table's points
+    # where linear interpolation is least accurate
+    def check(self):
+        k, h = self.k, self.h
+        x = self.table[0]
+        midpoints = np.concatenate([(x[:points - 1] + x[1:points])/2, (x[points:-1] + x[points + 1:])/2])
+        widths = h*np.exp(midpoints)
+        frequency = 1e9
+        errors = {
+            "impedance": self.impedance(widths)/ea.microstrip_impedance(widths, k, h) - 1,
+            "effective_wavelength": self.effective_wavelength(widths, frequency)/ea.effective_wavelength(widths, frequency, k, h) - 1,
+            "mitred_corner": self.mitred_corner(widths)/ea.mitred_corner(widths, h) - 1,
+        }
+        # widths looked up for impedances between the table's points, leaving out the step at width = h
+        impedance = self.impedances
+        targets = np.concatenate([(impedance[:points - 1] + impedance[1:points])/2, (impedance[points:-1] + impedance[points + 1:])/2])
+        errors["microstrip_width"] = ea.microstrip_impedance(self.microstrip_width(targets), k, h)/targets - 1
+        # and some of them one at a time, as em_calcs looks them up
+        sample = targets[::64]
+        widths = np.array([self.width(float(z)) for z in sample])
+        errors["microstrip_width"] = np.concatenate([errors["microstrip_width"], ea.microstrip_impedance(widths, k, h)/sample - 1])
+        return {name: float(np.max(np.abs(errors[name]))) for name in errors}
+
+# the tables of any number of substrates, kept in a directory
+# tables are built and saved the first time a substrate is used, and memory mapped after that
+class SubstrateTables:
+    def __init__(self, directory):
+        self.directory = directory
+        self.digest = formula_digest()
+        self.loaded = {} # (k, h, t) -> SubstrateTable
+
+    def path(self, k, h, t):
+        return os.path.join(self.directory, table_name(k, h, t, self.digest))
+
+    # builds the table of a substrate, checks its accuracy and saves it, replacing any table already saved
+    # raises ValueError if the table is not accurate to accuracy
+    def build(self, k, h, t):
+        table = SubstrateTable(compute_table(k, h), k, h, t)
+        errors = table.check()
+        if max(errors.values()) > accuracy:
+            raise ValueError("Substrate table for dielectric constant " + str(k) + " and thickness " + str(h) + " is not accurate to " + str(accuracy) + ": " + str(errors))
+
+        # saved under a temporary name and renamed, so processes building the same table at once do not clash
+        os.makedirs(self.directory, exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix=".npy.tmp")
+        try:
+            with os.fdopen(handle, "wb") as output:
+                np.save(output, table.table)
+            os.chmod(temporary, 0o644)
+            os.replace(temporary, self.path(k, h, t))
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return errors
+
+    # the table of a substrate, memory mapped from its file, which is built first if there is none
+    def table(self, k, h, t):
+        key = (k, h, t)
+        if key not in self.loaded:
+            path = self.path(k, h, t)
+            if not os.path.exists(path):
+                self.build(k, h, t)
+            table = np.load(path, mmap_mode="r")
+            if table.shape != (len(rows), 2*points):
+                raise ValueError("Substrate table " + path + " has shape " + str(table.shape) + ", delete it to rebuild it")
+            self.loaded[key] = SubstrateTable(table, k, h, t)
+        return self.loaded[key]
+
+    # the width em_calcs.microstrip_width would solve for, or None if the impedance is outside the table
+    def microstrip_width(self, z, h, k, t):
+        return self.table(k, h, t).width(z)
+
+# looks line widths up in the tables kept in directory rather than solving for them, None goes back to solving
+def use(directory):
+    em_calcs.tables = None if directory is None else SubstrateTables(directory)
+    em_calcs._microstrip_width.cache_clear()
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Builds and checks the substrate tables for the substrates of specifications")
+    parser.add_argument("specification", nargs="+", help="specification JSON files whose substrates to build tables for")
+    parser.add_argument("--directory", default=os.environ.get("APERTURE_TABLES_DIR"), required="APERTURE_TABLES_DIR" not in os.environ, help="directory of the tables (default: $APERTURE_TABLES_DIR)")
+    args = parser.parse_args()
+
+    tables = SubstrateTables(args.directory)
+    built = set()
+    for filename in args.specification:
+        with open(filename) as spec_file:
+            spec = json.load(spec_file)
+        key = (spec["dielectric_constant"], spec["dielectric_thickness"], spec["copper_thickness"])
+        if key in built:
+            continue
+        built.add(key)
+        errors = tables.build(*key)
+        print(tables.path(*key) + ": largest relative errors " + ", ".join(name + " " + "%.2e" % errors[name] for name in errors))
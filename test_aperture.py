@@ -0,0 +1,34 @@
+# Checks the ranges of a parameter sweep expand to their values, and bad ranges name their field
+
+import pytest
+
+from aperture import SpecificationError, expand_sweep, sweep_values
+
+@pytest.mark.parametrize("value, expected", [
+    ([1, 2, 5], [1, 2, 5]),
+    ({"start": 1, "stop": 2, "step": 0.5}, [1, 1.5, 2]),
+    ({"start": 2, "stop": 1, "step": -0.5}, [2, 1.5, 1]),
+    ({"start": 1, "stop": 2, "count": 3}, [1, 1.5, 2]),
+    ({"start": 1, "stop": 2, "count": 1}, [1]),
+])
+def test_sweep_values(value, expected):
+    assert sweep_values("frequency", value) == pytest.approx(expected)
+
+@pytest.mark.parametrize("value", [
+    {"start": 1, "stop": 2},
+    {"start": 1, "stop": 2, "steps": 0.5},
+    {"start": 1, "stop": 2, "step": 0.5, "count": 3},
+    {"start": 1, "stop": 2, "count": 0},
+    {"start": 1, "stop": 2, "count": -3},
+    {"start": 1, "stop": 2, "count": 2.5},
+    {"start": 1, "stop": 2, "step": 0},
+    {"start": 1, "stop": 2, "step": -0.5},
+    {"start": "1", "stop": 2, "step": 0.5},
+])
+def test_bad_range_names_field(value):
+    with pytest.raises(SpecificationError, match='"frequency"'):
+        sweep_values("frequency", value)
+
+def test_expand_sweep_names_field():
+    with pytest.raises(SpecificationError, match='"body_radius"'):
+        expand_sweep({"frequency": 1.5e9, "body_radius": {"start": 50, "end": 60, "step": 5}})
@@ -0,0 +1,40 @@
+# Checks a batch reports a record that fails as that record's error and carries on
+
+import io
+import json
+import os
+import tarfile
+
+import batch
+import gerber
+
+directory = os.path.dirname(os.path.abspath(__file__))
+
+options = {"tune": False, "instanced": False, "dxf_entity": "line", "binary_dxf": False, "gerber": True}
+
+def test_failed_gerber_is_one_error_line(monkeypatch):
+    with open(os.path.join(directory, "examples", "aquila_gps.json")) as spec_file:
+        spec = json.load(spec_file)
+    outputs = gerber.gerber_outputs
+
+    # the Gerber files of the two patch design cannot be written
+    def failing_outputs(spec, tree, points, antipad=None):
+        if spec["patch_count"] == 2:
+            raise ValueError("no outline")
+        return outputs(spec, tree, points, antipad)
+    monkeypatch.setattr(gerber, "gerber_outputs", failing_outputs)
+
+    source = io.StringIO("".join(json.dumps(dict(spec, patch_count=n)) + "\n" for n in [1, 2, 4]))
+    stream = io.BytesIO()
+    archive = batch.ArchiveWriter(stream, "tar")
+    results = io.StringIO()
+    counts = batch.run_batch(source, archive, results, options, workers=0)
+    archive.close()
+
+    assert counts == {"designed": 2, "failed": 1}
+    lines = [json.loads(line) for line in results.getvalue().splitlines()]
+    assert [line["status"] for line in lines] == ["ok", "error", "ok"]
+    assert lines[1]["error"] == "no outline"
+    names = tarfile.open(fileobj=io.BytesIO(stream.getvalue())).getnames()
+    assert not [name for name in names if name.startswith("000001")]
+    assert "000002-F_Cu.gbr" in names
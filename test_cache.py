@@ -0,0 +1,38 @@
+# Checks the shared output cache stores, fetches and evicts entries
+
+import os
+
+from cache import OutputCache
+
+def outputs(directory, name, size):
+    path = os.path.join(directory, name)
+    with open(path, "wb") as output:
+        output.write(b"x"*size)
+    return {name: path}
+
+def test_fetches_what_was_stored(tmp_path):
+    cache = OutputCache(str(tmp_path/"cache"))
+    cache.store("ab" + "0"*62, outputs(str(tmp_path), "design.dxf", 10))
+    fetched = str(tmp_path/"fetched.dxf")
+    assert cache.fetch("ab" + "0"*62, {"design.dxf": fetched})
+    assert os.path.getsize(fetched) == 10
+    assert not cache.fetch("cd" + "0"*62, {"design.dxf": fetched})
+
+def test_evicts_least_recently_used_entries(tmp_path):
+    cache = OutputCache(str(tmp_path/"cache"), max_size=250)
+    for i, digest in enumerate(["aa" + "0"*62, "bb" + "0"*62, "cc" + "0"*62]):
+        cache.store(digest, outputs(str(tmp_path), "design.dxf", 100))
+        os.utime(cache.entry(digest), (1000 + i, 1000 + i))
+    cache.evict()
+    assert not os.path.isdir(cache.entry("aa" + "0"*62))
+    assert os.path.isdir(cache.entry("bb" + "0"*62))
+    assert os.path.isdir(cache.entry("cc" + "0"*62))
+
+def test_ignores_files_in_the_cache_directory(tmp_path):
+    cache = OutputCache(str(tmp_path/"cache"), max_size=0)
+    os.makedirs(cache.path)
+    with open(os.path.join(cache.path, "README"), "w") as readme:
+        readme.write("shared aperture outputs")
+    cache.store("ab" + "0"*62, outputs(str(tmp_path), "design.dxf", 10))
+    assert os.path.exists(os.path.join(cache.path, "README"))
+    assert not os.path.isdir(cache.entry("ab" + "0"*62))
@@ -0,0 +1,50 @@
+# Checks the meshes of the conformed design are closed solids, which slicers and mesh tools need
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+import conform
+from aperture import design
+
+directory = os.path.dirname(os.path.abspath(__file__))
+
+def example(name):
+    with open(os.path.join(directory, "examples", name + ".json")) as spec_file:
+        return design(json.load(spec_file))
+
+# the faces of triangles as indices into their shared vertices, and the edges of the faces as they run round them
+def edges(triangles):
+    vertices, faces = np.unique(triangles.reshape(-1, 3), axis=0, return_inverse=True)
+    faces = faces.reshape(-1, 3)
+    return np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]])
+
+def volume(triangles):
+    return np.einsum("ij,ij->i", triangles[:, 0], np.cross(triangles[:, 1], triangles[:, 2])).sum()/6
+
+@pytest.mark.parametrize("name", ["aquila_gps", "aquila_telem"])
+@pytest.mark.parametrize("mesh", ["copper", "substrate"])
+def test_mesh_is_closed(name, mesh):
+    result = example(name)
+    triangles = getattr(conform, mesh + "_mesh")(result.spec, result.points)
+    directed = edges(triangles)
+
+    # every edge has exactly two faces, which run along it in opposite directions
+    unique, counts = np.unique(np.sort(directed, axis=1), axis=0, return_counts=True)
+    assert np.all(counts == 2)
+    unique, counts = np.unique(directed, axis=0, return_counts=True)
+    assert np.all(counts == 1)
+    assert volume(triangles) > 0
+
+# the copper's volume is its area on the board times its thickness, a little more as it sits outside the body
+def test_copper_volume():
+    result = example("aquila_gps")
+    spec = result.spec
+    vertices, faces = conform.fill_faces(result.points, conform.max_facet_angle*spec["body_radius"])
+    a, b, c = vertices[faces[:, 0]], vertices[faces[:, 1]], vertices[faces[:, 2]]
+    area = np.sum((b[:, 0] - a[:, 0])*(c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1])*(c[:, 0] - a[:, 0]))/2
+    radius = spec["body_radius"] + spec["dielectric_thickness"] + spec["copper_thickness"]/2
+    expected = area*spec["copper_thickness"]*radius/spec["body_radius"]
+    assert volume(conform.copper_mesh(spec, result.points)) == pytest.approx(expected, rel=1e-3)
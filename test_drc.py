@@ -0,0 +1,56 @@
+# Checks the design rule check finds narrow gaps and leaves clean designs alone
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+import drc
+from aperture import design
+from components import Component, Dir
+
+directory = os.path.dirname(os.path.abspath(__file__))
+
+def example(name):
+    with open(os.path.join(directory, "examples", name + ".json")) as spec_file:
+        return json.load(spec_file)
+
+# copper drawn as a fixed outline
+class Outline(Component):
+    def __init__(self, spec, points):
+        super().__init__(spec, [])
+        self.points = points
+        self.direction = Dir.LEFT
+
+    def plot_into(self, buffer, start):
+        self.add_points(buffer, start, self.points)
+
+# a base with a post rising from its left end, and a line coming back over the base from a riser at its right end,
+# ending at end_x just above and to the right of the top of the post, so the end of the line is beside the top
+# edge of the post, perpendicular to it, and no edges face each other across the gap
+def hook(end_x):
+    return [[0, 0], [10, 0], [10, 6], [end_x, 6], [end_x, 5], [9, 5], [9, 1], [1, 1], [1, 4.9], [0, 4.9]]
+
+def test_line_ending_beside_perpendicular_edge():
+    spec = example("aquila_gps")
+    violations = drc.check(spec, Outline(spec, hook(1.05)))
+    assert [item["rule"] for item in violations] == ["clearance"]
+    assert violations[0]["value"] == pytest.approx(np.hypot(0.05, 0.1))
+    assert violations[0]["location"] == pytest.approx([1.025, 4.95])
+
+def test_line_ending_clear_of_perpendicular_edge():
+    spec = example("aquila_gps")
+    assert drc.check(spec, Outline(spec, hook(1.2))) == []
+
+@pytest.mark.parametrize("name", ["aquila_gps", "aquila_telem"])
+def test_examples_are_clean(name):
+    assert design(example(name)).check() == []
+
+# the unequal splitter of odd counts keeps copper around the feed pin on its narrower arm
+@pytest.mark.parametrize("patch_count", [3, 5, 7, 9])
+def test_odd_arrays_are_clean(patch_count):
+    spec = example("aquila_gps")
+    spec["patch_count"] = patch_count
+    spec["body_radius"] = 25*patch_count
+    assert design(spec).check() == []
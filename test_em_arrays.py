@@ -0,0 +1,70 @@
+# Checks the array formulas give the results of the scalar ones in em_calcs
+
+import numpy as np
+
+import em_arrays as ea
+import em_calcs as em
+
+def test_microstrip_width_matches_scalar_solver():
+    impedances = np.linspace(10, 200, 400)
+    widths = ea.microstrip_width(impedances[:, None], [2.2, 4.4, 10.2], 1.6)
+    for j, k in enumerate([2.2, 4.4, 10.2]):
+        spec = {"dielectric_thickness": 1.6, "dielectric_constant": k, "copper_thickness": 0.035}
+        expected = [em.microstrip_width(z, spec) for z in impedances]
+        assert np.allclose(widths[:, j], expected, rtol=1e-6)
+
+def test_microstrip_width_is_nan_without_a_width():
+    assert np.isnan(ea.microstrip_width([0, -50, 1e5], 4.4, 1.6)).all()
+
+# a grid of substrates and frequencies, as specs for the scalar functions and broadcast arrays for the array ones
+frequencies = np.array([0.4e9, 1.575e9, 2.45e9, 5.8e9])
+dielectric_constants = np.array([2.2, 3.66, 4.4, 10.2])
+thicknesses = np.array([0.254, 0.51, 0.8, 1.6])
+
+def grid():
+    f, k, h = np.meshgrid(frequencies, dielectric_constants, thicknesses, indexing="ij")
+    specs = [{"frequency": a, "dielectric_constant": b, "dielectric_thickness": c} for a, b, c in zip(f.ravel(), k.ravel(), h.ravel())]
+    return f.ravel(), k.ravel(), h.ravel(), specs
+
+# line widths as fractions of the thickness, either side of and at the narrow/wide boundary width/h = 1
+width_ratios = np.array([0.05, 0.5, 1 - 1e-9, 1, 1 + 1e-9, 2, 10])
+
+def scalar(function, specs, *args):
+    return np.array([function(spec, *args) for spec in specs], dtype=float)
+
+def test_line_formulas_match_scalar():
+    f, k, h, specs = grid()
+    for ratio in width_ratios:
+        width = ratio*h
+        assert np.allclose(ea.effective_wavelength(width, f, k, h), [em.effective_wavelength(w, spec) for w, spec in zip(width, specs)], rtol=1e-12)
+        assert np.allclose(ea.microstrip_impedance(width, k, h), [em.microstrip_impedance(w, spec) for w, spec in zip(width, specs)], rtol=1e-12)
+        assert np.allclose(ea.mitred_corner(width, h), [em.mitred_corner(w, spec) for w, spec in zip(width, specs)], rtol=1e-12)
+    assert np.allclose(ea.wavelength(f, k), scalar(em.wavelength, specs), rtol=1e-12)
+
+def test_patch_formulas_match_scalar():
+    f, k, h, specs = grid()
+    assert np.allclose(ea.microstrip_patch(f, k, h), np.transpose([em.microstrip_patch(spec) for spec in specs]), rtol=1e-12)
+    assert np.allclose(ea.square_patch(f, k, h), np.transpose([em.square_patch(spec) for spec in specs]), rtol=1e-12)
+    for ratio in width_ratios:
+        width = 20*ratio*h
+        assert np.allclose(ea.microstrip_patch_impedance(width, f, k, h), [em.microstrip_patch_impedance(spec, w) for w, spec in zip(width, specs)], rtol=1e-12)
+
+def test_patch_length_override_matches_scalar():
+    f, k, h, specs = grid()
+    overridden = [dict(spec, patch_length=31.5) for spec in specs]
+    assert np.allclose(ea.microstrip_patch(f, k, h, 31.5), np.transpose([em.microstrip_patch(spec) for spec in overridden]), rtol=1e-12)
+    assert np.allclose(ea.square_patch(f, k, h, 31.5), np.transpose([em.square_patch(spec) for spec in overridden]), rtol=1e-12)
+
+# impedances below the edge impedance are matched by an inset, those above it by none, giving nan
+def test_inset_distance_matches_scalar():
+    f, k, h, specs = grid()
+    for zin in [10, 50, 200, 1000]:
+        expected = scalar(em.inset_distance, specs, zin)
+        assert np.isnan(expected).any() or zin < 200
+        assert np.allclose(ea.inset_distance(zin, f, k, h), expected, rtol=1e-12, equal_nan=True)
+
+        lengthened = [dict(spec, patch_length=31.5) for spec in specs]
+        assert np.allclose(ea.inset_distance(zin, f, k, h, patch_length=31.5), scalar(em.inset_distance, lengthened, zin), rtol=1e-12, equal_nan=True)
+
+        inset = [dict(spec, inset_distance=4.2) for spec in specs]
+        assert np.allclose(ea.inset_distance(zin, f, k, h, inset_distance=4.2), scalar(em.inset_distance, inset, zin), rtol=1e-12)
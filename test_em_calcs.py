@@ -0,0 +1,40 @@
+# Checks microstrip_width meets its tolerance and counts its work whether or not the answer was cached
+
+import em_calcs as em
+import substrate_tables
+
+spec = {"dielectric_thickness": 1.6, "dielectric_constant": 4.4, "copper_thickness": 0.035}
+
+# the counters changed by running f
+def work(f):
+    before = dict(em.counters)
+    f()
+    return {key.replace("microstrip_width_", ""): em.counters[key] - before[key] for key in em.counters}
+
+def test_cache_hits_are_counted():
+    em._microstrip_width.cache_clear()
+    counted = work(lambda: [em.microstrip_width(50, spec) for i in range(3)])
+    assert counted["calls"] == 3
+    assert counted["solves"] == 1
+    assert counted["hits"] == 2
+
+def test_steps_are_counted_on_every_call():
+    em._microstrip_width.cache_clear()
+    z = sum(em.impedance_step(spec))/2
+    counted = work(lambda: [em.microstrip_width(z, spec) for i in range(2)])
+    assert counted["steps"] == 2
+    assert counted["solves"] == 1
+
+def test_looked_up_widths_meet_the_tolerance(tmp_path):
+    substrate_tables.use(str(tmp_path))
+    try:
+        counted = work(lambda: em.microstrip_width(73.3, spec))
+        assert counted["lookups"] == 1
+        assert abs(em.microstrip_impedance(em.microstrip_width(73.3, spec), spec) - 73.3) < 1e-6
+
+        counted = work(lambda: em.microstrip_width(73.3, spec, tolerance=1e-11))
+        assert counted["lookups"] == 0
+        assert counted["solves"] == 1
+        assert abs(em.microstrip_impedance(em.microstrip_width(73.3, spec, tolerance=1e-11), spec) - 73.3) < 1e-11
+    finally:
+        substrate_tables.use(None)
@@ -0,0 +1,95 @@
+# Checks the far field estimate against hand computed patterns
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+from aperture import design
+from em_calcs import c
+import far_field as ff
+
+directory = os.path.dirname(os.path.abspath(__file__))
+
+def example(name, patch_count):
+    with open(os.path.join(directory, "examples", name + ".json")) as spec_file:
+        spec = json.load(spec_file)
+    spec["body_radius"] = 25*patch_count
+    spec["patch_count"] = patch_count
+    return spec
+
+# the cavity model far_field.py describes, written out for a patch facing along +x at the origin
+def cavity_model(frequency, radius, width, length, polarisation, theta, phi):
+    k0 = 2*np.pi*frequency/c
+    a = np.sin(theta)*np.cos(phi)
+    v = np.sin(theta)*np.sin(phi)
+    u = np.cos(theta)
+    axial = np.sinc(k0*width*v/2/np.pi)*np.cos(k0*length*u/2)
+    e_theta = -axial*np.cos(phi)
+    e_phi = axial*np.cos(theta)*np.sin(phi) + 1j*polarisation*np.sinc(k0*width*u/2/np.pi)*np.cos(k0*length*v/2)*np.sin(theta)
+    phase = np.where(a > 0, np.exp(1j*k0*radius*a), 0)
+    return e_theta*phase, e_phi*phase
+
+@pytest.mark.parametrize("name", ["aquila_gps", "aquila_telem"])
+def test_single_patch_peaks_at_broadside(name):
+    field = design(example(name, 1)).far_field()
+    theta, phi = np.unravel_index(np.argmax(field.gain), field.gain.shape)
+    assert field.theta[theta] == pytest.approx(np.pi/2)
+    assert field.phi[phi] == 0
+    # nothing is radiated behind the patch
+    assert field.gain_db()[theta, len(field.phi)//2] == -100
+
+def test_circular_patch_is_circular_at_broadside():
+    field = design(example("aquila_gps", 1)).far_field()
+    assert field.axial_ratio_db()[90, 0] == pytest.approx(0, abs=1e-9)
+    assert field.e_phi[90, 0] == pytest.approx(-1j*field.e_theta[90, 0])
+
+@pytest.mark.parametrize("polarisation", [0, 1, -1])
+def test_table_matches_cavity_model(polarisation):
+    theta = tuple(np.radians(np.arange(0, 181, 5)))
+    e_theta, e_phi = ff.element_table(1.575e9, 64, 60.0, 62.0, polarisation, theta)
+    phi = np.arange(0, 2*np.pi, ff.table_step)
+    expected_theta, expected_phi = cavity_model(1.575e9, 64, 60.0, 62.0, polarisation, np.array(theta)[:, None], phi[None, :])
+    assert np.allclose(e_theta, expected_theta, atol=1e-12)
+    assert np.allclose(e_phi, expected_phi, atol=1e-12)
+
+# patches placed around the body between the table's azimuths are interpolated from it
+@pytest.mark.parametrize("name", ["aquila_gps", "aquila_telem"])
+def test_array_matches_cavity_model(name):
+    spec = example(name, 3)
+    result = design(spec)
+    field = result.far_field(theta_step=5, phi_step=7)
+    angles, heights, patches = ff.patch_positions(result.spec, result.tree)
+    polarisation = getattr(patches[0], "polarisation", 0)
+    radius = spec["body_radius"] + spec["dielectric_thickness"]
+    k0 = 2*np.pi*spec["frequency"]/c
+    theta = field.theta[:, None]
+    e_theta = 0
+    e_phi = 0
+    for angle, height in zip(angles, heights):
+        element = cavity_model(spec["frequency"], radius, patches[0].width, patches[0].length, polarisation, theta, field.phi[None, :] - angle)
+        e_theta = e_theta + element[0]*np.exp(1j*k0*height*np.cos(theta))
+        e_phi = e_phi + element[1]*np.exp(1j*k0*height*np.cos(theta))
+    peak = np.max(np.abs(e_theta) + np.abs(e_phi))
+    assert np.max(np.abs(field.e_theta - e_theta)) < 1e-3*peak
+    assert np.max(np.abs(field.e_phi - e_phi)) < 1e-3*peak
+
+# N isotropic sources on a ring, in phase, add up along the axis to N times the field of one
+# so the gain there is N^2 over the mean intensity, the sum over pairs of sinc(k0 distance)
+@pytest.mark.parametrize("count", [1, 2, 4, 8])
+def test_in_phase_ring_gain(count):
+    frequency = 1.575e9
+    k0 = 2*np.pi*frequency/c
+    radius = 0.6*c/frequency
+    theta = np.radians(np.arange(0, 180.25, 0.25))
+    phi = np.radians(np.arange(0, 360, 0.5))
+    angles = 2*np.pi*np.arange(count)/count
+    field = sum(np.exp(1j*k0*radius*np.sin(theta)[:, None]*np.cos(phi[None, :] - angle)) for angle in angles)
+    gain = ff.FarField(theta, phi, field, np.zeros_like(field)).gain
+
+    distances = 2*radius*np.abs(np.sin((angles[:, None] - angles[None, :])/2))
+    expected = count**2/np.sum(np.sinc(k0*distances/np.pi))
+    assert gain[0, 0] == pytest.approx(expected, rel=1e-3)
+    # far apart sources add in power over the sphere, so the gain along the axis approaches N
+    assert gain[0, 0] == pytest.approx(count, rel=0.3)
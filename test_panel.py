@@ -0,0 +1,84 @@
+# Checks boards are packed onto a panel without overlapping and turned without being mirrored
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+from aperture import design
+import panel
+
+directory = os.path.dirname(os.path.abspath(__file__))
+
+def example(name):
+    with open(os.path.join(directory, "examples", name + ".json")) as spec_file:
+        return json.load(spec_file)
+
+# the rectangles [left, top, right, bottom] pack placed sizes at
+def rectangles(sizes, placements):
+    result = []
+    for [w, h], placement in zip(sizes, placements):
+        if placement is not None:
+            x, y, turned = placement
+            if turned:
+                w, h = h, w
+            result.append([x, y, x + w, y + h])
+    return result
+
+def overlap(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+@pytest.mark.parametrize("rotate", [True, False])
+@pytest.mark.parametrize("seed", range(5))
+def test_pack_places_boards_inside_without_overlap(seed, rotate):
+    sizes = np.random.default_rng(seed).uniform(5, 60, (40, 2)).tolist()
+    placements = panel.pack(sizes, 200, 150, rotate)
+    placed = rectangles(sizes, placements)
+    assert len(placed) > 10
+    for i, a in enumerate(placed):
+        assert 0 <= a[0] and a[2] <= 200 and 0 <= a[1] and a[3] <= 150
+        for b in placed[i + 1:]:
+            assert not overlap(a, b)
+    if not rotate:
+        assert not any(placement[2] for placement in placements if placement is not None)
+
+def test_pack_turns_boards_to_fit():
+    assert panel.pack([[30, 100]], 100, 40) == [[0, 0, True]]
+    assert panel.pack([[30, 100]], 100, 40, rotate=False) == [None]
+
+def test_turned_placement_is_a_rotation():
+    result = design(example("aquila_gps"))
+    upright = panel.Placement("gps", result, 5, 7, False)
+    turned = panel.Placement("gps", result, 5, 7, True)
+    triangle = np.array([[0, 0], [10, 0], [0, 5]], dtype=float) + upright.corners[0]
+
+    # the map is affine, so its linear part comes from the images of the triangle's edges
+    # a rotation keeps lengths and has determinant 1, a reflection would have determinant -1
+    for placement, expected in [(upright, [[1, 0], [0, 1]]), (turned, [[0, -1], [1, 0]])]:
+        placed = placement.place(triangle, [0, 0])
+        linear = np.stack([(placed[1] - placed[0])/10, (placed[2] - placed[0])/5], 1)
+        assert np.allclose(linear, expected)
+        assert np.linalg.det(linear) == pytest.approx(1)
+
+    # the whole design lands inside the board's edge as placed
+    for placement in [upright, turned]:
+        points = placement.place(result.points, [10, 10])
+        [left, top], [right, bottom] = placement.edge([10, 10])
+        assert np.all(points >= [left - 1e-9, top - 1e-9]) and np.all(points <= [right + 1e-9, bottom + 1e-9])
+
+def test_panelize_keeps_boards_apart():
+    designs = [["gps", design(example("aquila_gps"))], ["telem", design(example("aquila_telem"))]]*3
+    result = panel.panelize(designs, 1500, 600, spacing=3)
+    edges = [placement.edge([0, 0]) for placement in result.placements]
+    for i, [[left, top], [right, bottom]] in enumerate(edges):
+        assert left >= 3 and top >= 3 and right <= 1497 and bottom <= 597
+        for [[other_left, other_top], [other_right, other_bottom]] in edges[i + 1:]:
+            assert not overlap([left - 3, top - 3, right + 3, bottom + 3], [other_left, other_top, other_right, other_bottom])
+
+def test_panelize_names_boards_that_do_not_fit():
+    gps = design(example("aquila_gps"))
+    width, height = panel.Placement("gps", gps, 0, 0, False).size()
+    designs = [["first", gps], ["second", gps], ["third", gps]]
+    with pytest.raises(ValueError, match="2 of 3 boards do not fit.*: second, third"):
+        panel.panelize(designs, width + 4, height + 4, spacing=2, rotate=False)
@@ -0,0 +1,60 @@
+# Checks the feed network built for any number of patches feeds every patch in phase
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+import circuit
+import em_calcs as em
+from aperture import design
+from components import LinearPatch, PowerSplitter2, SquarePatch
+
+directory = os.path.dirname(os.path.abspath(__file__))
+
+def example(name, patch_count):
+    with open(os.path.join(directory, "examples", name + ".json")) as spec_file:
+        spec = json.load(spec_file)
+    # a body big enough for the splitter arms to fit between the patches
+    spec["body_radius"] = 25*patch_count
+    spec["patch_count"] = patch_count
+    return spec
+
+# [y, length of line from the feed] of every patch of a tree, each splitter arm counted as a quarter wave of 50 ohm line
+def patch_paths(spec, tree):
+    solver = circuit.CircuitSolver(spec, np.array([spec["frequency"]], dtype=float))
+    arm = em.effective_wavelength(em.microstrip_width(50, spec), spec)/4
+    paths = []
+
+    def visit(component, start, length):
+        if isinstance(component, (LinearPatch, SquarePatch)):
+            paths.append([start[1], length])
+            return
+        line = solver.line(component, start)
+        if line is not None:
+            length += line[1]
+        if isinstance(component, PowerSplitter2):
+            length += arm
+        for child, child_start in circuit.child_placements(component, start):
+            visit(child, child_start, length)
+
+    visit(tree, [0.0, 0.0], 0)
+    return np.array(paths)
+
+@pytest.mark.parametrize("name", ["aquila_gps", "aquila_telem"])
+@pytest.mark.parametrize("patch_count", [3, 5, 6, 7, 11])
+def test_patches_level_and_in_phase(name, patch_count):
+    result = design(example(name, patch_count), tune=True)
+    paths = patch_paths(result.spec, result.tree)
+    assert len(paths) == patch_count
+    assert np.ptp(paths[:, 0]) < 1e-9
+    assert np.ptp(paths[:, 1]) < 1e-6
+
+    phases = result.circuit().summary()["port_phase"]
+    assert max(phases) - min(phases) < 0.1
+
+# power of two arrays are symmetric and need no detours
+def test_even_split_has_no_detours():
+    result = design(example("aquila_gps", 8))
+    assert "MeanderedBend" not in {type(component).__name__ for component, start in result.tree.placements()}
@@ -0,0 +1,51 @@
+# Checks the server answers bad requests with 400 rather than dropping the connection or failing with 500
+
+import asyncio
+import json
+import os
+
+import pytest
+
+import server
+
+directory = os.path.dirname(os.path.abspath(__file__))
+
+def example(name):
+    with open(os.path.join(directory, "examples", name + ".json")) as spec_file:
+        return json.load(spec_file)
+
+# sends raw request bytes to a server designing in this process, returns the status and decoded body
+def exchange(request):
+    async def run():
+        design_server = server.DesignServer(workers=0)
+        listener = await asyncio.start_server(design_server.handle, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        async with listener:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(request)
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+        head, _, body = response.partition(b"\r\n\r\n")
+        return int(head.split()[1]), json.loads(body)
+    return asyncio.run(run())
+
+def post(body, length=None):
+    length = str(len(body)) if length is None else length
+    return b"POST /design HTTP/1.1\r\nContent-Length: " + length.encode() + b"\r\nConnection: close\r\n\r\n" + body
+
+@pytest.mark.parametrize("length", ["many", "-5", "1.5"])
+def test_invalid_content_length(length):
+    assert exchange(post(b"{}", length)) == (400, {"error": "Invalid Content-Length"})
+
+@pytest.mark.parametrize("change", [{"frequency": "1575 MHz"}, {"dielectric_thickness": 0}, {"body_radius": None}])
+def test_wrongly_typed_spec_is_client_error(change):
+    spec = dict(example("aquila_gps"), **change)
+    status, document = exchange(post(json.dumps({"spec": spec}).encode()))
+    assert status == 400
+    assert document["error"]
+
+def test_design():
+    status, document = exchange(post(json.dumps({"spec": example("aquila_gps")}).encode()))
+    assert status == 200
+    assert document["kicad_pcb"]
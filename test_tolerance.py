@@ -0,0 +1,26 @@
+# Checks the tolerance analysis rejects a number of boards it cannot sample
+
+import json
+import os
+
+import pytest
+
+import tolerance
+from aperture import design
+
+directory = os.path.dirname(os.path.abspath(__file__))
+
+def example(name):
+    with open(os.path.join(directory, "examples", name + ".json")) as spec_file:
+        return json.load(spec_file)
+
+@pytest.mark.parametrize("draws", [0, -5, 2.5, float("nan"), float("inf"), "100"])
+def test_bad_draws_raise_value_error(draws):
+    result = design(example("aquila_gps"))
+    with pytest.raises(ValueError):
+        result.tolerance(draws)
+    with pytest.raises(ValueError):
+        tolerance.tolerance_analysis(result.spec, result.parameters, draws)
+
+def test_single_draw():
+    assert len(design(example("aquila_gps")).tolerance(1).samples["feed_impedance_error"]) == 1
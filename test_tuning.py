@@ -0,0 +1,28 @@
+# Checks a tuned patch is matched to the 50 ohm feed at the spec frequency
+
+import json
+import os
+
+import pytest
+
+from aperture import design
+
+directory = os.path.dirname(os.path.abspath(__file__))
+
+def example(name, patch_count):
+    with open(os.path.join(directory, "examples", name + ".json")) as spec_file:
+        spec = json.load(spec_file)
+    spec["body_radius"] = 25*patch_count
+    spec["patch_count"] = patch_count
+    return spec
+
+@pytest.mark.parametrize("patch_count", [1, 2, 3])
+@pytest.mark.parametrize("name", ["aquila_gps", "aquila_telem"])
+def test_tuned_design_is_matched(name, patch_count):
+    tuned = design(example(name, patch_count), tune=True)
+    assert tuned.circuit().summary(tuned.tuned.resonant_frequency)["s11_db"] < -20
+
+def test_circular_match_uses_tuned_impedance():
+    tuned = design(example("aquila_gps", 1), tune=True)
+    assert tuned.spec["patch_impedance"] == pytest.approx(tuned.tuned.impedance.real)
+    assert tuned.parameters["patch_impedance"] == pytest.approx(tuned.tuned.impedance.real)
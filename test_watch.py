@@ -0,0 +1,50 @@
+# Checks the watcher survives specification files saved with mistakes in them
+
+import json
+import os
+import shutil
+
+import pytest
+
+import watch
+
+directory = os.path.dirname(os.path.abspath(__file__))
+
+options = {"tune": False, "instanced": False, "dxf_entity": "line", "binary_dxf": False}
+
+def save(path, spec, version):
+    with open(path, "w") as spec_file:
+        json.dump(spec, spec_file)
+    # polled by modification time, so each save is made to look newer than the last
+    os.utime(path, ns=(version*10**9, version*10**9))
+
+@pytest.mark.parametrize("change", [
+    {"frequency": "1575 MHz"},
+    {"dielectric_thickness": 0},
+    {"body_radius": None},
+    "half saved",
+])
+def test_bad_edit_keeps_watching(tmp_path, capsys, change):
+    path = str(tmp_path / "spec.json")
+    shutil.copy(os.path.join(directory, "examples", "aquila_gps.json"), path)
+    with open(path) as spec_file:
+        spec = json.load(spec_file)
+    watched = watch.WatchedSpecification(path, options)
+    watched.check()
+    assert os.path.exists(watched.outputs["dxf"])
+
+    if change == "half saved":
+        with open(path, "w") as spec_file:
+            spec_file.write(json.dumps(spec)[:40])
+        os.utime(path, ns=(2*10**9, 2*10**9))
+    else:
+        save(path, dict(spec, **change), 2)
+    watched.check()
+    assert "spec.json: " in capsys.readouterr().out
+
+    # the same file is not tried again, the next save is
+    watched.check()
+    assert capsys.readouterr().out == ""
+    save(path, dict(spec, patch_count=2), 3)
+    watched.check()
+    assert "rebuilt the array" in capsys.readouterr().out
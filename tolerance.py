@@ -0,0 +1,122 @@
+# Monte Carlo tolerance analysis of a design over substrate and etching variation
+# each draw picks a dielectric constant, dielectric thickness and etch, builds the copper of the nominal design
+# (the parameters of aperture.calculate_parameters) on it and evaluates the batched formulas of em_arrays for all draws at once
+# etch is the change in width of every copper feature, positive when the copper comes out wider
+# tolerances are the limits of each variation: 3 sigma of a normal distribution, or the bounds of a uniform one
+
+import numpy as np
+
+import em_arrays as ea
+
+# typical of Rogers RT/duroid 5880 and the etching of a board house, in the units of the spec (mm)
+default_tolerances = {"dielectric_constant": 0.02, "dielectric_thickness": 0.0254, "etch": 0.025}
+
+# draws are evaluated this many at a time, to keep the arrays in memory small
+chunk_size = 250000
+
+# quantities reported for each draw, with their units
+metrics = {
+    "resonant_frequency_shift": "Hz",
+    "feed_impedance_error": "ohm",
+    "patch_match_length_error": "mm",
+    "patch_match_phase_error": "deg",
+    "splitter_match_length_error": "mm",
+    "splitter_match_phase_error": "deg",
+}
+
+# draws count values of each varied parameter around the spec's nominal values
+def draw(spec, tolerances, count, rng, distribution="normal"):
+    nominal = {"dielectric_constant": spec["dielectric_constant"], "dielectric_thickness": spec["dielectric_thickness"], "etch": 0}
+    values = {}
+    for name in nominal:
+        if distribution == "uniform":
+            values[name] = nominal[name] + rng.uniform(-tolerances[name], tolerances[name], count)
+        else:
+            values[name] = nominal[name] + rng.normal(0, tolerances[name]/3, count)
+    return values
+
+# error of a quarter wave line of given nominal width and length, built on the drawn board
+# returns the length error in mm, against the length a quarter wave would have had, and the phase error in degrees
+def quarter_wave_error(width, length, frequency, k, h, etch):
+    quarter_wave = ea.effective_wavelength(width + etch, frequency, k, h)/4
+    return length - quarter_wave, 90*(length/quarter_wave - 1)
+
+# evaluates every metric for the drawn values, copper holds the nominal design's parameters
+# returns a dictionary of arrays
+def evaluate(spec, copper, values):
+    f = spec["frequency"]
+    k = values["dielectric_constant"]
+    h = values["dielectric_thickness"]
+    etch = values["etch"]
+
+    nominal_resonance = ea.patch_resonant_frequency(copper["patch_width"], copper["patch_length"], spec["dielectric_constant"], spec["dielectric_thickness"])
+    resonance = ea.patch_resonant_frequency(copper["patch_width"] + etch, copper["patch_length"] + etch, k, h)
+
+    result = {
+        "resonant_frequency_shift": resonance - nominal_resonance,
+        "feed_impedance_error": ea.microstrip_impedance(copper["width_50"] + etch, k, h) - 50,
+    }
+    for name in ["patch_match", "splitter_match"]:
+        length_error, phase_error = quarter_wave_error(copper[name + "_width"], copper[name + "_length"], f, k, h, etch)
+        result[name + "_length_error"] = length_error
+        result[name + "_phase_error"] = phase_error
+    return result
+
+# draws and evaluates one chunk, seeded so results do not depend on how the draws are split between processes
+# returns a dictionary of float32 arrays
+def evaluate_chunk(spec, parameters, tolerances, count, seed, distribution="normal"):
+    rng = np.random.default_rng(seed)
+    result = evaluate(spec, parameters, draw(spec, tolerances, count, rng, distribution))
+    return {name: result[name].astype(np.float32) for name in result}
+
+# the distributions found by tolerance_analysis
+class ToleranceResult:
+    def __init__(self, samples, draws, tolerances, distribution):
+        self.samples = samples
+        self.draws = draws
+        self.tolerances = tolerances
+        self.distribution = distribution
+
+    # mean, standard deviation, extremes and percentiles of each metric
+    def statistics(self, percentiles=[1, 5, 50, 95, 99]):
+        result = {}
+        for name in self.samples:
+            values = self.samples[name].astype(float)
+            result[name] = {"mean": float(values.mean()), "std": float(values.std()), "min": float(values.min()), "max": float(values.max())}
+            for percentile, value in zip(percentiles, np.percentile(values, percentiles)):
+                result[name]["p" + str(percentile)] = float(value)
+        return result
+
+# raises ValueError unless draws is a whole number of boards, at least one
+def check_draws(draws):
+    try:
+        whole = draws == int(draws)
+    except (TypeError, ValueError, OverflowError):
+        whole = False
+    if not whole or draws < 1:
+        raise ValueError("Tolerance analysis needs a whole number of draws of at least 1, not " + str(draws))
+
+# samples draws boards around a design, given its spec and parameters, and returns their ToleranceResult
+# tolerances overrides any of default_tolerances, distribution is "normal" or "uniform"
+# workers runs the chunks in that many processes, by default they are run here
+def tolerance_analysis(spec, parameters, draws=100000, tolerances=None, distribution="normal", seed=0, workers=None):
+    check_draws(draws)
+    draws = int(draws)
+    limits = dict(default_tolerances)
+    limits.update(tolerances or {})
+    if distribution not in ["normal", "uniform"]:
+        raise ValueError("Tolerance distribution must be normal or uniform, not " + str(distribution))
+
+    counts = [min(chunk_size, draws - i) for i in range(0, draws, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(counts))
+    arguments = [[spec] * len(counts), [parameters] * len(counts), [limits] * len(counts), counts, seeds, [distribution] * len(counts)]
+
+    if workers is None:
+        chunks = list(map(evaluate_chunk, *arguments))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunks = list(pool.map(evaluate_chunk, *arguments))
+
+    samples = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in metrics}
+    return ToleranceResult(samples, draws, limits, distribution)
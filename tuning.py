@@ -0,0 +1,165 @@
+# Predicts the response of the patches over frequency and tunes patch_length and inset_distance,
+# or patch_length and patch_impedance for circularly polarised patches
+# uses the transmission line model of a rectangular patch: two radiating edges, each an admittance,
+# joined by a length of wide microstrip line, fed at the edge or at an inset
+# formula source: Balanis, C A 1982, "Antenna Theory: Analysis and Design"
+# every function takes numpy arrays and broadcasts them, with frequency usually along the last axis
+
+import numpy as np
+
+import em_arrays as ea
+import em_calcs as em
+from em_calcs import c
+
+# admittance of one radiating edge of a patch of given width
+def edge_admittance(width, frequency, dielectric_thickness):
+    k0 = 2*np.pi*frequency/c
+    y = np.asarray(width)/(120*c/frequency)
+    conductance = y*(1 - (k0*dielectric_thickness)**2/24)
+    susceptance = y*(1 - 0.636*np.log(k0*dielectric_thickness))
+    return conductance + 1j*susceptance
+
+# admittance at the input of a line of given length terminated by load
+def line_admittance(load, line_admittance, beta, length):
+    t = np.tan(beta*length)
+    return line_admittance*(load + 1j*line_admittance*t)/(line_admittance + 1j*load*t)
+
+# input impedance of a patch fed at inset from one radiating edge, 0 for an edge fed patch
+# width, length and inset in mm, frequency in Hz, all broadcast against each other
+def patch_impedance(width, length, inset, frequency, dielectric_constant, dielectric_thickness):
+    width = np.asarray(width, dtype=float)
+    frequency = np.asarray(frequency, dtype=float)
+    keff = ea.effective_dielectric_constant(width, dielectric_constant, dielectric_thickness)
+    line = 1/ea.microstrip_impedance(width, dielectric_constant, dielectric_thickness)
+    beta = 2*np.pi*frequency*np.sqrt(keff)/c
+
+    edge = edge_admittance(width, frequency, dielectric_thickness)
+    admittance = line_admittance(edge, line, beta, inset) + line_admittance(edge, line, beta, np.asarray(length) - inset)
+    return 1/admittance
+
+# finds where values, sampled at increasing candidates along the last axis, cross zero
+# when there are several crossings the one with the largest weight is used, nan if there are none
+def crossing(candidates, values, weight=None):
+    candidates = np.broadcast_to(candidates, values.shape)
+    sign_change = np.signbit(values[..., :-1]) != np.signbit(values[..., 1:])
+    if weight is None:
+        weight = np.ones(values.shape)
+    score = np.where(sign_change, np.broadcast_to(weight, values.shape)[..., :-1], -np.inf)
+    i = np.argmax(score, axis=-1)[..., None]
+
+    x0 = np.take_along_axis(candidates, i, -1)[..., 0]
+    x1 = np.take_along_axis(candidates, i + 1, -1)[..., 0]
+    v0 = np.take_along_axis(values, i, -1)[..., 0]
+    v1 = np.take_along_axis(values, i + 1, -1)[..., 0]
+    found = np.take_along_axis(sign_change, i, -1)[..., 0]
+    return np.where(found, x0 - v0*(x1 - x0)/(v1 - v0), np.nan)
+
+############################## patches described by a spec ##############################
+
+# width, length and inset of the patch Aperture generates for a spec, inset is 0 for circular polarisation
+def patch_geometry(spec):
+    if spec["polarisation"] == "axial":
+        width, length = em.microstrip_patch(spec)
+        inset = em.inset_distance(spec, 50)
+    else:
+        width, length = em.square_patch(spec)
+        inset = 0
+    return width, length, inset
+
+# input impedance of the spec's patch at each frequency
+def frequency_sweep(spec, frequencies):
+    width, length, inset = patch_geometry(spec)
+    return patch_impedance(width, length, inset, frequencies, spec["dielectric_constant"], spec["dielectric_thickness"])
+
+# resonant frequency of each patch, where the input admittance is real and the impedance largest
+# frequencies is the grid searched, by default 30% either side of the spec frequency
+# patches are evaluated a chunk at a time to keep the (patches, frequencies) arrays small
+def resonant_frequency(width, length, inset, spec, frequencies=None, chunk=256):
+    if frequencies is None:
+        frequencies = spec["frequency"]*np.linspace(0.7, 1.3, 1201)
+    shape = np.broadcast_shapes(np.shape(width), np.shape(length), np.shape(inset))
+    width, length, inset = [np.ravel(a) for a in np.broadcast_arrays(width, length, inset)]
+    result = np.empty(len(width))
+
+    for i in range(0, len(width), chunk):
+        part = slice(i, i + chunk)
+        z = patch_impedance(width[part, None], length[part, None], inset[part, None], frequencies, spec["dielectric_constant"], spec["dielectric_thickness"])
+        result[part] = crossing(frequencies, (1/z).imag, z.real)
+
+    return result.reshape(shape)
+
+############################## tuning ##############################
+
+# the result of tuning a patch for a spec
+class TunedPatch:
+    def __init__(self, width, length, inset, resonant_frequency, impedance, evaluations):
+        self.width = width
+        self.length = length
+        self.inset = inset
+        self.resonant_frequency = resonant_frequency
+        self.impedance = impedance
+        self.evaluations = evaluations
+
+    # the spec overrides that build the tuned patch
+    # circular patches are fed at the edge, so their match line is sized from the tuned edge impedance
+    def overrides(self, spec):
+        if spec["polarisation"] == "axial":
+            return {"patch_length": self.length, "inset_distance": self.inset}
+        return {"patch_length": self.length, "patch_impedance": float(self.impedance.real)}
+
+    # the tuned values as plain JSON values, the impedance as [real, imaginary]
+    def summary(self):
+        return {
+            "patch_length": self.length,
+            "inset_distance": self.inset,
+            "resonant_frequency": self.resonant_frequency,
+            "impedance": [self.impedance.real, self.impedance.imag],
+        }
+
+# searches for the patch length and, for linear patches, the inset that resonate at the spec frequency
+# with a real 50 ohm input impedance
+# each step evaluates all the candidates at once, narrowing the range around the best one each round
+def tune_patch(spec, zin=50, candidates=2001, rounds=3, iterations=4):
+    k = spec["dielectric_constant"]
+    h = spec["dielectric_thickness"]
+    f = spec["frequency"]
+    axial = spec["polarisation"] == "axial"
+
+    # start from the spec's own patch, without its overrides
+    nominal = dict(spec)
+    nominal.pop("patch_length", None)
+    nominal.pop("inset_distance", None)
+    nominal.pop("patch_impedance", None)
+    width, length, inset = patch_geometry(nominal)
+    if not axial:
+        inset = 0.0
+
+    evaluations = 0
+    for i in range(iterations):
+        # length that resonates at f with the current inset, square patches keep width equal to length
+        span = 0.15*length
+        for j in range(rounds):
+            lengths = np.linspace(length - span, length + span, candidates)
+            z = patch_impedance(width if axial else lengths, lengths, inset, f, k, h)
+            evaluations += candidates
+            found = crossing(lengths, (1/z).imag, z.real)
+            if np.isnan(found):
+                raise ValueError("No resonant patch length found near " + str(round(length, 2)) + " mm")
+            length = float(found)
+            span = 4*span/candidates
+        if not axial:
+            width = length
+            break
+
+        # inset that brings the resistance at resonance down to zin, from the edge to the centre
+        insets = np.linspace(0, length/2, candidates)
+        z = patch_impedance(width, length, insets, f, k, h)
+        evaluations += candidates
+        found = crossing(insets, z.real - zin, -insets)
+        if np.isnan(found):
+            raise ValueError("No inset gives " + str(zin) + " ohm, the patch edge impedance is " + str(round(float(z[0].real), 1)) + " ohm")
+        inset = float(found)
+
+    impedance = complex(patch_impedance(width, length, inset, f, k, h))
+    resonance = float(resonant_frequency(width, length, inset, spec))
+    return TunedPatch(width, length, inset, resonance, impedance, evaluations)
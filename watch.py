@@ -0,0 +1,153 @@
+# Regenerates the outputs of specification files whenever they, or the KiCAD template, change
+# used by aperture.py --watch; files are polled, so nothing beyond python is needed
+# only what a change affects is redone: changing the patch overrides rebuilds the patch and its feed and joins it
+# to the feed network already built, and changing the template only rewrites the KiCAD file
+# outputs are written to a temporary file and renamed over the old ones, so nothing reading them sees half a file
+
+import os
+import tempfile
+import time
+
+import aperture
+import cache
+from plot import ArrayBuilder, template_parts, template_path
+
+# seconds between checks of the files
+interval = 0.02
+
+# modification time and size of a file, None if it cannot be read
+def signature(path):
+    try:
+        status = os.stat(path)
+    except OSError:
+        return None
+    return status.st_mtime_ns, status.st_size
+
+# writes a file by calling write with a temporary path next to it, then renames it over path
+def write_atomically(path, write):
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temporary = tempfile.mkstemp(dir=directory, prefix="." + os.path.basename(path) + ".", suffix=".tmp")
+    os.close(handle)
+    try:
+        write(temporary)
+        # mkstemp makes the file readable only by its owner
+        os.chmod(temporary, os.stat(path).st_mode & 0o777 if os.path.exists(path) else 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+# a watched specification file and the design last made from it
+# options are the command line options that change the outputs, as hashed by the output cache
+class WatchedSpecification:
+    def __init__(self, filename, options):
+        self.filename = filename
+        self.options = options
+        self.outputs = {"kicad_pcb": filename.replace("json", "kicad_pcb"), "dxf": filename.replace("json", "dxf")}
+        self.stamp = cache.stamp_path(filename)
+        self.signature = None # of the file last designed
+        self.failed = None # of the file as it last failed to design, which is not retried until it changes
+        self.spec = None # the spec last designed, after tuning
+        self.builder = None
+        self.design = None
+
+    # rebuilds the parts of the design affected by the fields that changed since it was last designed
+    # returns "array", "element" or None if nothing changed
+    def rebuild(self, spec, tuned):
+        if self.design is not None:
+            changed = [key for key in set(spec) | set(self.spec) if spec.get(key) != self.spec.get(key)]
+            if not changed:
+                return None
+        if self.design is not None and all(key in ArrayBuilder.element_fields for key in changed):
+            tree = self.builder.rebuild_element(spec)
+            rebuilt = "element"
+        else:
+            builder = ArrayBuilder(spec)
+            tree = builder.build()
+            self.builder = builder
+            rebuilt = "array"
+        self.design = aperture.Design(spec, aperture.calculate_parameters(spec), tree, tree.plot([0, 0]), tuned)
+        self.spec = spec
+        return rebuilt
+
+    # designs the file as it is now and rewrites whichever outputs are out of date
+    # returns the names of the outputs written and what was rebuilt
+    def update(self, template_changed=False):
+        specification = aperture.read_specification_file(self.filename)
+        if aperture.sweep_fields(specification):
+            raise aperture.SpecificationError("Sweeps cannot be watched, design them with aperture.py")
+        spec, tuned = specification, None
+        if self.options["tune"]:
+            import tuning
+            tuned = tuning.tune_patch(spec)
+            spec = dict(spec)
+            spec.update(tuned.overrides(spec))
+
+        rebuilt = self.rebuild(spec, tuned)
+        digest = cache.output_hash(specification, aperture.__version__, self.options)
+        if cache.up_to_date(self.stamp, digest, self.outputs):
+            return [], rebuilt
+
+        # the DXF does not use the template, so it only needs writing if the design changed or the file is missing
+        written = ["kicad_pcb", "dxf"]
+        if rebuilt is None and template_changed and os.path.exists(self.outputs["dxf"]):
+            written = ["kicad_pcb"]
+        design = self.design
+        if "kicad_pcb" in written:
+            write_atomically(self.outputs["kicad_pcb"], lambda path: design.write_kicad(path, self.options["instanced"]))
+        if "dxf" in written:
+            write_atomically(self.outputs["dxf"], lambda path: design.write_dxf(path, self.options["instanced"], self.options["dxf_entity"], self.options["binary_dxf"]))
+        cache.write_stamp(self.stamp, digest, self.outputs)
+        return written, rebuilt
+
+    # updates the outputs if the file or template changed since the last check, and reports what was done
+    def check(self, template_changed=False):
+        current = signature(self.filename)
+        if current in [self.signature, self.failed] and not template_changed:
+            return
+
+        # a file saved half way through an edit can fail in any of these ways, see aperture.sweep_point
+        # the outputs are left alone and the file is tried again once it changes
+        start = time.perf_counter()
+        try:
+            written, rebuilt = self.update(template_changed)
+        except (ValueError, ArithmeticError) as e:
+            self.failed = current
+            print(self.filename + ": " + str(e), flush=True)
+            return
+        except (TypeError, KeyError) as e:
+            self.failed = current
+            print(self.filename + ": " + type(e).__name__ + ": " + str(e), flush=True)
+            return
+        self.signature = current
+        self.failed = None
+        if written:
+            what = {"array": "rebuilt the array", "element": "rebuilt the patch and feed", None: "design unchanged"}[rebuilt]
+            paths = ", ".join(self.outputs[name] for name in written)
+            print(self.filename + ": " + what + ", wrote " + paths + " in " + str(round((time.perf_counter() - start)*1000, 1)) + " ms", flush=True)
+
+# watches the specification files until interrupted, regenerating their outputs as they change
+def watch(filenames, tune=False, instanced=False, dxf_entity="line", binary_dxf=False):
+    options = {"tune": tune, "instanced": instanced, "dxf_entity": dxf_entity, "binary_dxf": binary_dxf}
+    if aperture.tables_directory() is not None:
+        options["tables"] = True
+    watched = [WatchedSpecification(filename, options) for filename in filenames]
+    template = signature(template_path)
+    for specification in watched:
+        specification.check()
+    print("Watching " + ", ".join(filenames) + " and the KiCAD template, press Ctrl+C to stop", flush=True)
+
+    try:
+        while True:
+            time.sleep(interval)
+            current = signature(template_path)
+            template_changed = current != template
+            if template_changed:
+                template = current
+                template_parts.cache_clear()
+                cache.source_digest.cache_clear()
+            for specification in watched:
+                specification.check(template_changed)
+    except KeyboardInterrupt:
+        pass